@@ -1,57 +1,895 @@
-from sqlalchemy import create_engine, Column, String, Text, Float, DateTime, JSON
+from sqlalchemy import create_engine, event, inspect, text, func, and_, or_, Column, Index, Integer, String, Text, Float, DateTime, JSON
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import declarative_base, sessionmaker
-from datetime import timezone, datetime as dt
+from datetime import timezone, timedelta, datetime as dt
+import json
 import os
+import time
 from dotenv import load_dotenv
+from app import shared_cache
+from app.metrics import CACHE_REQUESTS, DB_QUERY_SECONDS
 
 load_dotenv()
 
 Base = declarative_base()
 DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
+# Sized for the API's worker threads plus the batch screener, see DB_POOL_SIZE / DB_MAX_OVERFLOW
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# Values per IN (...) and at most rows per multi-row INSERT. A statement binds one parameter per value
+# (per column of each row for an INSERT), and SQLite builds before 3.32 allow only 999 of them.
+DB_BATCH_SIZE = 500
+MAX_BIND_PARAMS = 999
+
+def _engine_options(url):
+    if url and url.startswith("sqlite") and (":memory:" in url or url.rstrip("/") in ("sqlite:", "sqlite+pysqlite:")):
+        # In-memory SQLite uses a single shared connection, pool sizing doesn't apply
+        return {}
+    return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_pre_ping": True}
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
 Session = sessionmaker(bind=engine)
 
+@event.listens_for(engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    context.query_start = time.perf_counter()
+
+@event.listens_for(engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    # Labelled by statement type only (SELECT, INSERT, ...) to keep the series count fixed
+    elapsed = time.perf_counter() - context.query_start
+    DB_QUERY_SECONDS.observe(elapsed, statement=statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "")
+
+# How long each class of cached data stays valid before screen_halal_stocks refetches it
+FUNDAMENTALS_TTL = timedelta(days=int(os.getenv("FUNDAMENTALS_TTL_DAYS", "90")))
+MARKET_CAP_TTL = timedelta(hours=int(os.getenv("MARKET_CAP_TTL_HOURS", "24")))
+NEWS_TTL = timedelta(minutes=int(os.getenv("NEWS_TTL_MINUTES", "60")))
+
+FRESHNESS = {
+    "fundamentals": ("fundamentals_updated", FUNDAMENTALS_TTL),
+    "market_cap": ("market_cap_updated", MARKET_CAP_TTL),
+    "news": ("news_updated", NEWS_TTL),
+}
+
 class HalalStock(Base):
     __tablename__ = "halal_stocks"
     
     ticker = Column(String, primary_key=True)
     company_name = Column(String)
-    sector = Column(String)
-    industry = Column(String)
+    sector = Column(String, index=True)
+    industry = Column(String, index=True)
     market_cap = Column(Float)
-    status = Column(String)
+    status = Column(String, index=True)
     reason = Column(Text)
     financial_ratios = Column(JSON)
     news_flag = Column(String)
     news_snippet = Column(Text)
-    last_updated = Column(DateTime, default=dt.now(timezone.utc))
+    last_updated = Column(DateTime, default=lambda: dt.now(timezone.utc))
+    # When each class of data was last fetched from upstream, see FRESHNESS
+    fundamentals_updated = Column(DateTime)
+    market_cap_updated = Column(DateTime)
+    news_updated = Column(DateTime)
+    # Ratios and grade derived from financial_ratios and market_cap by save_many (see
+    # vectorized_screening.statement_ratios), stored as columns so query_stocks can filter and sort on an index
+    debt_ratio = Column(Float)
+    cash_ratio = Column(Float)
+    receivables_ratio = Column(Float)
+    interest_income_ratio = Column(Float)
+    grade = Column(String, index=True)
+
+    # (column, ticker) so keyset pages in query_stocks walk the index in order
+    __table_args__ = tuple(
+        Index(f"ix_halal_stocks_{column}_ticker", column, "ticker")
+        for column in ("market_cap", "debt_ratio", "cash_ratio", "receivables_ratio", "interest_income_ratio")
+    )
+
+class NlpVerdict(Base):
+    # Memoized classifier output for one business summary under one model checkpoint
+    __tablename__ = "nlp_verdicts"
+
+    summary_hash = Column(String(64), primary_key=True)
+    model_version = Column(String(64), primary_key=True)
+    label = Column(String)
+    logits = Column(JSON)
+    created_at = Column(DateTime, default=lambda: dt.now(timezone.utc))
+
+class NewsArticle(Base):
+    # One stored news article, shared by every company it was fetched for
+    __tablename__ = "news_articles"
+
+    fingerprint = Column(String(64), primary_key=True)
+    content_hash = Column(String(64), index=True)
+    url = Column(Text)
+    title = Column(Text)
+    description = Column(Text)
+    content = Column(Text)
+    source = Column(String)
+    published_at = Column(DateTime, index=True)
+    fetched_at = Column(DateTime, default=lambda: dt.now(timezone.utc))
+    # Ethical-risk category from the term matcher, and the matcher version that produced it
+    risk = Column(String)
+    risk_version = Column(String(64))
+
+class CompanyNews(Base):
+    __tablename__ = "company_news"
+
+    ticker = Column(String, primary_key=True)
+    fingerprint = Column(String(64), primary_key=True)
+
+class ScreenJob(Base):
+    # A background screen of a whole universe, see app/jobs.py
+    __tablename__ = "screen_jobs"
+
+    id = Column(String(32), primary_key=True)
+    screener = Column(String)
+    universe = Column(String)
+    status = Column(String)
+    total = Column(Integer, default=0)
+    completed = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    created_at = Column(DateTime, default=lambda: dt.now(timezone.utc))
+    updated_at = Column(DateTime, default=lambda: dt.now(timezone.utc))
+    finished_at = Column(DateTime)
+    # Process driving the job and when it last said so, see claim_job
+    owner = Column(String)
+    heartbeat = Column(DateTime)
+
+class ScreenJobTicker(Base):
+    # Checkpoint of one ticker in a job: pending until screened, then done or error
+    __tablename__ = "screen_job_tickers"
+    __table_args__ = (Index("ix_screen_job_tickers_job_state", "job_id", "state"),)
+
+    job_id = Column(String(32), primary_key=True)
+    ticker = Column(String, primary_key=True)
+    position = Column(Integer)
+    state = Column(String, default="pending")
+    attempts = Column(Integer, default=0)
+    result = Column(JSON)
+    error = Column(Text)
+    updated_at = Column(DateTime)
+
+# Stored ratio columns, and the ones query_stocks can sort on
+RATIO_COLUMNS = ("debt_ratio", "cash_ratio", "receivables_ratio", "interest_income_ratio")
+SORT_COLUMNS = ("ticker", "market_cap", "company_name") + RATIO_COLUMNS
 
 def init_db():
     Base.metadata.create_all(engine)
+    _add_missing_columns()
+    _add_missing_indexes()
+    _backfill_ratio_columns()
 
-def save_to_db(ticker, company_name, status, reason, sector, industry, market_cap, financial_ratios, news_flag, news_snippet):
-    session = Session()
-    if session.get(HalalStock, ticker) is None:
-        stock = HalalStock(
-            ticker=ticker,
-            company_name=company_name,
-            status=status,
-            reason=reason,
-            sector=sector,
-            industry=industry,
-            market_cap=market_cap,
-            financial_ratios=financial_ratios,
-            news_flag=news_flag,
-            news_snippet=news_snippet,
-            last_updated=dt.now(timezone.utc)
-        )
-        session.add(stock)
+def _add_missing_columns():
+    # create_all doesn't touch existing tables, so add columns introduced after a DB was created
+    for table in (HalalStock.__table__, ScreenJob.__table__):
+        existing = {col["name"] for col in inspect(engine).get_columns(table.name)}
+        with engine.begin() as conn:
+            for column in table.columns:
+                if column.name not in existing:
+                    col_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+
+def _add_missing_indexes():
+    # Likewise for indexes added to an existing table
+    for index in HalalStock.__table__.indexes:
+        index.create(engine, checkfirst=True)
+
+def ratio_columns(financial_ratios, market_caps):
+    # [{debt_ratio, cash_ratio, receivables_ratio, interest_income_ratio, grade}] per stock, None where missing
+    from app.vectorized_screening import statement_ratios
+
+    ratios = statement_ratios(financial_ratios, market_caps)
+    return [
+        {key: (None if isinstance(value, float) and value != value else value) for key, value in row.items()}
+        for row in ratios.astype(object).to_dict("records")
+    ]
+
+def _backfill_ratio_columns():
+    # Rows written before the ratio columns existed
+    session = Session()
+    try:
+        while True:
+            stocks = (
+                session.query(HalalStock.ticker, HalalStock.financial_ratios, HalalStock.market_cap)
+                .filter(HalalStock.grade.is_(None), HalalStock.financial_ratios.isnot(None))
+                .limit(DB_BATCH_SIZE).all()
+            )
+            if not stocks:
+                break
+            columns = ratio_columns([s.financial_ratios for s in stocks], [s.market_cap for s in stocks])
+            session.bulk_update_mappings(HalalStock, [
+                dict(values, ticker=stock.ticker) for stock, values in zip(stocks, columns)
+            ])
+            session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def _as_utc(value):
+    # SQLite hands datetimes back without tzinfo
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def stale_fields(stock, now=None):
+    # Names of the FRESHNESS classes that need refetching for a cached row (all of them if there is no row)
+    if stock is None:
+        return set(FRESHNESS)
+
+    now = now or dt.now(timezone.utc)
+    stale = set()
+    for field, (column, ttl) in FRESHNESS.items():
+        updated = getattr(stock, column)
+        if updated is None:
+            # News is only fetched for stocks that pass the sector and financial screens
+            if field != "news":
+                stale.add(field)
+        elif now - _as_utc(updated) > ttl:
+            stale.add(field)
+    return stale
+
+def _rows_per_insert(keys):
+    # Multi-row INSERT size for rows of `keys` within MAX_BIND_PARAMS
+    return max(1, min(DB_BATCH_SIZE, MAX_BIND_PARAMS // max(1, len(keys))))
+
+def _upsert(session, rows):
+    # INSERT ... ON CONFLICT (ticker) DO UPDATE where the dialect supports it, merge() otherwise.
+    # Only the keys present in each row are written on update.
+    if not rows:
+        return
+    dialect = session.bind.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+
+        # Rows with the same set of keys can share one statement
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        for keys, group in groups.items():
+            size = _rows_per_insert(keys)
+            for i in range(0, len(group), size):
+                stmt = insert(HalalStock).values(group[i:i + size])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[HalalStock.ticker],
+                    set_={key: stmt.excluded[key] for key in keys if key != "ticker"},
+                )
+                session.execute(stmt)
+    else:
+        for row in rows:
+            session.merge(HalalStock(**row))
+
+def _insert_ignore(session, model, rows):
+    # INSERT ... ON CONFLICT DO NOTHING where the dialect supports it, a savepoint per row otherwise, so
+    # rows another session inserted first are skipped instead of failing the transaction. Returns how
+    # many rows were inserted.
+    if not rows:
+        return 0
+    dialect = session.bind.dialect.name
+    inserted = 0
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        for keys, group in groups.items():
+            size = _rows_per_insert(keys)
+            for i in range(0, len(group), size):
+                stmt = insert(model).values(group[i:i + size]).on_conflict_do_nothing()
+                inserted += session.execute(stmt).rowcount
+    else:
+        for row in rows:
+            try:
+                with session.begin_nested():
+                    session.add(model(**row))
+                inserted += 1
+            except IntegrityError:
+                pass
+    return inserted
+
+def stock_row(ticker, company_name, status, reason, sector, industry, market_cap, financial_ratios, news_flag, news_snippet,
+              refreshed=tuple(FRESHNESS), stale=()):
+    # `refreshed` data classes get a new timestamp, `stale` ones are cleared, the rest keep what the DB has
+    now = dt.now(timezone.utc)
+    row = dict(
+        ticker=ticker,
+        company_name=company_name,
+        status=status,
+        reason=reason,
+        sector=sector,
+        industry=industry,
+        market_cap=market_cap,
+        financial_ratios=financial_ratios,
+        news_flag=news_flag,
+        news_snippet=news_snippet,
+        last_updated=now,
+    )
+    for field in refreshed:
+        row[FRESHNESS[field][0]] = now
+    for field in stale:
+        row[FRESHNESS[field][0]] = None
+    return row
+
+def save_to_db(ticker, company_name, status, reason, sector, industry, market_cap, financial_ratios, news_flag, news_snippet,
+               refreshed=tuple(FRESHNESS), stale=()):
+    save_many([stock_row(
+        ticker, company_name, status, reason, sector, industry, market_cap, financial_ratios, news_flag, news_snippet,
+        refreshed=refreshed, stale=stale,
+    )])
+
+def save_many(rows):
+    # Upsert a list of stock_row() dicts in a single transaction. If that fails the rows are saved one
+    # at a time, so one bad row only loses itself; raises only if none could be saved.
+    if not rows:
+        return
+    # Derived ratio columns for every row that carries statements, computed for the whole list at once
+    rows = [dict(row) for row in rows]
+    with_financials = [row for row in rows if "financial_ratios" in row]
+    if with_financials:
+        columns = ratio_columns([row["financial_ratios"] for row in with_financials],
+                                [row.get("market_cap") for row in with_financials])
+        for row, values in zip(with_financials, columns):
+            row.update(values)
+    session = Session()
+    try:
+        _upsert(session, rows)
         session.commit()
-    session.close()
+    except Exception as e:
+        session.rollback()
+        if len(rows) == 1:
+            raise
+        print(f"[ERROR] Saving {len(rows)} stocks failed, saving them one at a time: {e}")
+        _save_each(session, rows)
+    finally:
+        session.close()
+    # Rows are partial updates, so drop them from the shared tier and let the next read refill it
+    cache = shared_cache.get_cache()
+    if cache is not None:
+        cache.delete(row["ticker"] for row in rows)
+
+def _save_each(session, rows):
+    saved, error = 0, None
+    for row in rows:
+        try:
+            _upsert(session, [row])
+            session.commit()
+            saved += 1
+        except Exception as e:
+            session.rollback()
+            error = e
+            print(f"[ERROR] Could not save {row.get('ticker')}: {e}")
+    if not saved:
+        raise error
+
+# --- shared cache tier (app/shared_cache.py) in front of halal_stocks ---
+
+_DATETIME_COLUMNS = {column.name for column in HalalStock.__table__.columns if isinstance(column.type, DateTime)}
+
+def _encode_stock(stock):
+    values = {}
+    for column in HalalStock.__table__.columns:
+        value = getattr(stock, column.name)
+        values[column.name] = value.isoformat() if column.name in _DATETIME_COLUMNS and value is not None else value
+    return json.dumps(values).encode()
+
+def _decode_stock(data):
+    values = json.loads(data)
+    for name in _DATETIME_COLUMNS:
+        if values.get(name) is not None:
+            values[name] = dt.fromisoformat(values[name])
+    # Transient instance, reads the same as a detached row from a session
+    return HalalStock(**values)
+
+def _shared_get(cache, tickers):
+    stocks = {}
+    for ticker in tickers:
+        data = cache.get(ticker)
+        if data is not None:
+            stocks[ticker] = _decode_stock(data)
+    CACHE_REQUESTS.inc(len(stocks), cache="shared", result="hit")
+    CACHE_REQUESTS.inc(len(tickers) - len(stocks), cache="shared", result="miss")
+    return stocks
+
+def _shared_put(cache, stocks, loaded_at):
+    for stock in stocks:
+        cache.put(stock.ticker, _encode_stock(stock), loaded_at)
 
 def get_cached_stock(ticker):
+    cache = shared_cache.get_cache()
+    if cache is not None:
+        stock = _shared_get(cache, [ticker]).get(ticker)
+        if stock is not None:
+            return stock
+    loaded_at = time.time()
     session = Session()
     stock = session.get(HalalStock, ticker)
     session.close()
+    if cache is not None and stock is not None:
+        _shared_put(cache, [stock], loaded_at)
     return stock
 
+def get_cached_stocks(tickers):
+    # {ticker: HalalStock} for every ticker that has a row, one IN query per DB_BATCH_SIZE tickers
+    tickers = list(dict.fromkeys(tickers))
+    cache = shared_cache.get_cache()
+    stocks = _shared_get(cache, tickers) if cache is not None else {}
+    missing = [ticker for ticker in tickers if ticker not in stocks]
+    loaded_at = time.time()
+    session = Session()
+    try:
+        loaded = []
+        for i in range(0, len(missing), DB_BATCH_SIZE):
+            chunk = missing[i:i + DB_BATCH_SIZE]
+            for stock in session.query(HalalStock).filter(HalalStock.ticker.in_(chunk)):
+                stocks[stock.ticker] = stock
+                loaded.append(stock)
+    finally:
+        session.close()
+    if cache is not None:
+        _shared_put(cache, loaded, loaded_at)
+    return stocks
+
+
+# Query names of the screen statuses stored in halal_stocks.status
+STATUS_VALUES = {"halal": "Halal ✅", "haram": "Haram ❌", "doubtful": "Doubtful ⚠️", "error": "Error ⚠️"}
+
+def _stock_dict(stock):
+    return {
+        "ticker": stock.ticker,
+        "companyName": stock.company_name,
+        "status": stock.status,
+        "reason": stock.reason,
+        "sector": stock.sector,
+        "industry": stock.industry,
+        "marketCap": stock.market_cap,
+        "grade": stock.grade,
+        "ratios": {column: getattr(stock, column) for column in RATIO_COLUMNS},
+        "lastUpdated": stock.last_updated,
+    }
+
+def query_stocks(statuses=(), sectors=(), industries=(), grades=(), ticker_prefix=None,
+                 min_market_cap=None, max_market_cap=None, max_ratios=None,
+                 sort="ticker", descending=False, limit=50, after=None):
+    """
+    One page of cached stocks matching the filters, ordered by `sort` then ticker. `after` is the
+    (sort value, ticker) key of the last row of the previous page (keyset pagination), rows with no
+    value in the sort column come last. Returns (stock dicts, key for the next page or None).
+    """
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort on {sort}")
+    column = getattr(HalalStock, sort)
+    ticker = HalalStock.ticker
+
+    filters = []
+    if statuses:
+        filters.append(HalalStock.status.in_([STATUS_VALUES.get(s.lower(), s) for s in statuses]))
+    if sectors:
+        filters.append(HalalStock.sector.in_(sectors))
+    if industries:
+        filters.append(HalalStock.industry.in_(industries))
+    if grades:
+        filters.append(HalalStock.grade.in_(grades))
+    if ticker_prefix:
+        # Range instead of LIKE so the primary key index is used
+        prefix = ticker_prefix.upper()
+        filters += [ticker >= prefix, ticker < prefix + "\uffff"]
+    if min_market_cap is not None:
+        filters.append(HalalStock.market_cap >= min_market_cap)
+    if max_market_cap is not None:
+        filters.append(HalalStock.market_cap <= max_market_cap)
+    for ratio, limit_value in (max_ratios or {}).items():
+        if ratio not in RATIO_COLUMNS:
+            raise ValueError(f"Unknown ratio: {ratio}")
+        if limit_value is not None:
+            filters.append(getattr(HalalStock, ratio) <= limit_value)
+
+    def order(*columns):
+        return [c.desc() if descending else c.asc() for c in columns]
+
+    def beyond(col, value):
+        return col < value if descending else col > value
+
+    session = Session()
+    try:
+        base = session.query(HalalStock).filter(*filters)
+        if sort == "ticker":
+            query = base.filter(beyond(ticker, after[1])) if after else base
+            stocks = query.order_by(*order(ticker)).limit(limit).all()
+        else:
+            stocks = []
+            after_value, after_ticker = after or (None, None)
+            # Rows with a value first, walking the (column, ticker) index...
+            if after is None or after_value is not None:
+                query = base.filter(column.isnot(None))
+                if after:
+                    query = query.filter(or_(beyond(column, after_value), and_(column == after_value, beyond(ticker, after_ticker))))
+                stocks = query.order_by(*order(column, ticker)).limit(limit).all()
+            # ...then the ones without, by ticker
+            if len(stocks) < limit:
+                query = base.filter(column.is_(None))
+                if after and after_value is None:
+                    query = query.filter(beyond(ticker, after_ticker))
+                stocks += query.order_by(*order(ticker)).limit(limit - len(stocks)).all()
+
+        last = stocks[-1] if len(stocks) == limit else None
+        next_key = (getattr(last, sort), last.ticker) if last is not None else None
+        return [_stock_dict(stock) for stock in stocks], next_key
+    finally:
+        session.close()
+
+
+def stored_fundamentals():
+    # (ticker, status, market_cap, financial_ratios) of every cached stock with statements, for re-screening
+    # without going back to the data provider (app/rescreen.py)
+    session = Session()
+    try:
+        return (
+            session.query(HalalStock.ticker, HalalStock.status, HalalStock.market_cap, HalalStock.financial_ratios)
+            .filter(HalalStock.financial_ratios.isnot(None))
+            .order_by(HalalStock.ticker)
+            .all()
+        )
+    finally:
+        session.close()
+
+
+def get_nlp_verdicts(model_version, summary_hashes):
+    # {summary_hash: (label, logits)} for the hashes already classified by this model version
+    hashes = list(dict.fromkeys(summary_hashes))
+    session = Session()
+    try:
+        verdicts = {}
+        for i in range(0, len(hashes), DB_BATCH_SIZE):
+            chunk = hashes[i:i + DB_BATCH_SIZE]
+            rows = session.query(NlpVerdict).filter(
+                NlpVerdict.model_version == model_version,
+                NlpVerdict.summary_hash.in_(chunk),
+            )
+            for row in rows:
+                verdicts[row.summary_hash] = (row.label, row.logits)
+        return verdicts
+    finally:
+        session.close()
+
+def save_nlp_verdicts(model_version, verdicts):
+    # verdicts: {summary_hash: (label, logits)}
+    if not verdicts:
+        return
+    session = Session()
+    try:
+        for summary_hash, (label, logits) in verdicts.items():
+            session.merge(NlpVerdict(summary_hash=summary_hash, model_version=model_version, label=label, logits=logits))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def prune_nlp_verdicts(model_version):
+    # Drop verdicts from older checkpoints, they can never be hit again
+    session = Session()
+    try:
+        deleted = session.query(NlpVerdict).filter(NlpVerdict.model_version != model_version).delete()
+        session.commit()
+        return deleted
+    finally:
+        session.close()
+
+
+def _article_dict(article):
+    return {
+        "fingerprint": article.fingerprint,
+        "url": article.url,
+        "title": article.title,
+        "description": article.description,
+        "content": article.content,
+        "source": article.source,
+        "publishedAt": article.published_at,
+        "risk": article.risk,
+        "risk_version": article.risk_version,
+    }
+
+def latest_news_published(tickers):
+    # {ticker: publishedAt of the newest stored article}, tickers without articles are left out
+    tickers = list(dict.fromkeys(tickers))
+    session = Session()
+    try:
+        latest = {}
+        for i in range(0, len(tickers), DB_BATCH_SIZE):
+            chunk = tickers[i:i + DB_BATCH_SIZE]
+            rows = (
+                session.query(CompanyNews.ticker, func.max(NewsArticle.published_at))
+                .join(NewsArticle, NewsArticle.fingerprint == CompanyNews.fingerprint)
+                .filter(CompanyNews.ticker.in_(chunk))
+                .group_by(CompanyNews.ticker)
+            )
+            for ticker, published in rows:
+                if published is not None:
+                    latest[ticker] = _as_utc(published)
+        return latest
+    finally:
+        session.close()
+
+def save_news_articles(ticker, articles):
+    """
+    Stores article dicts (fingerprint, content_hash, url, title, description, content, source,
+    published_at) and links them to `ticker`. Articles already stored under the same fingerprint or
+    content hash are only linked. Returns the number of articles that were new to the store.
+    """
+    if not articles:
+        return 0
+    session = Session()
+    try:
+        fingerprints = list(dict.fromkeys(a["fingerprint"] for a in articles))
+        hashes = list(dict.fromkeys(a["content_hash"] for a in articles))
+        known = set()
+        by_hash = {}
+        for i in range(0, len(fingerprints), DB_BATCH_SIZE):
+            chunk = fingerprints[i:i + DB_BATCH_SIZE]
+            known.update(f for (f,) in session.query(NewsArticle.fingerprint).filter(NewsArticle.fingerprint.in_(chunk)))
+        for i in range(0, len(hashes), DB_BATCH_SIZE):
+            chunk = hashes[i:i + DB_BATCH_SIZE]
+            query = session.query(NewsArticle.content_hash, NewsArticle.fingerprint).filter(NewsArticle.content_hash.in_(chunk))
+            for content_hash, fingerprint in query:
+                by_hash.setdefault(content_hash, fingerprint)
+
+        new = []
+        linked = set()
+        for article in articles:
+            fingerprint = article["fingerprint"]
+            if fingerprint not in known:
+                if article["content_hash"] in by_hash:
+                    # Same story syndicated under another URL
+                    fingerprint = by_hash[article["content_hash"]]
+                else:
+                    new.append(article)
+                    known.add(fingerprint)
+                    by_hash[article["content_hash"]] = fingerprint
+            linked.add(fingerprint)
+
+        # A concurrent ingest (a story about two companies screened together) may store the same
+        # article or link first, theirs is kept
+        added = _insert_ignore(session, NewsArticle, new)
+        _insert_ignore(session, CompanyNews, [{"ticker": ticker, "fingerprint": f} for f in linked])
+        session.commit()
+        return added
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def get_news_articles(tickers, limit=10):
+    # {ticker: [article dict]} with the `limit` most recent stored articles per ticker, newest first
+    tickers = list(dict.fromkeys(tickers))
+    session = Session()
+    try:
+        articles = {ticker: [] for ticker in tickers}
+        for i in range(0, len(tickers), DB_BATCH_SIZE):
+            chunk = tickers[i:i + DB_BATCH_SIZE]
+            rows = (
+                session.query(CompanyNews.ticker, NewsArticle)
+                .join(NewsArticle, NewsArticle.fingerprint == CompanyNews.fingerprint)
+                .filter(CompanyNews.ticker.in_(chunk))
+                .order_by(CompanyNews.ticker, NewsArticle.published_at.desc().nulls_last())
+            )
+            for ticker, article in rows:
+                if len(articles[ticker]) < limit:
+                    articles[ticker].append(_article_dict(article))
+        return articles
+    finally:
+        session.close()
+
+def save_news_risk(risk_version, risks):
+    # risks: {fingerprint: category or None} as scored by the matcher with `risk_version`
+    if not risks:
+        return
+    session = Session()
+    try:
+        session.bulk_update_mappings(NewsArticle, [
+            {"fingerprint": fingerprint, "risk": risk, "risk_version": risk_version}
+            for fingerprint, risk in risks.items()
+        ])
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _job_dict(job):
+    return {
+        "id": job.id,
+        "screener": job.screener,
+        "universe": job.universe,
+        "status": job.status,
+        "total": job.total,
+        "completed": job.completed,
+        "failed": job.failed,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+        "finished_at": job.finished_at,
+    }
+
+def create_job(job_id, screener, universe, tickers, owner=None):
+    session = Session()
+    try:
+        session.add(ScreenJob(id=job_id, screener=screener, universe=universe, status="queued", total=len(tickers),
+                              owner=owner, heartbeat=dt.now(timezone.utc) if owner else None))
+        session.add_all(
+            ScreenJobTicker(job_id=job_id, ticker=ticker, position=position, state="pending")
+            for position, ticker in enumerate(tickers)
+        )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def get_job(job_id):
+    session = Session()
+    try:
+        job = session.get(ScreenJob, job_id)
+        return _job_dict(job) if job else None
+    finally:
+        session.close()
+
+def get_jobs(statuses):
+    # Jobs in any of `statuses`, oldest first
+    session = Session()
+    try:
+        jobs = session.query(ScreenJob).filter(ScreenJob.status.in_(statuses)).order_by(ScreenJob.created_at)
+        return [_job_dict(job) for job in jobs]
+    finally:
+        session.close()
+
+def set_job_status(job_id, status, unless=()):
+    # One conditional UPDATE: a job already in one of the `unless` statuses (say a cancel that landed
+    # meanwhile) keeps it. Returns whether the status was set.
+    session = Session()
+    try:
+        now = dt.now(timezone.utc)
+        values = {"status": status, "updated_at": now}
+        if status in ("done", "cancelled"):
+            values["finished_at"] = now
+        if status in ("done", "cancelled", "failed"):
+            # Nobody drives it now, a retry can be claimed by any process straight away
+            values["owner"] = None
+        query = session.query(ScreenJob).filter(ScreenJob.id == job_id)
+        if unless:
+            query = query.filter(ScreenJob.status.notin_(unless))
+        updated = query.update(values, synchronize_session=False)
+        session.commit()
+        return updated == 1
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def claim_job(job_id, owner, stale_before):
+    """
+    Makes `owner` the process driving a queued or running job, unless another process holds it with a
+    heartbeat newer than `stale_before`. One conditional UPDATE, so of several processes claiming the
+    same job only one gets it. Returns whether `owner` holds the job now.
+    """
+    session = Session()
+    try:
+        claimed = session.query(ScreenJob).filter(
+            ScreenJob.id == job_id,
+            ScreenJob.status.in_(("queued", "running")),
+            or_(ScreenJob.owner.is_(None), ScreenJob.owner == owner,
+                ScreenJob.heartbeat.is_(None), ScreenJob.heartbeat < stale_before),
+        ).update({"owner": owner, "heartbeat": dt.now(timezone.utc)}, synchronize_session=False)
+        session.commit()
+        return claimed == 1
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def heartbeat_jobs(owner, job_ids):
+    # Tells other processes that `owner` is still driving these jobs
+    if not job_ids:
+        return
+    session = Session()
+    try:
+        session.query(ScreenJob).filter(ScreenJob.id.in_(list(job_ids)), ScreenJob.owner == owner).update(
+            {"heartbeat": dt.now(timezone.utc)}, synchronize_session=False)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def orphaned_jobs(stale_before):
+    # Ids of queued or running jobs nobody has driven since `stale_before`, oldest first
+    session = Session()
+    try:
+        query = session.query(ScreenJob.id).filter(
+            ScreenJob.status.in_(("queued", "running")),
+            or_(ScreenJob.heartbeat.is_(None), ScreenJob.heartbeat < stale_before),
+        ).order_by(ScreenJob.created_at)
+        return [row.id for row in query]
+    finally:
+        session.close()
+
+def get_job_tickers(job_id, states, max_attempts=None, offset=0, limit=None):
+    # [{ticker, state, attempts, result, error}] of a job in input order
+    session = Session()
+    try:
+        query = session.query(ScreenJobTicker).filter(ScreenJobTicker.job_id == job_id, ScreenJobTicker.state.in_(states))
+        if max_attempts is not None:
+            query = query.filter(ScreenJobTicker.attempts < max_attempts)
+        query = query.order_by(ScreenJobTicker.position).offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        return [
+            {"ticker": row.ticker, "state": row.state, "attempts": row.attempts, "result": row.result, "error": row.error}
+            for row in query
+        ]
+    finally:
+        session.close()
+
+def checkpoint_job(job_id, outcomes):
+    """
+    Records finished tickers of a job in one transaction and refreshes its counters.
+    outcomes: [{ticker, state ("done" or "error"), result, error}], each one counts as an attempt.
+    """
+    if not outcomes:
+        return
+    session = Session()
+    try:
+        now = dt.now(timezone.utc)
+        tickers = [outcome["ticker"] for outcome in outcomes]
+        attempts = dict(session.query(ScreenJobTicker.ticker, ScreenJobTicker.attempts).filter(
+            ScreenJobTicker.job_id == job_id, ScreenJobTicker.ticker.in_(tickers)))
+        session.bulk_update_mappings(ScreenJobTicker, [
+            {
+                "job_id": job_id,
+                "ticker": outcome["ticker"],
+                "state": outcome["state"],
+                "result": outcome.get("result"),
+                "error": outcome.get("error"),
+                "attempts": (attempts.get(outcome["ticker"]) or 0) + 1,
+                "updated_at": now,
+            }
+            for outcome in outcomes
+        ])
+        counts = dict(session.query(ScreenJobTicker.state, func.count()).filter(
+            ScreenJobTicker.job_id == job_id).group_by(ScreenJobTicker.state))
+        job = session.get(ScreenJob, job_id)
+        job.completed = counts.get("done", 0)
+        job.failed = counts.get("error", 0)
+        job.updated_at = now
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def reset_job_errors(job_id):
+    # Give failed tickers a fresh set of attempts, returns how many
+    session = Session()
+    try:
+        count = session.query(ScreenJobTicker).filter(
+            ScreenJobTicker.job_id == job_id, ScreenJobTicker.state == "error",
+        ).update({"attempts": 0}, synchronize_session=False)
+        session.commit()
+        return count
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
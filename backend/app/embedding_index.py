@@ -0,0 +1,181 @@
+# embedding_index.py
+# Sentence embeddings of every classified business summary (nlp_model.embed_batch), kept for two things:
+# GET /similar/{ticker}, and reusing the verdict of a near-duplicate summary (share classes, subsidiaries,
+# listings of the same company) instead of classifying it again.
+#
+# The index is one append-only file of fixed-size (ticker, summary hash, logits, vector) records per
+# model version, read memory-mapped, so a worker process opens it without loading anything and sees
+# other processes' appends on its next lookup. Each append is a single O_APPEND write of whole records,
+# which keeps writers in different processes from interleaving. A ticker whose summary changes gets a
+# new record, the latest one wins.
+import glob
+import os
+import threading
+import numpy as np
+from app import nlp_cascade
+from app.metrics import CACHE_REQUESTS
+
+EMBEDDING_INDEX_DIR = os.getenv("EMBEDDING_INDEX_DIR", os.path.join(os.path.dirname(__file__), "embedding_index"))
+# Set to 0 to stop recording embeddings (and reusing verdicts)
+INDEX_ENABLED = os.getenv("EMBEDDING_INDEX", "1") == "1"
+# Cosine similarity above which a stored summary's verdict is reused, 1.0 turns reuse off
+NEAR_DUPLICATE_SIMILARITY = float(os.getenv("NEAR_DUPLICATE_SIMILARITY", "0.99"))
+
+
+def _record_dtype(dim):
+    return np.dtype([("ticker", "S16"), ("hash", "S64"), ("logits", "<f4", (3,)), ("vector", "<f4", (dim,))])
+
+
+class EmbeddingIndex:
+    def __init__(self, path=EMBEDDING_INDEX_DIR, version=None):
+        self.path = path
+        self.version = version
+        self._lock = threading.Lock()
+        self._file = None
+        self._dtype = None
+        self._size = 0
+        self._rows = None
+        self._latest = np.empty(0, dtype=np.int64)
+        self._positions = {}
+        self._find_file()
+
+    def _find_file(self):
+        # The dimension is part of the file name, so the index can be opened before the model is loaded
+        if self._file is None:
+            files = glob.glob(os.path.join(self.path, f"{self.version}-*d.emb"))
+            if files:
+                self._file = files[0]
+                self._dtype = _record_dtype(int(self._file.rsplit("-", 1)[1][:-len("d.emb")]))
+
+    def _refresh(self):
+        # Re-map when the file has grown (our appends or another process's), a partly written
+        # trailing record is left out until it is complete
+        self._find_file()
+        size = os.path.getsize(self._file) if self._file and os.path.exists(self._file) else 0
+        itemsize = self._dtype.itemsize if self._dtype else 0
+        count = size // itemsize if itemsize else 0
+        if count * itemsize == self._size:
+            return
+        self._rows = np.memmap(self._file, dtype=self._dtype, mode="r", shape=(count,)) if count else None
+        self._size = count * itemsize
+        if count:
+            # Latest record per ticker
+            tickers = self._rows["ticker"][::-1]
+            _, first = np.unique(tickers, return_index=True)
+            self._latest = np.sort(count - 1 - first)
+        else:
+            self._latest = np.empty(0, dtype=np.int64)
+        self._positions = {self._rows["ticker"][i].decode(): int(i) for i in self._latest}
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._latest)
+
+    def summary_hash(self, ticker):
+        with self._lock:
+            self._refresh()
+            i = self._positions.get(ticker)
+            return None if i is None else self._rows[i]["hash"].decode()
+
+    def vector(self, ticker):
+        with self._lock:
+            self._refresh()
+            i = self._positions.get(ticker)
+            return None if i is None else np.array(self._rows[i]["vector"])
+
+    def append(self, tickers, hashes, logits, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        with self._lock:
+            if self._file is None:
+                os.makedirs(self.path, exist_ok=True)
+                self._file = os.path.join(self.path, f"{self.version}-{vectors.shape[1]}d.emb")
+                self._dtype = _record_dtype(vectors.shape[1])
+            records = np.empty(len(vectors), dtype=self._dtype)
+            records["ticker"] = [t.encode() for t in tickers]
+            records["hash"] = [h.encode() for h in hashes]
+            records["logits"] = logits
+            records["vector"] = vectors
+            fd = os.open(self._file, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+            try:
+                os.write(fd, records.tobytes())
+            finally:
+                os.close(fd)
+
+    def search(self, vectors, k=10, exclude=()):
+        # Top-k latest records by cosine similarity (vectors are normalised, so a dot product) for each
+        # query vector: [[(ticker, similarity, logits)]]
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            self._refresh()
+            if self._rows is None or not len(self._latest):
+                return [[] for _ in vectors]
+            rows, latest = self._rows, self._latest
+            scores = (rows["vector"] @ vectors.T)[latest].T
+
+        results = []
+        for row_scores in scores:
+            take = min(len(latest), k + len(exclude))
+            top = np.argpartition(-row_scores, take - 1)[:take]
+            top = top[np.argsort(-row_scores[top])]
+            matches = []
+            for j in top:
+                record = rows[latest[j]]
+                ticker = record["ticker"].decode()
+                if ticker in exclude:
+                    continue
+                matches.append((ticker, float(row_scores[j]), [float(x) for x in record["logits"]]))
+                if len(matches) == k:
+                    break
+            results.append(matches)
+        return results
+
+    def similar(self, ticker, k=10):
+        # Companies whose summaries read most like this ticker's, None if the ticker isn't indexed
+        vector = self.vector(ticker)
+        if vector is None:
+            return None
+        return self.search(vector, k, exclude=(ticker,))[0]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_index(version=None):
+    # Index for the serving model version, a new checkpoint (or cascade setup) starts a new file
+    version = version or nlp_cascade.version()
+    if version not in _indexes:
+        with _indexes_lock:
+            if version not in _indexes:
+                _indexes[version] = EmbeddingIndex(version=version)
+    return _indexes[version]
+
+def unindexed(tickers, hashes):
+    # Positions whose ticker has no record for this summary yet, once per ticker
+    index = get_index()
+    positions = {}
+    for i, (ticker, summary_hash) in enumerate(zip(tickers, hashes)):
+        if ticker and ticker not in positions and index.summary_hash(ticker) != summary_hash:
+            positions[ticker] = i
+    return list(positions.values())
+
+def near_duplicates(vectors, tickers):
+    # Logits of the closest indexed summary of another ticker for each vector, None where nothing is
+    # similar enough. A ticker's own (older) record is skipped, its summary changing is why it's here.
+    results = [None] * len(vectors)
+    if NEAR_DUPLICATE_SIMILARITY >= 1.0:
+        return results
+    # Each ticker has one latest record, so the best other match is within the top two
+    for i, (ticker, matches) in enumerate(zip(tickers, get_index().search(vectors, k=2))):
+        match = next((m for m in matches if m[0] != ticker), None)
+        if match and match[1] >= NEAR_DUPLICATE_SIMILARITY:
+            results[i] = match[2]
+    hits = sum(r is not None for r in results)
+    CACHE_REQUESTS.inc(hits, cache="nlp_near_duplicate", result="hit")
+    CACHE_REQUESTS.inc(len(results) - hits, cache="nlp_near_duplicate", result="miss")
+    return results
+
+def add(tickers, hashes, logits, vectors):
+    get_index().append(tickers, hashes, logits, vectors)
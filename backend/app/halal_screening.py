@@ -1,14 +1,25 @@
 # halal_screening.py
-import requests
+import asyncio
+import contextvars
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from app.db import init_db, save_to_db, get_cached_stock
+from app.db import init_db, save_many, stock_row, get_cached_stock, get_cached_stocks, stale_fields
+from app import news_store
+from app.metrics import CACHE_REQUESTS, SCREEN_RESULTS, timed
+from app.news_matcher import get_matcher
+from app.singleflight import SingleFlight
+from app.providers import get_provider
+from app.rulesets import get_ruleset, statement_quantities
 
 load_dotenv()
 
-FMP_API_KEY = os.getenv("FMP_API_KEY")
-FMP_BASE_URL = "https://financialmodelingprep.com/api/v3"
-NEWS_API_KEY = os.getenv("NEWS_API_KEY")
+# fmp (default), yfinance or fixtures, see app/providers.py
+provider = get_provider(os.getenv("DATA_PROVIDER", "fmp"))
+# Max number of upstream/DB calls the batch screener runs at the same time
+SCREEN_CONCURRENCY = int(os.getenv("SCREEN_CONCURRENCY", "16"))
+# Tickers prefetched (cache rows + bulk profiles) and saved together by the streaming screener
+STREAM_BLOCK_SIZE = int(os.getenv("STREAM_BLOCK_SIZE", "200"))
 
 # --- Define haram sectors to exclude ---
 HARAM_SECTORS = [
@@ -34,68 +45,24 @@ CLEAR_HARAM_TERMS = [
 ]
 
 def fetch_company_profile(ticker):
-    url = f"{FMP_BASE_URL}/profile/{ticker}?apikey={FMP_API_KEY}"
-    resp = requests.get(url)
-    if resp.status_code != 200 or not resp.json():
+    data = provider.get_profile(ticker)
+    if not data:
         raise ValueError(f"Could not fetch profile for {ticker}")
-    data = resp.json()[0]
-    return {
-        "companyName": data.get("companyName"),
-        "sector": data.get("sector"),
-        "industry": data.get("industry"),
-        "marketCap": data.get("mktCap"),
-        "beta": data.get("beta"),
-    }
+    return data
 
 def fetch_financial_statements(ticker):
-    bs_url = f"{FMP_BASE_URL}/balance-sheet-statement/{ticker}?limit=1&apikey={FMP_API_KEY}"
-    inc_url = f"{FMP_BASE_URL}/income-statement/{ticker}?limit=1&apikey={FMP_API_KEY}"
-
-    bs_resp = requests.get(bs_url)
-    inc_resp = requests.get(inc_url)
-
-    if bs_resp.status_code != 200 or inc_resp.status_code != 200:
+    data = provider.get_statement(ticker)
+    if not data:
         raise ValueError(f"Could not fetch financials for {ticker}")
 
-    bs_data = bs_resp.json()
-    inc_data = inc_resp.json()
-    if not bs_data or not inc_data:
-        raise ValueError(f"Financial data missing for {ticker}")
-
-    bs = bs_data[0]
-    inc = inc_data[0]
-
-    print(bs.get("date", 0))
-
-    return {
-        "date": bs.get("date", 0),
-        "totalDebt": bs.get("totalDebt", 0),
-        "cashAndCashEquivalents": bs.get("cashAndCashEquivalents", 0),
-        "shortTermInvestments": bs.get("shortTermInvestments", 0),
-        "interestIncome": inc.get("interestIncome", 0),
-        "totalRevenue": inc.get("revenue", 0),
-    }
+    # Financial screening below expects numbers, missing items count as 0
+    return {key: (value if value is not None else 0) for key, value in data.items()}
 
 
-def apply_aaoifi_screening(financials, market_cap):
-    reasons = []
-    is_haram = False
-
-    debt_ratio = financials["totalDebt"] / market_cap if market_cap else 0
-    if debt_ratio > 0.3:
-        reasons.append(f"Debt/MarketCap ratio too high: {debt_ratio:.2f} > 0.30")
-        is_haram = True
-
-    interest_ratio = financials["interestIncome"] / financials["totalRevenue"] if financials["totalRevenue"] else 0
-    if interest_ratio > 0.05:
-        reasons.append(f"Interest income/Revenue ratio too high: {interest_ratio:.2f} > 0.05")
-        is_haram = True
-
-    cash_ratio = (financials["cashAndCashEquivalents"] + financials["shortTermInvestments"]) / market_cap if market_cap else 0
-    if cash_ratio > 0.3:
-        reasons.append(f"Cash + short-term investments/MarketCap ratio too high: {cash_ratio:.2f} > 0.30")
-        is_haram = True
-
+def apply_aaoifi_screening(financials, market_cap, ruleset=None):
+    # Financial screens of the configured methodology (AAOIFI unless SCREENING_RULESET says otherwise),
+    # a ratio that can't be computed (zero market cap or revenue) doesn't fail
+    is_haram, _, reasons, _ = get_ruleset(ruleset).check(statement_quantities([financials], [market_cap]), with_missing=False)
     return is_haram, reasons
 
 def check_business_sector(sector, industry):
@@ -106,30 +73,42 @@ def check_business_sector(sector, industry):
     return False, ""
 
 def fetch_company_news(company_name):
-    url = (
-        f"https://newsapi.org/v2/everything?q={company_name}&language=en"
-        f"&sortBy=publishedAt&pageSize=10&apiKey={NEWS_API_KEY}"
-    )
     try:
-        response = requests.get(url)
-        if response.status_code != 200:
-            raise Exception(f"News API error: {response.status_code}")
-        data = response.json()
-        return data.get("articles", [])
+        return provider.get_news(company_name)
     except Exception as e:
         print(f"[ERROR] News fetch failed for {company_name}: {e}")
         return []
 
-def evaluate_ethical_risk(news_articles):
-    haram_flags = []
-    doubtful_flags = []
-
-    for article in news_articles:
-        title = article.get("title", "").lower()
-        if any(term in title for term in CLEAR_HARAM_TERMS):
-            haram_flags.append(title)
-        elif any(term in title for term in DOUBTFUL_TERMS):
-            doubtful_flags.append(title)
+def ingest_company_news(ticker, company_name):
+    # Fetch only articles newer than what is stored for `ticker` and add them to the news store
+    try:
+        return news_store.ingest(ticker, company_name, provider)
+    except Exception as e:
+        print(f"[ERROR] News fetch failed for {company_name}: {e}")
+        return 0
+
+def screen_company_news(ticker, company_name):
+    # News verdict for one company: incremental fetch, then scoring from the stored corpus
+    with timed("halal", "news_fetch"):
+        ingest_company_news(ticker, company_name)
+    with timed("halal", "news_score"):
+        return evaluate_stored_news([ticker])[ticker]
+
+def news_matcher(haram_terms=(), doubtful_terms=()):
+    # Built-in term lists plus optional per-client ones, compiled once per distinct set of lists
+    return get_matcher({
+        "haram": CLEAR_HARAM_TERMS + list(haram_terms),
+        "doubtful": DOUBTFUL_TERMS + list(doubtful_terms),
+    })
+
+def ethical_risk_hits(news_articles, matcher=None):
+    # Every term found in the title, description or content of each article, with its category
+    return (matcher or news_matcher()).scan_articles(news_articles)
+
+def _ethical_verdict(articles, risks):
+    # First (most recent) haram article wins, then the first doubtful one
+    haram_flags = [(a.get("title") or "").lower() for a, risk in zip(articles, risks) if risk == "haram"]
+    doubtful_flags = [(a.get("title") or "").lower() for a, risk in zip(articles, risks) if risk == "doubtful"]
 
     if haram_flags:
         return "Haram ❌", f"Flagged due to article(s): {haram_flags[0]}"
@@ -138,125 +117,337 @@ def evaluate_ethical_risk(news_articles):
     else:
         return "Halal ✅", "No concerning news found."
 
-def screen_halal_stocks_batch(tickers):
-    ##Create a list of tickers if a list has been provided
-    results = []
-    for ticker in tickers:
-        result = screen_halal_stocks(ticker)
-        results.append(result)
+def evaluate_ethical_risk(news_articles, matcher=None):
+    matcher = matcher or news_matcher()
+    return _ethical_verdict(news_articles, [matcher.classify(article) for article in news_articles])
 
-    return results
+def evaluate_stored_news(tickers, matcher=None):
+    # {ticker: (status, reason)} from the stored articles, no upstream calls. Only articles not yet
+    # scored by this matcher are scanned.
+    stored = news_store.scored_articles(tickers, matcher or news_matcher())
+    return {ticker: _ethical_verdict(articles, [a["risk"] for a in articles]) for ticker, articles in stored.items()}
 
-def screen_halal_stocks(ticker):
-    try:
-        cached = get_cached_stock(ticker)
-        if cached:
-            return {
-                "ticker": cached.ticker,
-                "status": cached.status,
-                "reason": cached.reason,
-                "companyName": cached.company_name,
-            }
-
-        profile = fetch_company_profile(ticker)
-        financials = fetch_financial_statements(ticker)
-        market_cap = profile.get("marketCap") or 0
-
-        # Business sector check
-        haram_sector, sector_reason = check_business_sector(profile.get("sector", ""), profile.get("industry", ""))
-        if haram_sector:
-            save_to_db(
-                ticker=ticker,
-                company_name=profile.get("companyName"),
-                status="Haram ❌",
-                reason=sector_reason,
-                sector=profile.get("sector"),
-                industry=profile.get("industry"),
-                market_cap=market_cap,
-                financial_ratios=None,
-                news_flag="Haram",
-                news_snippet=sector_reason
-            )
-            return {
-                "ticker": ticker,
-                "status": "Haram ❌",
-                "reason": sector_reason,
-                "companyName": profile.get("companyName"),
-            }
-
-        # AAOIFI financial screening
-        haram_financial, financial_reasons = apply_aaoifi_screening(financials, market_cap)
-        if haram_financial:
-            save_to_db(
-                ticker=ticker,
-                company_name=profile.get("companyName"),
-                status="Haram ❌",
-                reason="; ".join(financial_reasons),
-                sector=profile.get("sector"),
-                industry=profile.get("industry"),
-                market_cap=market_cap,
-                financial_ratios=financials,
-                news_flag="Haram",
-                news_snippet="; ".join(financial_reasons),
-            )
-            return {
-                "ticker": ticker,
-                "status": "Haram ❌",
-                "reason": "; ".join(financial_reasons),
-                "companyName": profile.get("companyName"),
-            }
-
-        # News screening
-        news_results = fetch_company_news(profile.get("companyName"))
-        ethical_status, ethical_reason = evaluate_ethical_risk(news_results)
-
-        save_to_db(
+# Data classes that come from the profile request (sector/industry and the market cap)
+PROFILE_FIELDS = {"fundamentals", "market_cap"}
+
+def _cached_result(cached):
+    return {
+        "ticker": cached.ticker,
+        "status": cached.status,
+        "reason": cached.reason,
+        "companyName": cached.company_name,
+    }
+
+def _cached_profile(cached):
+    return {
+        "companyName": cached.company_name,
+        "sector": cached.sector,
+        "industry": cached.industry,
+        "marketCap": cached.market_cap,
+    }
+
+def _error_result(ticker, error):
+    return {
+        "ticker": ticker,
+        "status": "Error ⚠️",
+        "reason": str(error),
+        "companyName": None,
+    }
+
+def _record_cache(cached, stale):
+    CACHE_REQUESTS.inc(cache="halal_stocks", result="miss" if cached is None else "partial" if stale else "hit")
+
+def _record_result(result):
+    # "Haram ❌" -> haram
+    SCREEN_RESULTS.inc(screener="halal", status=result["status"].split()[0].lower())
+    return result
+
+def _needs_news(cached, stale):
+    # Rows that failed the financial screens never had news fetched, so there is nothing to reuse
+    return "news" in stale or cached is None or cached.news_updated is None
+
+def _screen_fundamentals(ticker, profile, financials, refreshed):
+    # Sector and financial checks, returns (result, DB row) if the stock already fails, otherwise None
+    market_cap = profile.get("marketCap") or 0
+
+    # Business sector check
+    haram_sector, sector_reason = check_business_sector(profile.get("sector", ""), profile.get("industry", ""))
+    if haram_sector:
+        row = stock_row(
             ticker=ticker,
             company_name=profile.get("companyName"),
-            status=ethical_status,
-            reason=ethical_reason,
+            status="Haram ❌",
+            reason=sector_reason,
             sector=profile.get("sector"),
             industry=profile.get("industry"),
             market_cap=market_cap,
             financial_ratios=financials,
-            news_flag=ethical_status,
-            news_snippet=ethical_reason,
+            news_flag="Haram",
+            news_snippet=sector_reason,
+            refreshed=refreshed,
+            stale=("news",),
         )
-
         return {
             "ticker": ticker,
-            "status": ethical_status,
-            "reason": ethical_reason,
+            "status": "Haram ❌",
+            "reason": sector_reason,
             "companyName": profile.get("companyName"),
-        }
+        }, row
 
-    except Exception as e:
+    # Financial screening
+    haram_financial, financial_reasons = apply_aaoifi_screening(financials, market_cap)
+    if haram_financial:
+        row = stock_row(
+            ticker=ticker,
+            company_name=profile.get("companyName"),
+            status="Haram ❌",
+            reason="; ".join(financial_reasons),
+            sector=profile.get("sector"),
+            industry=profile.get("industry"),
+            market_cap=market_cap,
+            financial_ratios=financials,
+            news_flag="Haram",
+            news_snippet="; ".join(financial_reasons),
+            refreshed=refreshed,
+            stale=("news",),
+        )
         return {
             "ticker": ticker,
-            "status": "Error ⚠️",
-            "reason": str(e),
-            "companyName": None,
-        }
+            "status": "Haram ❌",
+            "reason": "; ".join(financial_reasons),
+            "companyName": profile.get("companyName"),
+        }, row
+
+    return None
+
+def _screen_news(ticker, profile, financials, ethical_status, ethical_reason, refreshed):
+    # -> (result, DB row)
+    market_cap = profile.get("marketCap") or 0
+
+    row = stock_row(
+        ticker=ticker,
+        company_name=profile.get("companyName"),
+        status=ethical_status,
+        reason=ethical_reason,
+        sector=profile.get("sector"),
+        industry=profile.get("industry"),
+        market_cap=market_cap,
+        financial_ratios=financials,
+        news_flag=ethical_status,
+        news_snippet=ethical_reason,
+        refreshed=refreshed,
+    )
+
+    return {
+        "ticker": ticker,
+        "status": ethical_status,
+        "reason": ethical_reason,
+        "companyName": profile.get("companyName"),
+    }, row
+
+async def _screen_halal_stocks_async(ticker, run, cached, profiles, rows):
+    # Same pipeline as screen_halal_stocks, but every blocking call goes through `run`
+    # so many tickers overlap. Cache rows and profiles were already fetched in bulk,
+    # and DB rows are collected in `rows` to be written in one transaction per block.
+    try:
+        stale = stale_fields(cached)
+        _record_cache(cached, stale)
+        if not stale:
+            return _record_result(_cached_result(cached))
+
+        refreshed = set()
+        if stale & PROFILE_FIELDS:
+            profile = profiles.get(ticker)
+            if not profile:
+                raise ValueError(f"Could not fetch profile for {ticker}")
+            refreshed.add("market_cap")
+        else:
+            profile = _cached_profile(cached)
+
+        if "fundamentals" in stale:
+            with timed("halal", "financials"):
+                financials = await run(fetch_financial_statements, ticker)
+            refreshed.add("fundamentals")
+        else:
+            financials = cached.financial_ratios
+
+        screened = _screen_fundamentals(ticker, profile, financials, refreshed)
+        if not screened:
+            # News screening
+            if _needs_news(cached, stale):
+                ethical_status, ethical_reason = await run(screen_company_news, ticker, profile.get("companyName"))
+                refreshed.add("news")
+            else:
+                ethical_status, ethical_reason = cached.news_flag, cached.news_snippet
+            screened = _screen_news(ticker, profile, financials, ethical_status, ethical_reason, refreshed)
+
+        result, row = screened
+        rows.append(row)
+        return _record_result(result)
+
+    except Exception as e:
+        return _record_result(_error_result(ticker, e))
+
+async def _prefetch(run, tickers):
+    # Cache rows for `tickers` in one query, plus one bulk profile request for the ones whose
+    # profile data is missing or stale
+    with timed("halal", "cache_lookup"):
+        cached = await run(get_cached_stocks, tickers)
+    misses = [ticker for ticker in tickers if stale_fields(cached.get(ticker)) & PROFILE_FIELDS]
+    try:
+        with timed("halal", "profile"):
+            profiles = await run(provider.get_profiles, misses) if misses else {}
+    except Exception as e:
+        print(f"[ERROR] Bulk profile fetch failed: {e}")
+        profiles = {}
+    return cached, profiles
+
+async def screen_halal_stocks_stream(tickers, concurrency=SCREEN_CONCURRENCY, block_size=STREAM_BLOCK_SIZE):
+    """
+    Async generator of screen results, each yielded as soon as its ticker finishes (completion order,
+    not input order). The universe is prefetched and saved block by block, and only `concurrency`
+    tickers are screened at a time: nothing new starts while the consumer isn't reading, so a slow
+    client holds back the screen instead of results piling up in memory.
+    """
+    loop = asyncio.get_running_loop()
+    # The pool size is the concurrency limit: at most `concurrency` blocking calls are in flight at once
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    pending = set()
+    rows = []
+
+    def run(fn, *args):
+        # Carry the request's context (trace id) into the worker thread
+        return loop.run_in_executor(executor, contextvars.copy_context().run, fn, *args)
+
+    try:
+        # Each ticker is screened once even if it is listed several times
+        unique = list(dict.fromkeys(tickers))
+        for i in range(0, len(unique), block_size):
+            block = unique[i:i + block_size]
+            cached, profiles = await _prefetch(run, block)
+
+            for ticker in block:
+                pending.add(asyncio.ensure_future(_screen_halal_stocks_async(ticker, run, cached.get(ticker), profiles, rows)))
+                if len(pending) < concurrency:
+                    continue
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+
+            block_rows, rows[:] = list(rows), []
+            with timed("halal", "db_save"):
+                try:
+                    await run(save_many, block_rows)
+                except Exception as e:
+                    # The results were already streamed, a failed save doesn't end the screen
+                    print(f"[ERROR] Saving screen results failed: {e}")
+    finally:
+        # Client went away or the screen failed: stop what's queued, keep what already finished
+        for task in pending:
+            task.cancel()
+        try:
+            if rows:
+                # Off the event loop, on the default executor so shutting ours down can't drop it, and
+                # shielded: if the request itself was cancelled the save still finishes in its thread
+                await asyncio.shield(loop.run_in_executor(None, contextvars.copy_context().run, _save_partial, list(rows)))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def _save_partial(rows):
+    try:
+        save_many(rows)
+    except Exception as e:
+        print(f"[ERROR] Saving partial screen results failed: {e}")
+
+async def screen_halal_stocks_batch_async(tickers, concurrency=SCREEN_CONCURRENCY):
+    by_ticker = {}
+    async for result in screen_halal_stocks_stream(tickers, concurrency):
+        by_ticker[result["ticker"]] = result
+    return [by_ticker[ticker] for ticker in tickers]
+
+def screen_halal_stocks_batch(tickers, concurrency=SCREEN_CONCURRENCY):
+    ##Create a list of tickers if a list has been provided
+    return asyncio.run(screen_halal_stocks_batch_async(tickers, concurrency))
+
+_in_flight = SingleFlight("screen_halal_stocks")
+
+def screen_halal_stocks(ticker):
+    # Concurrent screens of the same ticker, however it was typed, share one run (and one DB write)
+    ticker = ticker.strip().upper()
+    return _in_flight.do(ticker, _screen_halal_stocks, ticker)
+
+def _screen_halal_stocks(ticker):
+    try:
+        with timed("halal", "cache_lookup"):
+            cached = get_cached_stock(ticker)
+        stale = stale_fields(cached)
+        _record_cache(cached, stale)
+        if not stale:
+            return _record_result(_cached_result(cached))
+
+        # Only refetch the data classes that have gone stale
+        refreshed = set()
+        if stale & PROFILE_FIELDS:
+            with timed("halal", "profile"):
+                profile = fetch_company_profile(ticker)
+            refreshed.add("market_cap")
+        else:
+            profile = _cached_profile(cached)
+
+        if "fundamentals" in stale:
+            with timed("halal", "financials"):
+                financials = fetch_financial_statements(ticker)
+            refreshed.add("fundamentals")
+        else:
+            financials = cached.financial_ratios
+
+        screened = _screen_fundamentals(ticker, profile, financials, refreshed)
+        if not screened:
+            # News screening
+            if _needs_news(cached, stale):
+                ethical_status, ethical_reason = screen_company_news(ticker, profile.get("companyName"))
+                refreshed.add("news")
+            else:
+                ethical_status, ethical_reason = cached.news_flag, cached.news_snippet
+            screened = _screen_news(ticker, profile, financials, ethical_status, ethical_reason, refreshed)
+
+        result, row = screened
+        with timed("halal", "db_save"):
+            save_many([row])
+        return _record_result(result)
+
+    except Exception as e:
+        return _record_result(_error_result(ticker, e))
+
+def rescore_news(tickers, matcher=None):
+    """
+    Re-evaluates the news verdict of cached stocks from the stored articles only, e.g. after the
+    term lists change. Stocks that failed the sector/financial screens keep their verdict.
+    Returns {ticker: (status, reason)} for the stocks that were updated.
+    """
+    cached = get_cached_stocks(tickers)
+    screened = [ticker for ticker, stock in cached.items() if stock.news_updated is not None]
+    verdicts = evaluate_stored_news(screened, matcher)
+    save_many([
+        {"ticker": ticker, "status": status, "reason": reason, "news_flag": status, "news_snippet": reason}
+        for ticker, (status, reason) in verdicts.items()
+    ])
+    return verdicts
 
 
 if __name__ == "__main__":
+    init_db()
     test_tickers = input("Enter a ticker: ").split()
     print(test_tickers)
     
     for tk in test_tickers:
+        # screen_halal_stocks already writes the result to the DB
         result = screen_halal_stocks(tk)
-        save_to_db(
-            ticker=result["ticker"],
-            company_name=result["companyName"],
-            status=result["status"],
-            reason=result["reason"],
-            sector=result.get("sector"),
-            industry=result.get("industry"),
-            market_cap=result.get("marketCap"),
-            financial_ratios=result.get("financialRatios"),
-            news_flag=result.get("newsFlag"),
-            news_snippet=result.get("newsSnippet"),
-        )
         
         print(f"{result['ticker']} ({result['companyName']}): {result['status']}")
         print(f"Reason: {result['reason']}")
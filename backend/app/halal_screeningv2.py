@@ -1,73 +1,77 @@
-# halal_screening.py
-import requests
+# halal_screeningv2.py
 import os
-import yfinance as yf
 from dotenv import load_dotenv
-from nlp_model import predict
+from app.metrics import SCREEN_RESULTS, timed
+from app.nlp_cache import cached_predict
+from app.providers import get_provider
+from app.rulesets import financials_quantities, get_ruleset
+from app.singleflight import SingleFlight
+from app.price_store import get_store
 
 load_dotenv()
 
-NEWS_API_KEY = os.getenv("NEWS_API_KEY")
-
-def fetch_company_profile(ticker):
+# yfinance (default), fmp or fixtures, see app/providers.py
+provider = get_provider(os.getenv("DATA_PROVIDER_V2", "yfinance"))
+# Average market cap from the local price store (only the missing days are fetched) instead of
+# downloading a year of history per screen. Set PRICE_STORE=0 to go back to the bundle's history.
+USE_PRICE_STORE = os.getenv("PRICE_STORE", "1") == "1"
+
+def fetch_bundle(ticker):
+    # Profile, statements and price history in one go, shared by the three fetchers below
+    if USE_PRICE_STORE:
+        with timed("v2", "price_sync"):
+            get_store().sync([ticker], provider)
+    with timed("v2", "bundle"):
+        return provider.get_bundle(ticker, with_history=not USE_PRICE_STORE)
+
+def fetch_bundles(tickers):
+    # Multi-ticker variant, histories come from one bulk download
+    if USE_PRICE_STORE:
+        with timed("v2", "price_sync"):
+            get_store().sync(tickers, provider)
+    with timed("v2", "bundle"):
+        return provider.get_bundles(tickers, with_history=not USE_PRICE_STORE)
+
+def fetch_company_profile(ticker, bundle=None):
     # Get Companies Profile #
-    data = yf.Ticker(ticker)
-    info = data.info
-   
-    if not info or "longName" not in info:
-        return{"error:" f"Invalid ticker: {ticker}"}
+    info = bundle.profile if bundle is not None else provider.get_profile(ticker)
+
+    if not info or not info.get("companyName"):
+        return {"error": f"Invalid ticker: {ticker}"}
 
     profile = {
         "ticker": ticker,
-        "name": info.get("longName"),
+        "name": info.get("companyName"),
         "sector": info.get("industry"),
-        "summary": info.get("longBusinessSummary")
+        "summary": info.get("summary")
     }
     return profile
 
-def safe_lookup(df, keys):
-    """
-    Try to get the first matching key from a DataFrame row index.
-    Returns None if not found.
-    """
-    for key in keys:
-        if key in df.index:
-            return df.loc[key].iloc[0]
-    return None
-
-def fetch_financial_statements(ticker):
+def fetch_financial_statements(ticker, bundle=None):
     # Get Companys financial data #
-    data = yf.Ticker(ticker)
-    balance = data.balance_sheet  # quarterly data
-    income = data.financials      # quarterly income statement
-
-    # get the most recent quarter (first column)
-    latest_date = balance.columns[0]
+    statements = (bundle.statements if bundle is not None else provider.get_statement(ticker)) or {}
 
     financials = {
-        "date": str(latest_date.date()) if latest_date is not None else None,
-        "total_assets": safe_lookup(balance, ["Total Assets"]),
-        "total_debt": safe_lookup(balance, ["Total Debt"]),
-        "cash_total": safe_lookup(balance, [
-            "Cash Cash Equivalents And Short Term Investments",
-            "Cash And Cash Equivalents",
-            "Cash Equivalents",
-            "Other Short Term Investments"
-        ]),
-        "receivables": safe_lookup(balance, ["Total Receivables Net", "Receivables"]),
-        "revenue": safe_lookup(income, ["Total Revenue", "Revenue"]),
-        "interest_income": safe_lookup(income, ["Interest Income", "Net Interest Income"])
+        "date": statements.get("date"),
+        "total_assets": statements.get("totalAssets"),
+        "total_debt": statements.get("totalDebt"),
+        "cash_total": statements.get("cashAndShortTermInvestments"),
+        "receivables": statements.get("receivables"),
+        "revenue": statements.get("totalRevenue"),
+        "interest_income": statements.get("interestIncome")
     }
     print({ticker}, financials)
     return financials
 
-def get_avg_market_cap(ticker_symbol: str) -> float:
-    ticker = yf.Ticker(ticker_symbol)
-
+def get_avg_market_cap(ticker_symbol: str, bundle=None) -> float:
     try:
-        hist = ticker.history(period="1y", interval="1d")
-        avg_price = hist["Close"].mean()
-        shares_outstanding = ticker.info.get("sharesOutstanding", 0)
+        if bundle is None:
+            bundle = fetch_bundle(ticker_symbol)
+        if USE_PRICE_STORE:
+            avg_price = get_store().average_close(ticker_symbol)
+        else:
+            avg_price = bundle.closes.mean() if bundle.closes is not None else None
+        shares_outstanding = (bundle.profile or {}).get("sharesOutstanding") or 0
 
         if avg_price is None or shares_outstanding == 0:
             return None
@@ -77,44 +81,59 @@ def get_avg_market_cap(ticker_symbol: str) -> float:
         return None
 
 
+def _value(value):
+    # yfinance reports missing line items as NaN, treat them the same as None
+    if value is None or value != value:
+        return None
+    return value
+
 def calculate_ratios(financials, avg_market_cap):
     ratios = {}
+    avg_market_cap = _value(avg_market_cap)
 
     if avg_market_cap and avg_market_cap > 0:
-        ratios["debt_ratio"] = (financials.get("total_debt") or 0) / avg_market_cap
-        ratios["cash_ratio"] = (financials.get("cash_total") or 0) / avg_market_cap
-        ratios["receivables_ratio"] = (financials.get("receivables") or 0) / avg_market_cap
+        ratios["debt_ratio"] = (_value(financials.get("total_debt")) or 0) / avg_market_cap
+        ratios["cash_ratio"] = (_value(financials.get("cash_total")) or 0) / avg_market_cap
+        ratios["receivables_ratio"] = (_value(financials.get("receivables")) or 0) / avg_market_cap
     else:
         ratios["debt_ratio"] = None
         ratios["cash_ratio"] = None
         ratios["receivables_ratio"] = None
 
-    revenue = financials.get("revenue") or 0
-    if revenue > 0 and financials.get("interest_income") is not None:
-        ratios["interest_income_ratio"] = financials["interest_income"] / revenue
+    revenue = _value(financials.get("revenue")) or 0
+    interest_income = _value(financials.get("interest_income"))
+    if revenue > 0 and interest_income is not None:
+        ratios["interest_income_ratio"] = interest_income / revenue
     else:
         ratios["interest_income_ratio"] = None
 
     return ratios
 
 
-def screen_stock(ticker):
+_in_flight = SingleFlight("screen_stock")
+
+def screen_stock(ticker, bundle=None):
+    # Concurrent screens of the same ticker share one fetch/NLP run, unless the caller brings its own bundle
+    if bundle is not None:
+        return _screen_stock(ticker, bundle)
+    ticker = ticker.strip().upper()
+    return _in_flight.do(ticker, _screen_stock, ticker)
+
+def _screen_stock(ticker, bundle=None):
     # This screens the stock and determines its compliance simply giving it either halal, doubtful or haraam and then
     # it grades it from A+, A, A-, B+, B, B-, C+, C and C- in terms of accuracy
-    profile = fetch_company_profile(ticker)
-    financials = fetch_financial_statements(ticker)
-    avg_market_cap = get_avg_market_cap(ticker)
+    if bundle is None:
+        bundle = fetch_bundle(ticker)
+    profile = fetch_company_profile(ticker, bundle)
+    financials = fetch_financial_statements(ticker, bundle)
+    avg_market_cap = get_avg_market_cap(ticker, bundle)
     ratios = calculate_ratios(financials, avg_market_cap)
 
     compliance = "Halal"
-    reasons = []
-    missing_data = False
-
-    business_desc = profile.get("summary")
-    nlp_result = predict(business_desc)
 
     # Preventing any non existing tickers breaking the system
     if "error" in profile:
+        SCREEN_RESULTS.inc(screener="v2", status="error")
         return {
         "ticker": ticker,
         "halal": None,
@@ -122,6 +141,10 @@ def screen_stock(ticker):
         "reasons": [profile["error"]]
         }
 
+    business_desc = profile.get("summary")
+    with timed("v2", "nlp"):
+        nlp_result = cached_predict(business_desc, ticker)
+
     # # Industry-based screen (auto haram)
     # haram_industries = []
     # if profile.get("sector") and any(word in profile["sector"] for word in haram_industries):
@@ -135,37 +158,11 @@ def screen_stock(ticker):
     #         "ratios": ratios
     #     }
 
-    # Ratio checks (According to AAOIFI standards)
-    if ratios["debt_ratio"] is None:
-        missing_data = True
-        reasons.append("Debt ratio missing")
-    elif ratios["debt_ratio"] >= 0.33:
-        compliance = "Haram"
-        reasons.append(f"Debt ratio {ratios['debt_ratio']:.2%} ≥ 33%")
-
-    if ratios["cash_ratio"] is None:
-        missing_data = True
-        reasons.append("Cash ratio missing")
-    elif ratios["cash_ratio"] >= 0.33:
-        compliance = "Haram"
-        reasons.append(f"Cash ratio {ratios['cash_ratio']:.2%} ≥ 33%")
-
-    if ratios["receivables_ratio"] is None:
-        missing_data = True
-        reasons.append("Receivables ratio missing")
-    elif ratios["receivables_ratio"] >= 0.33:
+    # Ratio checks of the configured methodology (app/rulesets.py), missing key data → Doubtful
+    haram, missing_data, reasons, _ = get_ruleset().check(financials_quantities(financials, avg_market_cap))
+    if haram:
         compliance = "Haram"
-        reasons.append(f"Receivables ratio {ratios['receivables_ratio']:.2%} ≥ 33%")
-
-    if ratios["interest_income_ratio"] is None:
-        missing_data = True
-        reasons.append("Interest income ratio missing")
-    elif ratios["interest_income_ratio"] >= 0.05:
-        compliance = "Haram"
-        reasons.append(f"Interest income ratio {ratios['interest_income_ratio']:.2%} ≥ 5%")
-
-    # If missing key data → Doubtful
-    if compliance == "Halal" and missing_data:
+    elif missing_data:
         compliance = "Doubtful"
 
     if nlp_result == "not halal":
@@ -175,6 +172,7 @@ def screen_stock(ticker):
 
     # Assign grade (based on available ratios)
     grade = grade_stock(ratios)
+    SCREEN_RESULTS.inc(screener="v2", status=compliance.lower())
 
     return {
         "ticker": ticker,
@@ -229,7 +227,12 @@ def grade_stock(ratios):
 
 
 
+def screen_stocks(tickers):
+    bundles = fetch_bundles(tickers)
+    return [_screen_stock(t, bundles[t]) for t in tickers]
+
+
 if __name__ == "__main__":
     test_tickers = input("Enter a ticker: ").split()
-    for t in test_tickers:
-        print(screen_stock(t))
\ No newline at end of file
+    for result in screen_stocks(test_tickers):
+        print(result)
\ No newline at end of file
@@ -0,0 +1,202 @@
+# jobs.py
+# Background screening jobs for universes too large for one HTTP request. A job's tickers are
+# checkpointed in the screen_job_tickers table as they finish, so progress and partial results can be
+# polled, and a job interrupted by a crash or restart picks up where it stopped. Failed tickers are kept
+# apart from the results and retried in their own passes after the main one.
+#
+# A job is driven by the process that claimed it (db.claim_job), which keeps a heartbeat on it. Every
+# process running the API (one per worker under app/serve.py) looks for jobs whose heartbeat has gone
+# stale, on startup (resume_jobs) and then every JOB_HEARTBEAT_SECONDS, and takes them over.
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app import db
+from app.halal_screening import screen_halal_stocks
+from app.halal_screeningv2 import screen_stock
+
+# Threads shared by all jobs, i.e. how many tickers are screened at once across every running job
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+# Attempts per ticker before it stays failed (the first pass counts as one)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Finished tickers written per checkpoint
+CHECKPOINT_EVERY = int(os.getenv("JOB_CHECKPOINT_EVERY", "25"))
+# Wait before retry pass n is RETRY_BACKOFF * 2 ** (n - 1) seconds
+RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "5"))
+# How often a process renews its jobs' heartbeats (and looks for orphans), and how old a heartbeat
+# gets before the job counts as orphaned
+HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+
+SCREENERS = {
+    "halal": screen_halal_stocks,
+    "v2": screen_stock,
+}
+
+
+def _is_error(result):
+    # screen_halal_stocks reports failures as an "Error ⚠️" status, screen_stock without a compliance
+    if "status" in result:
+        return result["status"] == "Error ⚠️"
+    return result.get("compliance") is None
+
+def _stale_before():
+    from datetime import datetime, timedelta, timezone
+    return datetime.now(timezone.utc) - timedelta(seconds=STALE_SECONDS)
+
+def _screen_one(screener, ticker):
+    try:
+        result = SCREENERS[screener](ticker)
+    except Exception as e:
+        return {"ticker": ticker, "state": "error", "result": None, "error": str(e)}
+    if _is_error(result):
+        reason = result.get("reason") or "; ".join(result.get("reasons") or [])
+        return {"ticker": ticker, "state": "error", "result": result, "error": reason}
+    return {"ticker": ticker, "state": "done", "result": result, "error": None}
+
+
+class JobRunner:
+    def __init__(self, workers=JOB_WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="screen-job")
+        self._drivers = {}
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        threading.Thread(target=self._watch, daemon=True, name="job-heartbeat").start()
+
+    def submit(self, job_id):
+        # Start driving a job unless this process already is
+        with self._lock:
+            driver = self._drivers.get(job_id)
+            if driver is not None and driver.is_alive():
+                return
+            driver = threading.Thread(target=self._drive, args=(job_id,), daemon=True, name=f"job-{job_id[:8]}")
+            self._drivers[job_id] = driver
+            driver.start()
+
+    def driving(self):
+        with self._lock:
+            return [job_id for job_id, driver in self._drivers.items() if driver.is_alive()]
+
+    def resume_orphans(self):
+        # Take over queued or running jobs whose process stopped heartbeating, returns how many
+        orphans = db.orphaned_jobs(_stale_before())
+        for job_id in orphans:
+            self.submit(job_id)
+        return len(orphans)
+
+    def _watch(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            try:
+                db.heartbeat_jobs(self.owner, self.driving())
+                self.resume_orphans()
+            except Exception as e:
+                print(f"[ERROR] Screening job heartbeat failed: {e}")
+
+    def cancel(self, job_id):
+        # Raises ValueError for a job that has already finished
+        if not db.set_job_status(job_id, "cancelled", unless=("done", "failed", "cancelled")):
+            raise ValueError("Job has already finished")
+        self._cancelled.add(job_id)
+
+    def _check_cancelled(self, job_id):
+        # The cancel request may have reached another worker process, only the DB status tells us
+        if job_id not in self._cancelled:
+            job = db.get_job(job_id)
+            if job is not None and job["status"] == "cancelled":
+                self._cancelled.add(job_id)
+        return job_id in self._cancelled
+
+    def _run_pass(self, job, tickers):
+        # Screen `tickers` on the shared pool, checkpointing every CHECKPOINT_EVERY outcomes
+        futures = [self.pool.submit(_screen_one, job["screener"], ticker) for ticker in tickers]
+        outcomes = []
+        try:
+            for future in as_completed(futures):
+                outcomes.append(future.result())
+                if len(outcomes) >= CHECKPOINT_EVERY:
+                    db.checkpoint_job(job["id"], outcomes)
+                    outcomes = []
+                    self._check_cancelled(job["id"])
+                if job["id"] in self._cancelled:
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+            db.checkpoint_job(job["id"], outcomes)
+
+    def _drive(self, job_id):
+        try:
+            job = db.get_job(job_id)
+            if job is None or job["status"] in ("done", "cancelled"):
+                return
+            # Another live process may be driving it already
+            if not db.claim_job(job_id, self.owner, _stale_before()):
+                return
+            if not db.set_job_status(job_id, "running", unless=("cancelled",)):
+                return
+
+            # Main pass over everything not screened yet, then separate passes for the failures
+            pending = [row["ticker"] for row in db.get_job_tickers(job_id, ("pending",))]
+            self._run_pass(job, pending)
+            for retry in range(1, JOB_MAX_ATTEMPTS):
+                failed = [row["ticker"] for row in db.get_job_tickers(job_id, ("error",), max_attempts=JOB_MAX_ATTEMPTS)]
+                if not failed or self._check_cancelled(job_id):
+                    break
+                time.sleep(RETRY_BACKOFF * 2 ** (retry - 1))
+                self._run_pass(job, failed)
+
+            # Conditional in SQL, a cancel arriving after the last check still wins
+            if not self._check_cancelled(job_id):
+                db.set_job_status(job_id, "done", unless=("cancelled",))
+        except Exception as e:
+            print(f"[ERROR] Screening job {job_id} stopped: {e}")
+            try:
+                db.set_job_status(job_id, "failed", unless=("cancelled",))
+            except Exception:
+                pass
+        finally:
+            self._cancelled.discard(job_id)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+def get_runner():
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = JobRunner()
+    return _runner
+
+def start_job(tickers, screener="halal", universe=None):
+    if screener not in SCREENERS:
+        raise ValueError(f"Unknown screener: {screener}")
+    job_id = uuid.uuid4().hex
+    runner = get_runner()
+    db.create_job(job_id, screener, universe, list(dict.fromkeys(tickers)), owner=runner.owner)
+    runner.submit(job_id)
+    return job_id
+
+def retry_failed(job_id):
+    # Another round of attempts for the tickers that are still failing, once the job has finished
+    job = db.get_job(job_id)
+    if job is None:
+        raise KeyError(job_id)
+    if job["status"] in ("queued", "running"):
+        raise ValueError("Job is still running")
+    count = db.reset_job_errors(job_id)
+    if count:
+        db.set_job_status(job_id, "queued")
+        get_runner().submit(job_id)
+    return count
+
+def resume_jobs():
+    # Jobs left queued or running by a process that stopped (finished tickers are skipped), from the API
+    # startup hook. A job counts as orphaned once its heartbeat is STALE_SECONDS old, the others are
+    # picked up by the heartbeat thread when they get there.
+    return get_runner().resume_orphans()
@@ -1,11 +1,45 @@
-from fastapi import FastAPI, HTTPException, Query
+import base64
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from app.halal_screening import screen_halal_stocks, screen_halal_stocks_batch
-from app.db import init_db
-from app.halal_screenerAI import screen_stock
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from app.halal_screening import screen_halal_stocks, screen_halal_stocks_batch_async, screen_halal_stocks_stream, SCREEN_CONCURRENCY
+from app.universes import UNIVERSES, resolve_tickers
+from app.db import init_db, get_job, get_job_tickers, query_stocks, SORT_COLUMNS
+from app.halal_screeningv2 import screen_stock
+from app import embedding_index, jobs, metrics, nlp_model, nlp_cache
 
-app = FastAPI()
-init_db()
+# Load the NLP model in a background thread at startup instead of on the first /screen request
+PRELOAD_MODEL = os.getenv("NLP_PRELOAD", "1") == "1"
+
+def _background_warmup():
+    try:
+        seconds = nlp_model.warmup()
+        print(f"[INFO] NLP model loaded in {seconds:.2f}s")
+        pruned = nlp_cache.prune()
+        if pruned:
+            print(f"[INFO] Pruned {pruned} cached NLP verdicts from older checkpoints")
+    except Exception as e:
+        print(f"[ERROR] NLP model warmup failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    init_db()
+    resumed = jobs.resume_jobs()
+    if resumed:
+        print(f"[INFO] Resumed {resumed} screening job(s)")
+    if PRELOAD_MODEL:
+        threading.Thread(target=_background_warmup, daemon=True, name="nlp-warmup").start()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,6 +49,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    # Request latency per route, plus a trace id and stage breakdown when METRICS_TRACE=1
+    trace = metrics.start_trace(request.headers.get("X-Request-ID")) if metrics.TRACE_REQUESTS else None
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        elapsed, method=request.method, route=route.path if route else "unmatched", status=str(response.status_code))
+    if trace is not None:
+        response.headers["X-Request-ID"] = trace["id"]
+        timing = metrics.server_timing(trace)
+        if timing:
+            response.headers["Server-Timing"] = timing
+        print(f"[TRACE] {trace['id']} {request.method} {request.url.path} {response.status_code} {elapsed * 1000:.1f}ms {timing}")
+    return response
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def root():
     return {"message": "Halal Screener API"}
@@ -24,15 +81,164 @@ def screen_endpoint(ticker: str):
     result = screen_stock(ticker)
     return result
 
+@app.get("/similar/{ticker}")
+def similar_companies(ticker: str, k: int=Query(10, ge=1, le=100)):
+    # Companies with the closest business summaries, from the embedding index /screen fills
+    matches = embedding_index.get_index().similar(ticker, k)
+    if matches is None:
+        raise HTTPException(status_code=404, detail=f"{ticker} is not in the embedding index, screen it with /screen first")
+    return {
+        "ticker": ticker,
+        "similar": [
+            {"ticker": other, "similarity": round(similarity, 4), "nlp_result": nlp_model.label_from_logits(logits)}
+            for other, similarity, logits in matches
+        ],
+    }
+
 @app.get("/stocks")
 def get_stock(ticker: str=Query(..., min_length=1)):
     return screen_halal_stocks(ticker)
 
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode() if key else None
+
+def _decode_cursor(cursor):
+    try:
+        value, ticker = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, ticker
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/stocks/query")
+def query_cached_stocks(
+    status: Optional[List[str]] = Query(None, description="halal, haram, doubtful or error"),
+    sector: Optional[List[str]] = Query(None),
+    industry: Optional[List[str]] = Query(None),
+    grade: Optional[List[str]] = Query(None),
+    ticker: Optional[str] = Query(None, description="Ticker prefix"),
+    min_market_cap: Optional[float] = Query(None, ge=0),
+    max_market_cap: Optional[float] = Query(None, ge=0),
+    max_debt_ratio: Optional[float] = Query(None),
+    max_cash_ratio: Optional[float] = Query(None),
+    max_receivables_ratio: Optional[float] = Query(None),
+    max_interest_income_ratio: Optional[float] = Query(None),
+    sort: str = Query("ticker", pattern=f"^({'|'.join(SORT_COLUMNS)})$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+):
+    # Filtered, sorted page of the screened stocks in the DB, pass next_cursor back for the next page
+    stocks, next_key = query_stocks(
+        statuses=status or (), sectors=sector or (), industries=industry or (), grades=grade or (),
+        ticker_prefix=ticker, min_market_cap=min_market_cap, max_market_cap=max_market_cap,
+        max_ratios={
+            "debt_ratio": max_debt_ratio,
+            "cash_ratio": max_cash_ratio,
+            "receivables_ratio": max_receivables_ratio,
+            "interest_income_ratio": max_interest_income_ratio,
+        },
+        sort=sort, descending=order == "desc", limit=limit,
+        after=_decode_cursor(cursor) if cursor else None,
+    )
+    return {"results": stocks, "next_cursor": _encode_cursor(next_key)}
+
 @app.get("/stocks-screener")
-def get_halal_stocks_batch():
-    tickers = ["AAPL", "MSFT", "TSLA", "JPM", "KO", "NVDA", "META", "MKDW"]
-    return screen_halal_stocks_batch(tickers)
+async def get_halal_stocks_batch(concurrency: int=Query(SCREEN_CONCURRENCY, ge=1, le=128)):
+    return await screen_halal_stocks_batch_async(UNIVERSES["default"], concurrency)
+
+def _requested_tickers(tickers, universe):
+    try:
+        requested = resolve_tickers(tickers, universe)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown universe: {universe}")
+    if not requested:
+        raise HTTPException(status_code=400, detail="No tickers to screen")
+    return requested
+
+@app.get("/stocks-screener/stream")
+async def stream_halal_stocks(
+    tickers: str = Query(None, description="Comma separated tickers, overrides universe"),
+    universe: str = Query("default"),
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+    concurrency: int = Query(SCREEN_CONCURRENCY, ge=1, le=128),
+):
+    # One result per line (NDJSON) or per event (SSE) as each ticker finishes
+    requested = _requested_tickers(tickers, universe)
+
+    async def body():
+        async for result in screen_halal_stocks_stream(requested, concurrency):
+            line = json.dumps(result, ensure_ascii=False)
+            yield f"data: {line}\n\n" if format == "sse" else f"{line}\n"
+        if format == "sse":
+            yield "event: done\ndata: {}\n\n"
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+class JobRequest(BaseModel):
+    universe: str = "default"
+    tickers: Optional[List[str]] = None
+    screener: str = "halal"
+
+def _job_or_404(job_id):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@app.post("/jobs", status_code=202)
+def create_screening_job(request: JobRequest):
+    # Screens a universe in the background, poll /jobs/{id} for progress
+    requested = _requested_tickers(request.tickers, request.universe)
+    try:
+        job_id = jobs.start_job(requested, request.screener, None if request.tickers else request.universe)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _job_or_404(job_id)
+
+@app.get("/jobs/{job_id}")
+def get_screening_job(job_id: str):
+    return _job_or_404(job_id)
+
+@app.get("/jobs/{job_id}/results")
+def get_screening_job_results(job_id: str, offset: int=Query(0, ge=0), limit: int=Query(100, ge=1, le=1000)):
+    # Results of the tickers screened so far, in universe order. Failures are under /errors.
+    job = _job_or_404(job_id)
+    rows = get_job_tickers(job_id, ("done",), offset=offset, limit=limit)
+    return {"job": job, "results": [row["result"] for row in rows]}
+
+@app.get("/jobs/{job_id}/errors")
+def get_screening_job_errors(job_id: str, offset: int=Query(0, ge=0), limit: int=Query(100, ge=1, le=1000)):
+    job = _job_or_404(job_id)
+    rows = get_job_tickers(job_id, ("error",), offset=offset, limit=limit)
+    return {"job": job, "errors": [{key: row[key] for key in ("ticker", "attempts", "error", "result")} for row in rows]}
+
+@app.post("/jobs/{job_id}/retry")
+def retry_screening_job(job_id: str):
+    _job_or_404(job_id)
+    try:
+        retried = jobs.retry_failed(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"retried": retried, "job": _job_or_404(job_id)}
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_screening_job(job_id: str):
+    _job_or_404(job_id)
+    try:
+        jobs.get_runner().cancel(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _job_or_404(job_id)
+
+@app.post("/warmup")
+async def warmup():
+    try:
+        seconds = await run_in_threadpool(nlp_model.warmup)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Model warmup failed: {e}")
+    return {"status": "ok", "seconds": round(seconds, 3)}
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok", "model_loaded": nlp_model.is_loaded()}
\ No newline at end of file
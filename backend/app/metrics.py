@@ -0,0 +1,150 @@
+# metrics.py
+# In-process counters and histograms rendered in the Prometheus text format by GET /metrics.
+# Recording is a dict lookup and a few additions under a lock, cheap enough to leave on in
+# production. Stage timings can also be collected per request under a trace id (METRICS_TRACE=1),
+# which the API returns as X-Request-ID / Server-Timing headers and logs.
+import bisect
+import contextvars
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Per-request trace ids and stage breakdowns, off by default
+TRACE_REQUESTS = os.getenv("METRICS_TRACE", "0") == "1"
+
+# Seconds, from a cache hit to a slow upstream call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels_text(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (non-cumulative, last one is +Inf), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = {key: ([*state[0]], state[1], state[2]) for key, state in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {count}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- the app's metrics ---
+
+STAGE_SECONDS = Histogram(
+    "halal_screen_stage_seconds", "Time spent in each stage of a screen", ("screener", "stage"))
+SCREEN_RESULTS = Counter(
+    "halal_screen_results_total", "Finished screens by outcome", ("screener", "status"))
+CACHE_REQUESTS = Counter(
+    "halal_cache_requests_total", "Cache lookups by cache and result (hit, partial, miss)", ("cache", "result"))
+UPSTREAM_REQUESTS = Counter(
+    "halal_upstream_requests_total", "Upstream HTTP requests by response status (or error)", ("upstream", "status"))
+UPSTREAM_SECONDS = Histogram(
+    "halal_upstream_request_seconds", "Upstream HTTP request latency", ("upstream",))
+DB_QUERY_SECONDS = Histogram(
+    "halal_db_query_seconds", "SQL statement latency", ("statement",))
+COALESCED_CALLS = Counter(
+    "halal_coalesced_calls_total", "Calls that joined an in-flight call for the same key", ("name",))
+HTTP_REQUEST_SECONDS = Histogram(
+    "halal_http_request_seconds", "API request latency", ("method", "route", "status"))
+
+
+# --- per-request tracing ---
+
+_trace = contextvars.ContextVar("halal_trace", default=None)
+
+def start_trace(trace_id=None):
+    # Returns the trace dict collecting (stage, seconds) pairs for the current request
+    trace = {"id": trace_id or uuid.uuid4().hex[:16], "stages": []}
+    _trace.set(trace)
+    return trace
+
+def current_trace_id():
+    trace = _trace.get()
+    return trace["id"] if trace else None
+
+def server_timing(trace):
+    # Server-Timing header value, stages with the same name are summed
+    totals = {}
+    for stage, seconds in trace["stages"]:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage.replace(':', '-')};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+@contextmanager
+def timed(screener, stage):
+    # Times a screen stage into STAGE_SECONDS (and the request's trace, if there is one)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, screener=screener, stage=stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace["stages"].append((f"{screener}:{stage}", elapsed))
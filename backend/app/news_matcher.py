@@ -0,0 +1,124 @@
+# news_matcher.py
+# Multi-term matcher for the news ethical-risk scan. All term lists are folded into one trie and
+# compiled into a single regular expression, so each text is scanned once no matter how many terms
+# there are (the trie shares prefixes, so at any position the regex follows one path instead of
+# trying every term). The pattern sits in a lookahead, so matches may overlap: every term found at any
+# position is reported, like checking each term with `in`. Works the same for the built-in lists and
+# for per-client custom ones.
+import hashlib
+import re
+import threading
+
+# Article fields that are scanned, in the order hits are reported
+ARTICLE_FIELDS = ("title", "description", "content")
+# Part of the matcher version, bumped when the matching itself changes so stored results are rescanned
+MATCHING_VERSION = "2"
+WORD_CHAR = re.compile(r"\w")
+
+
+def _trie_pattern(node):
+    # {char: child, "": True at the end of a term} -> regex, longest term preferred at every branch
+    end = node.get("") is True
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char != ""]
+    if not branches:
+        return ""
+    if end:
+        return f"(?:{'|'.join(branches)})?"
+    return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+
+class TermMatcher:
+    """
+    Matches many literal terms in one pass over a text.
+
+    `categories` maps a category name to its terms, in priority order: a term listed under several
+    categories is reported under the first one. Matching is case-insensitive and, like the original
+    `term in title` checks, matches inside words unless `whole_words` is set.
+    """
+
+    def __init__(self, categories, whole_words=False):
+        self.categories = list(categories)
+        self.term_category = {}
+        for category, terms in categories.items():
+            for term in terms:
+                term = term.strip().lower()
+                if term:
+                    self.term_category.setdefault(term, category)
+
+        self.whole_words = whole_words
+        self.trie = trie = {}
+        for term in self.term_category:
+            node = trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[""] = True
+
+        # Identifies the term lists, so results stored under another version can be rescanned
+        digest = hashlib.sha256(f"{MATCHING_VERSION}:{whole_words}".encode())
+        for term, category in sorted(self.term_category.items()):
+            digest.update(f"{category}:{term}\n".encode("utf-8"))
+        self.version = digest.hexdigest()[:32]
+
+        # Zero-width, so the scan moves on one character at a time and overlapping terms all match.
+        # The group is the longest term starting at each position.
+        pattern = _trie_pattern(trie)
+        if whole_words and pattern:
+            pattern = rf"(?<!\w)(?=((?:{pattern})(?!\w)))"
+        elif pattern:
+            pattern = f"(?=({pattern}))"
+        self.pattern = re.compile(pattern) if pattern else None
+
+    def _terms_at(self, text, start, longest):
+        # The longest term at `start` and every shorter term it begins with, shortest first
+        node, terms = self.trie, []
+        for i, char in enumerate(longest, 1):
+            node = node[char]
+            if node.get("") is True:
+                end = start + i
+                if not self.whole_words or i == len(longest) or not WORD_CHAR.match(text, end):
+                    terms.append(longest[:i])
+        return terms
+
+    def find(self, text):
+        # -> [(term, category, start)] for every term in `text`, overlapping ones included
+        if not text or self.pattern is None:
+            return []
+        lowered = text.lower()
+        hits = []
+        for match in self.pattern.finditer(lowered):
+            start = match.start()
+            for term in self._terms_at(lowered, start, match.group(1)):
+                hits.append((term, self.term_category[term], start))
+        return hits
+
+    def scan_articles(self, articles, fields=ARTICLE_FIELDS):
+        """
+        Scans title, description and content of each article. Returns one dict per hit with the
+        article index, field, term, category and position.
+        """
+        hits = []
+        for index, article in enumerate(articles):
+            for field in fields:
+                for term, category, start in self.find(article.get(field) or ""):
+                    hits.append({"article": index, "field": field, "term": term, "category": category, "start": start})
+        return hits
+
+    def classify(self, article, fields=ARTICLE_FIELDS):
+        # Highest-priority category found anywhere in the article, None if nothing matched
+        found = {hit["category"] for hit in self.scan_articles([article], fields)}
+        return next((category for category in self.categories if category in found), None)
+
+
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+def get_matcher(categories, whole_words=False):
+    # Compiled matchers are cached by their term lists, so a client's custom lists compile once
+    key = (tuple((category, tuple(terms)) for category, terms in categories.items()), whole_words)
+    matcher = _matchers.get(key)
+    if matcher is None:
+        with _matchers_lock:
+            matcher = _matchers.get(key)
+            if matcher is None:
+                matcher = _matchers[key] = TermMatcher(categories, whole_words)
+    return matcher
@@ -0,0 +1,87 @@
+# news_store.py
+# Stored news corpus for the ethical-risk screen. Articles are kept in the news_articles table,
+# deduplicated by URL and by content, and linked to every company they were fetched for. A refresh
+# only asks NewsAPI for articles newer than the newest one we hold for the company, and each article
+# is scored by the term matcher once per matcher version instead of on every screen.
+import hashlib
+import os
+from datetime import timezone, datetime as dt
+from urllib.parse import urlsplit, urlunsplit
+from app import db
+
+# How many of the most recent stored articles decide a company's news verdict (NewsAPI pageSize before)
+NEWS_WINDOW = int(os.getenv("NEWS_WINDOW", "10"))
+# Max articles per incremental NewsAPI request
+NEWS_PAGE_SIZE = int(os.getenv("NEWS_PAGE_SIZE", "10"))
+
+
+def _normalize_url(url):
+    # Scheme/host case and fragments don't make a different article
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), parts.query, ""))
+
+def content_hash(article):
+    text = " ".join((article.get(field) or "").strip().lower() for field in ("title", "description"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def article_fingerprint(article):
+    url = article.get("url")
+    if url:
+        return hashlib.sha256(_normalize_url(url).encode("utf-8")).hexdigest()
+    return content_hash(article)
+
+def _parse_published(value):
+    # NewsAPI gives "2024-05-01T12:30:00Z"
+    if not value:
+        return None
+    if isinstance(value, dt):
+        published = value
+    else:
+        try:
+            published = dt.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return published.replace(tzinfo=timezone.utc) if published.tzinfo is None else published.astimezone(timezone.utc)
+
+def _record(article):
+    source = article.get("source")
+    return {
+        "fingerprint": article_fingerprint(article),
+        "content_hash": content_hash(article),
+        "url": article.get("url"),
+        "title": article.get("title"),
+        "description": article.get("description"),
+        "content": article.get("content"),
+        "source": source.get("name") if isinstance(source, dict) else source,
+        "published_at": _parse_published(article.get("publishedAt")),
+    }
+
+def ingest(ticker, company_name, provider):
+    # Fetch and store the articles published since the newest stored one, returns how many were new
+    latest = db.latest_news_published([ticker]).get(ticker)
+    since = latest.strftime("%Y-%m-%dT%H:%M:%S") if latest else None
+    articles = provider.get_news(company_name, page_size=NEWS_PAGE_SIZE, since=since)
+
+    records = []
+    for article in articles:
+        record = _record(article)
+        # `from` is inclusive, the boundary article is already stored
+        if latest and record["published_at"] and record["published_at"] <= latest:
+            continue
+        records.append(record)
+    return db.save_news_articles(ticker, records)
+
+def scored_articles(tickers, matcher, limit=NEWS_WINDOW):
+    # {ticker: [article dict with "risk"]}, newest first. Articles scored by an older matcher
+    # version (or never scored) are scanned now and the result is saved.
+    stored = db.get_news_articles(tickers, limit)
+    rescored = {}
+    for articles in stored.values():
+        for article in articles:
+            if article["risk_version"] != matcher.version:
+                if article["fingerprint"] not in rescored:
+                    rescored[article["fingerprint"]] = matcher.classify(article)
+                article["risk"] = rescored[article["fingerprint"]]
+                article["risk_version"] = matcher.version
+    db.save_news_risk(matcher.version, rescored)
+    return stored
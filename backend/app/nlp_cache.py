@@ -0,0 +1,159 @@
+# nlp_cache.py
+# Memoized classifier verdicts. Business summaries barely change between screens, so each
+# (summary, model version) pair is classified once: an in-memory LRU sits in front of the
+# nlp_verdicts table, and a new checkpoint at MODEL_PATH (or a new cascade model or threshold,
+# see nlp_cascade.version()) gives a new version so old entries simply stop matching.
+#
+# New summaries go through the cascade's cheap first stage before anything else. Only the ones it is
+# unsure about are embedded on the request path (a near-duplicate's verdict can save their BERT pass),
+# the rest are embedded for the embedding index by a background thread.
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from app import embedding_index, nlp_cascade, nlp_model
+from app.metrics import CACHE_REQUESTS
+
+LRU_SIZE = int(os.getenv("NLP_CACHE_SIZE", "10000"))
+# Set to 0 to keep verdicts in memory only
+PERSIST = os.getenv("NLP_CACHE_PERSIST", "1") == "1"
+
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+# One thread, so background embedding never competes with itself for the model
+_indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-index")
+
+
+def summary_hash(description):
+    return hashlib.sha256((description or "").strip().encode("utf-8")).hexdigest()
+
+def _lru_get(key):
+    with _lru_lock:
+        if key in _lru:
+            _lru.move_to_end(key)
+            return _lru[key]
+    return None
+
+def _lru_put(key, value):
+    with _lru_lock:
+        _lru[key] = value
+        _lru.move_to_end(key)
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+
+def _db_get(version, hashes):
+    if not PERSIST or not hashes:
+        return {}
+    try:
+        from app.db import get_nlp_verdicts
+        return get_nlp_verdicts(version, hashes)
+    except Exception as e:
+        print(f"[ERROR] NLP verdict cache read failed: {e}")
+        return {}
+
+def _db_save(version, verdicts):
+    if not PERSIST or not verdicts:
+        return
+    try:
+        from app.db import save_nlp_verdicts
+        save_nlp_verdicts(version, verdicts)
+    except Exception as e:
+        print(f"[ERROR] NLP verdict cache write failed: {e}")
+
+def cached_predict_batch(descriptions, tickers=None):
+    # [(label, logits)] in input order, the classifiers only run for summaries never seen by this version.
+    # With tickers, summaries are also recorded in the embedding index and near-duplicates of an
+    # indexed summary take its verdict.
+    version = nlp_cascade.version()
+    hashes = [summary_hash(d) for d in descriptions]
+    found = {}
+
+    for h in set(hashes):
+        hit = _lru_get((version, h))
+        if hit is not None:
+            found[h] = hit
+
+    missing = [h for h in dict.fromkeys(hashes) if h not in found]
+    CACHE_REQUESTS.inc(len(found), cache="nlp_lru", result="hit")
+    CACHE_REQUESTS.inc(len(missing), cache="nlp_lru", result="miss")
+    stored = _db_get(version, missing)
+    for h, verdict in stored.items():
+        found[h] = tuple(verdict)
+        _lru_put((version, h), found[h])
+    if PERSIST:
+        CACHE_REQUESTS.inc(len(stored), cache="nlp_db", result="hit")
+        CACHE_REQUESTS.inc(len(missing) - len(stored), cache="nlp_db", result="miss")
+
+    # Classify what's left, once per distinct summary: the first stage takes the ones it is sure of
+    todo = {}
+    for h, description in zip(hashes, descriptions):
+        if h not in found and h not in todo:
+            todo[h] = description
+    fresh = {}
+    if todo:
+        for h, logits in zip(list(todo), nlp_cascade.predict_confident(list(todo.values()))):
+            if logits is not None:
+                fresh[h] = (nlp_model.label_from_logits(logits), logits)
+                del todo[h]
+
+    # The summaries the index doesn't have for their ticker yet. Those still headed for BERT are embedded
+    # now (a short pass, cheaper than classifying) and take the verdict of a near-duplicate if there is
+    # one. Only summaries the embedding read whole qualify: past the window a changed summary would look
+    # like its old self. The others are embedded in the background.
+    to_index, now, vectors = [], [], None
+    if tickers and embedding_index.INDEX_ENABLED:
+        to_index = [i for i in embedding_index.unindexed(tickers, hashes) if descriptions[i]]
+        now = [i for i in to_index if hashes[i] in todo]
+    if now:
+        vectors = nlp_model.embed_batch([descriptions[i] for i in now])
+        whole = nlp_model.fits_embedding([descriptions[i] for i in now])
+        candidates = [j for j, fits in enumerate(whole) if fits]
+        near = embedding_index.near_duplicates(vectors[candidates], [tickers[now[j]] for j in candidates])
+        for j, logits in zip(candidates, near):
+            h = hashes[now[j]]
+            if logits is not None and h in todo:
+                fresh[h] = (nlp_model.label_from_logits(logits), logits)
+                del todo[h]
+
+    if todo:
+        for h, logits in zip(todo, nlp_cascade.predict_bert(list(todo.values()))):
+            fresh[h] = (nlp_model.label_from_logits(logits), logits)
+    for h, verdict in fresh.items():
+        _lru_put((version, h), verdict)
+    _db_save(version, fresh)
+    found.update(fresh)
+
+    if now:
+        embedding_index.add([tickers[i] for i in now], [hashes[i] for i in now],
+                            [found[hashes[i]][1] for i in now], vectors)
+    queued = set(now)
+    later = [i for i in to_index if i not in queued]
+    if later:
+        _indexer.submit(_index, [tickers[i] for i in later], [hashes[i] for i in later],
+                        [descriptions[i] for i in later], [found[hashes[i]][1] for i in later])
+    return [found[h] for h in hashes]
+
+def _index(tickers, hashes, descriptions, logits):
+    # Background half of cached_predict_batch, skipping tickers indexed meanwhile
+    try:
+        keep = embedding_index.unindexed(tickers, hashes)
+        if keep:
+            vectors = nlp_model.embed_batch([descriptions[i] for i in keep])
+            embedding_index.add([tickers[i] for i in keep], [hashes[i] for i in keep], [logits[i] for i in keep], vectors)
+    except Exception as e:
+        print(f"[ERROR] Embedding index update failed: {e}")
+
+def wait_for_index():
+    # Blocks until the summaries queued so far are in the embedding index
+    _indexer.submit(lambda: None).result()
+
+def cached_predict(description, ticker=None):
+    return cached_predict_batch([description], [ticker] if ticker else None)[0][0]
+
+def prune():
+    # Remove verdicts left over from previous checkpoints
+    if PERSIST:
+        from app.db import prune_nlp_verdicts
+        return prune_nlp_verdicts(nlp_cascade.version())
+    return 0
@@ -0,0 +1,98 @@
+# nlp_cascade.py
+# Cheap-first classification. A TF-IDF + logistic regression model (`train_nlp_model.py --cascade`,
+# trained on the same corpus as BERT) answers in microseconds. A description only goes to BERT when the
+# first stage's top class probability is below NLP_CASCADE_THRESHOLD, which most unambiguous
+# descriptions clear.
+#
+#   NLP_CASCADE_PATH       first-stage model, defaults to MODEL_PATH-cascade.joblib. The cascade is on
+#                          whenever the file exists, NLP_CASCADE=0 turns it off.
+#   NLP_CASCADE_THRESHOLD  minimum first-stage confidence, 1.0 sends everything to BERT
+import hashlib
+import math
+import os
+import threading
+from app import nlp_model
+from app.metrics import Counter
+
+cascade_path = os.getenv("NLP_CASCADE_PATH") or (f"{nlp_model.model_path}-cascade.joblib" if nlp_model.model_path else None)
+CASCADE_ENABLED = os.getenv("NLP_CASCADE", "1") == "1"
+CASCADE_THRESHOLD = float(os.getenv("NLP_CASCADE_THRESHOLD", "0.9"))
+
+CASCADE_VERDICTS = Counter(
+    "halal_nlp_cascade_verdicts_total", "Classifier verdicts by the cascade stage that gave them", ("stage",))
+
+_classifier = None
+_load_lock = threading.Lock()
+
+
+def is_enabled():
+    return CASCADE_ENABLED and bool(cascade_path) and os.path.isfile(cascade_path)
+
+def version():
+    # Key for cached verdicts: the BERT version alone, or combined with the first stage and threshold
+    # when the cascade is on, so changing either doesn't serve verdicts made under the old setup
+    if not is_enabled():
+        return nlp_model.model_version()
+    stat = os.stat(cascade_path)
+    key = f"{nlp_model.model_version()}:{stat.st_size}:{stat.st_mtime_ns}:{CASCADE_THRESHOLD}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+def load_classifier(path=None):
+    global _classifier
+    if path:
+        import joblib
+        return joblib.load(path)
+    if _classifier is None:
+        with _load_lock:
+            if _classifier is None:
+                import joblib
+                _classifier = joblib.load(cascade_path)
+    return _classifier
+
+def first_stage(descriptions, classifier=None):
+    # [(logits, confidence)] from the linear model. Log-probabilities stand in for logits, in
+    # nlp_model.label_mapping order, so label_from_logits() and the verdict cache treat them like BERT's.
+    classifier = classifier or load_classifier()
+    order = {label: i for i, label in enumerate(classifier.classes_)}
+    rows = classifier.predict_proba([d or "" for d in descriptions])
+    results = []
+    for row in rows:
+        probabilities = [row[order[label]] if label in order else 0.0 for label in nlp_model.label_mapping.values()]
+        logits = [math.log(p) if p > 0 else -1e9 for p in probabilities]
+        results.append((logits, max(probabilities)))
+    return results
+
+def predict_logits_batch(descriptions, threshold=CASCADE_THRESHOLD, classifier=None, bert=None):
+    # Logits per description in input order, from the first stage when it is confident enough and from
+    # BERT (`bert`, defaults to the served model) otherwise. Returns (logits, number answered by BERT).
+    logits = predict_confident(descriptions, threshold, classifier)
+    uncertain = [i for i, row in enumerate(logits) if row is None]
+    if uncertain:
+        for i, row in zip(uncertain, predict_bert([descriptions[i] for i in uncertain], bert)):
+            logits[i] = row
+    return logits, len(uncertain)
+
+def predict_confident(descriptions, threshold=CASCADE_THRESHOLD, classifier=None):
+    # The first stage's logits where it is confident enough, None where BERT has to decide (everywhere
+    # when the cascade is off)
+    logits = [None] * len(descriptions)
+    if classifier is None and not is_enabled():
+        return logits
+    for i, (row, confidence) in enumerate(first_stage(descriptions, classifier)):
+        if confidence >= threshold:
+            logits[i] = row
+    CASCADE_VERDICTS.inc(sum(row is not None for row in logits), stage="first")
+    return logits
+
+def predict_bert(descriptions, bert=None):
+    logits = _bert(descriptions, bert)
+    CASCADE_VERDICTS.inc(len(descriptions), stage="bert")
+    return logits
+
+def _bert(descriptions, bert=None):
+    if bert is not None:
+        return bert(descriptions)
+    # A lone description goes through the micro-batcher so it can share a forward pass
+    if len(descriptions) == 1:
+        return [nlp_model.predict_logits(descriptions[0])]
+    return nlp_model.predict_logits_batch(descriptions)
@@ -1,28 +1,234 @@
-from transformers import BertTokenizer, BertForSequenceClassification
-import torch
+import hashlib
 import os
+import threading
+import time
+import queue
+from concurrent.futures import Future
 from dotenv import load_dotenv
 
 load_dotenv()
 model_path = os.getenv("MODEL_PATH")
 
-# Loading my trained model and its tokenizer
-model = BertForSequenceClassification.from_pretrained(model_path)
-tokenizer = BertTokenizer.from_pretrained(model_path)
+# CPU inference options:
+#   NLP_MODEL_PATH  checkpoint to serve, defaults to MODEL_PATH (point it at the distilled
+#                   checkpoint from `train_nlp_model.py --distill` for a smaller model)
+#   NLP_BACKEND     fp32 (default) or int8 (dynamic int8 quantization of the Linear layers)
+#   NLP_INTRA_OP_THREADS / NLP_INTER_OP_THREADS  torch thread pools, unset keeps torch's defaults
+serving_path = os.getenv("NLP_MODEL_PATH") or model_path
+NLP_BACKEND = os.getenv("NLP_BACKEND", "fp32")
+INTRA_OP_THREADS = int(os.getenv("NLP_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.getenv("NLP_INTER_OP_THREADS", "0"))
+BACKENDS = ("fp32", "int8")
 
-def predict(description):
-    
-    #Make it into numerical tokens that BERT can understand
-    inputs = tokenizer(description, return_tensors="pt", padding=True, truncation=True, max_length=512)
+# Max descriptions per forward pass, and how long the micro-batcher waits for more requests
+# before running a batch (0 disables the micro-batcher and predict() runs directly)
+PREDICT_BATCH_SIZE = int(os.getenv("NLP_BATCH_SIZE", "16"))
+BATCH_WAIT_MS = float(os.getenv("NLP_BATCH_WAIT_MS", "5"))
+# Tokens read per description for sentence embeddings (app/embedding_index.py), only summaries that fit
+# whole can take a near-duplicate's verdict
+EMBED_MAX_LENGTH = int(os.getenv("NLP_EMBED_MAX_LENGTH", "128"))
+
+#Map back to the label names
+label_mapping = {0: 'halal', 1: 'non-halal', 2: 'doubtful'}
+
+# The model is loaded on first use (or by warmup() from the API startup hook), so importing this
+# module doesn't pull in torch/transformers or read MODEL_PATH
+_model = None
+_tokenizer = None
+_model_version = None
+_load_lock = threading.Lock()
+
+def _checkpoint_fingerprint(path, backend):
+    # Cheap identity of a checkpoint directory: file names, sizes and mtimes plus the backend,
+    # so retraining into MODEL_PATH or switching NLP_BACKEND gives a new version
+    digest = hashlib.sha256(backend.encode())
+    if path and os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            stat = os.stat(os.path.join(path, name))
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    else:
+        digest.update(str(path).encode())
+    return digest.hexdigest()[:32]
+
+def model_version():
+    # Version of the model that is (or would be) serving, used to key cached verdicts
+    return _model_version or _checkpoint_fingerprint(serving_path, NLP_BACKEND)
+
+def configure_threads(intra_op=INTRA_OP_THREADS, inter_op=INTER_OP_THREADS):
+    import torch
+
+    if intra_op > 0:
+        torch.set_num_threads(intra_op)
+    if inter_op > 0:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            # Can only be set once, before torch runs any inter-op parallel work
+            print("[WARN] NLP_INTER_OP_THREADS ignored, torch inter-op pool already started")
+
+def build_model(path, backend="fp32"):
+    # Works for the full BERT checkpoint and the distilled one, the Auto classes read config.json
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown NLP backend: {backend}")
+
+    # Loading my trained model and its tokenizer
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    model = AutoModelForSequenceClassification.from_pretrained(path)
+    model.eval()
+
+    if backend == "int8":
+        import torch
+        from torch.ao.quantization import quantize_dynamic
+
+        # Weights stored as int8, activations quantized on the fly, only for nn.Linear
+        model = quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model, tokenizer
+
+def load_model():
+    global _model, _tokenizer, _model_version
+    if _model is None:
+        with _load_lock:
+            if _model is None:
+                configure_threads()
+                version = _checkpoint_fingerprint(serving_path, NLP_BACKEND)
+                model, tokenizer = build_model(serving_path, NLP_BACKEND)
+                _tokenizer = tokenizer
+                _model_version = version
+                _model = model
+    return _model, _tokenizer
+
+def is_loaded():
+    return _model is not None
+
+def warmup():
+    # Load the model and run one tiny batch so the first real request doesn't pay for either
+    start = time.perf_counter()
+    load_model()
+    predict_batch(["warmup"])
+    return time.perf_counter() - start
+
+def _logits_batch(descriptions, batch_size=PREDICT_BATCH_SIZE, model=None, tokenizer=None):
+    # Raw logits for each description, in input order. Uses the served model unless one is passed in.
+    import torch
+
+    if model is None:
+        model, tokenizer = load_model()
+    texts = [d or "" for d in descriptions]
+    # Sort by length so each chunk pads only to its own longest description (dynamic padding)
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    logits = [None] * len(texts)
+
+    for start in range(0, len(order), batch_size):
+        chunk = order[start:start + batch_size]
+        #Make it into numerical tokens that BERT can understand
+        inputs = tokenizer([texts[i] for i in chunk], return_tensors="pt", padding="longest", truncation=True, max_length=512)
+        #Give a prediction
+        with torch.no_grad():
+            outputs = model(**inputs).logits
+        for i, row in zip(chunk, outputs.tolist()):
+            logits[i] = row
 
-    #Give a prediction
-    with torch.no_grad():
-        outputs = model(**inputs)
-        logits = outputs.logits
+    return logits
 
-    predicted_class = torch.argmax(logits, dim=1).item()
+def embed_batch(descriptions, batch_size=PREDICT_BATCH_SIZE, max_length=EMBED_MAX_LENGTH):
+    # Sentence embeddings from the served model: the last hidden state mean-pooled over real tokens and
+    # L2-normalised, as a float32 (n, hidden_size) array in input order. Only the first `max_length`
+    # tokens are read, which is what tells companies apart and costs a fraction of a 512-token pass.
+    import numpy as np
+    import torch
 
-    #Map back to the label names
-    label_mapping = {0: 'halal', 1: 'non-halal', 2: 'doubtful'}
+    model, tokenizer = load_model()
+    texts = [d or "" for d in descriptions]
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    vectors = np.zeros((len(texts), model.config.hidden_size), dtype=np.float32)
 
-    return label_mapping[predicted_class]
+    for start in range(0, len(order), batch_size):
+        chunk = order[start:start + batch_size]
+        inputs = tokenizer([texts[i] for i in chunk], return_tensors="pt", padding="longest", truncation=True, max_length=max_length)
+        with torch.no_grad():
+            hidden = model(**inputs, output_hidden_states=True).hidden_states[-1]
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        vectors[chunk] = torch.nn.functional.normalize(pooled, dim=-1).float().numpy()
+
+    return vectors
+
+def fits_embedding(descriptions, max_length=EMBED_MAX_LENGTH):
+    # Whether embed_batch reads each description whole rather than its first `max_length` tokens
+    if not descriptions:
+        return []
+    _, tokenizer = load_model()
+    lengths = [len(ids) for ids in tokenizer([d or "" for d in descriptions])["input_ids"]]
+    return [length <= max_length for length in lengths]
+
+def label_from_logits(logits):
+    return label_mapping[max(range(len(logits)), key=logits.__getitem__)]
+
+def predict_logits_batch(descriptions, batch_size=PREDICT_BATCH_SIZE):
+    return _logits_batch(descriptions, batch_size)
+
+def predict_batch(descriptions, batch_size=PREDICT_BATCH_SIZE, model=None, tokenizer=None):
+    return [label_from_logits(row) for row in _logits_batch(descriptions, batch_size, model, tokenizer)]
+
+
+class MicroBatcher:
+    # Collects predict() calls from concurrent requests for up to `wait_ms` and runs them as one batch
+    def __init__(self, fn, max_batch=PREDICT_BATCH_SIZE, wait_ms=BATCH_WAIT_MS):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000
+        self.requests = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True, name="nlp-microbatcher")
+        self.worker.start()
+
+    def submit(self, item):
+        future = Future()
+        self.requests.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            # Wait briefly for more requests to arrive, but never past max_batch
+            deadline = time.monotonic() + self.wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                results = self.fn([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def _get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(_logits_batch)
+    return _batcher
+
+def predict_logits(description):
+    if BATCH_WAIT_MS > 0:
+        return _get_batcher()(description)
+    return _logits_batch([description])[0]
+
+def predict(description):
+    return label_from_logits(predict_logits(description))
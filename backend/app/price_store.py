@@ -0,0 +1,229 @@
+# price_store.py
+# Local store of daily closes so the 1-year average market cap doesn't need a full year of
+# history from upstream on every screen.
+#
+# Each ticker is one .npy file of (day, close, cumsum) rows, read memory-mapped. A sync only asks the
+# provider for the days from the last stored one on (it may have been stored mid-session and is
+# overwritten), and refreshes a small universe index holding the 1-year sum and count of closes per
+# ticker, so reading an average is O(1) and a whole universe is a single vectorized lookup. Processes sharing the directory (app/serve.py workers) re-read and rewrite
+# the index under a file lock, so one's sync doesn't drop another's entries.
+import os
+import threading
+from datetime import datetime, timezone
+import numpy as np
+from filelock import FileLock
+from app.metrics import CACHE_REQUESTS
+
+PRICE_STORE_DIR = os.getenv("PRICE_STORE_DIR", os.path.join(os.path.dirname(__file__), "price_store"))
+# The averaging window (yfinance's period="1y") and how much history to keep on disk
+WINDOW_DAYS = 365
+KEEP_DAYS = 2 * WINDOW_DAYS
+
+ROW = np.dtype([("day", "<i4"), ("close", "<f8"), ("cumsum", "<f8")])
+INDEX_FILE = "_index.npz"
+INDEX_LOCK_FILE = "_index.lock"
+
+
+def _today():
+    return int(np.datetime64(datetime.now(timezone.utc).date(), "D").astype(np.int64))
+
+def _day_string(day):
+    return str(np.datetime64(int(day), "D"))
+
+def _to_days(index):
+    # DatetimeIndex (possibly tz-aware, from yfinance) -> int days since 1970-01-01
+    if getattr(index, "tz", None) is not None:
+        index = index.tz_localize(None)
+    return np.asarray(index.values.astype("datetime64[D]").astype(np.int64), dtype=np.int64)
+
+
+class PriceStore:
+    def __init__(self, path=PRICE_STORE_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index_mtime = None
+        self._positions = {}
+        self._tickers = np.array([], dtype=str)
+        self._synced = np.array([], dtype=np.int64)
+        self._year_sum = np.array([], dtype=float)
+        self._year_count = np.array([], dtype=np.int64)
+
+    # --- per-ticker files ---
+
+    def _file(self, ticker):
+        return os.path.join(self.path, f"{ticker.replace('/', '_')}.npy")
+
+    def closes(self, ticker):
+        # Memory-mapped (day, close, cumsum) rows, empty if the ticker was never synced
+        file = self._file(ticker)
+        if not os.path.exists(file):
+            return np.empty(0, dtype=ROW)
+        return np.load(file, mmap_mode="r")
+
+    def _append(self, ticker, days, closes):
+        # Fetched closes replace what we hold from their first day on: the last stored close may have
+        # been taken mid-session, and the next sync asks for that day again to overwrite it
+        rows = np.array(self.closes(ticker))
+        keep = ~np.isnan(closes)
+        days, closes = days[keep], closes[keep]
+        if len(days) == 0:
+            return rows
+
+        order = np.argsort(days)
+        new = np.empty(len(days), dtype=ROW)
+        new["day"] = days[order]
+        new["close"] = closes[order]
+        rows = rows[rows["day"] < new["day"][0]]
+        base = float(rows["cumsum"][-1]) if len(rows) else 0.0
+        new["cumsum"] = base + np.cumsum(new["close"])
+
+        merged = np.concatenate([rows, new])
+        merged = merged[merged["day"] > merged["day"][-1] - KEEP_DAYS]
+        self._atomic_save(self._file(ticker), merged)
+        return merged
+
+    def _atomic_save(self, file, array):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = f"{file}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, file)
+
+    # --- universe index ---
+
+    def _index_path(self):
+        return os.path.join(self.path, INDEX_FILE)
+
+    def _load_index(self):
+        # Reload when another process has synced since we last looked
+        file = self._index_path()
+        mtime = os.path.getmtime(file) if os.path.exists(file) else None
+        if mtime == self._index_mtime:
+            return
+        if mtime is None:
+            tickers, synced, year_sum, year_count = [], [], [], []
+        else:
+            with np.load(file) as data:
+                tickers, synced = data["tickers"], data["synced"]
+                year_sum, year_count = data["year_sum"], data["year_count"]
+        self._tickers = np.asarray(tickers, dtype=str)
+        self._synced = np.asarray(synced, dtype=np.int64)
+        self._year_sum = np.asarray(year_sum, dtype=float)
+        self._year_count = np.asarray(year_count, dtype=np.int64)
+        self._positions = {t: i for i, t in enumerate(self._tickers)}
+        self._index_mtime = mtime
+
+    def _save_index(self):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = f"{self._index_path()}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, tickers=self._tickers, synced=self._synced,
+                     year_sum=self._year_sum, year_count=self._year_count)
+        os.replace(tmp, self._index_path())
+        self._index_mtime = os.path.getmtime(self._index_path())
+
+    def _set_window(self, ticker, rows, today):
+        # 1-year sum/count from the cumulative sums: two lookups instead of a pass over the year
+        if len(rows):
+            start = int(np.searchsorted(rows["day"], today - WINDOW_DAYS, side="left"))
+            before = float(rows["cumsum"][start - 1]) if start > 0 else 0.0
+            year_sum = float(rows["cumsum"][-1]) - before
+            year_count = len(rows) - start
+        else:
+            year_sum, year_count = 0.0, 0
+
+        i = self._positions.get(ticker)
+        if i is None:
+            self._positions[ticker] = len(self._tickers)
+            self._tickers = np.append(self._tickers, ticker)
+            self._synced = np.append(self._synced, today)
+            self._year_sum = np.append(self._year_sum, year_sum)
+            self._year_count = np.append(self._year_count, year_count)
+        else:
+            self._synced[i] = today
+            self._year_sum[i] = year_sum
+            self._year_count[i] = year_count
+
+    # --- public API ---
+
+    def sync(self, tickers, provider):
+        # Fetch only the closes each ticker is missing, at most once per day per ticker. The fetch runs
+        # without the lock, so screens syncing different tickers don't queue behind one round trip.
+        today = _today()
+        with self._lock:
+            self._load_index()
+            by_start = {}
+            for ticker in dict.fromkeys(tickers):
+                i = self._positions.get(ticker)
+                if i is not None and self._synced[i] >= today:
+                    CACHE_REQUESTS.inc(cache="price_store", result="hit")
+                    continue
+                CACHE_REQUESTS.inc(cache="price_store", result="miss" if i is None else "partial")
+                rows = self.closes(ticker)
+                # Brand new tickers get a full window, the rest start at their last close (see _append)
+                start = _day_string(int(rows["day"][-1])) if len(rows) else None
+                by_start.setdefault(start, []).append(ticker)
+
+        if not by_start:
+            return
+
+        fetched = {}
+        for start, group in by_start.items():
+            # Tickers sharing a start date (usually all of them) share one bulk request
+            try:
+                history = provider.get_price_history(group, period="1y", start=start)
+            except Exception as e:
+                print(f"[ERROR] Price history fetch failed for {', '.join(group)}: {e}")
+                continue
+            for ticker in group:
+                fetched[ticker] = history[ticker].dropna() if ticker in history.columns else None
+
+        with self._lock:
+            # Apply our tickers to the latest index, other processes may have saved theirs meanwhile
+            os.makedirs(self.path, exist_ok=True)
+            with FileLock(os.path.join(self.path, INDEX_LOCK_FILE)):
+                self._index_mtime = None
+                self._load_index()
+                for ticker, series in fetched.items():
+                    i = self._positions.get(ticker)
+                    if i is not None and self._synced[i] >= today:
+                        # Another thread or process synced it while we were fetching
+                        continue
+                    if series is not None:
+                        rows = self._append(ticker, _to_days(series.index), series.to_numpy(dtype=float))
+                    else:
+                        rows = np.array(self.closes(ticker))
+                    self._set_window(ticker, rows, today)
+                self._save_index()
+
+    def average_closes(self, tickers):
+        # 1-year average close per ticker as one array, NaN where we have no data
+        with self._lock:
+            self._load_index()
+            positions = np.array([self._positions.get(t, -1) for t in tickers], dtype=np.int64)
+            known = positions >= 0
+            sums = np.where(known, self._year_sum[positions] if len(self._tickers) else 0.0, 0.0)
+            counts = np.where(known, self._year_count[positions] if len(self._tickers) else 0, 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    def average_close(self, ticker):
+        value = self.average_closes([ticker])[0]
+        return None if np.isnan(value) else float(value)
+
+    def average_market_caps(self, tickers, shares_outstanding):
+        # Vectorized get_avg_market_cap for a whole universe, NaN where closes or shares are missing
+        shares = np.asarray([np.nan if s in (None, 0) else s for s in shares_outstanding], dtype=float)
+        return self.average_closes(tickers) * shares
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PriceStore()
+    return _store
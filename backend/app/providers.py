@@ -0,0 +1,439 @@
+# providers.py
+# Data sources behind the screeners. Every provider returns the same normalized shapes so
+# halal_screening / halal_screeningv2 don't care where the numbers come from:
+#
+#   profile    -> {"companyName", "sector", "industry", "marketCap", "beta", "summary", "sharesOutstanding"}
+#   statements -> {"date", "totalAssets", "totalDebt", "cashAndCashEquivalents", "shortTermInvestments",
+#                  "cashAndShortTermInvestments", "receivables", "totalRevenue", "interestIncome"}
+#   prices     -> DataFrame of daily closes, one column per ticker, indexed by date
+#   news       -> list of NewsAPI style article dicts
+import json
+import os
+import time
+from dotenv import load_dotenv
+from app.upstream import get_upstream
+
+load_dotenv()
+
+FMP_API_KEY = os.getenv("FMP_API_KEY")
+FMP_BASE_URL = "https://financialmodelingprep.com/api/v3"
+NEWS_API_KEY = os.getenv("NEWS_API_KEY")
+# Recorded responses for DATA_PROVIDER=fixtures. The committed set is a handful of tickers for tests and
+# benchmarks, record more with `python -m app.providers`.
+FIXTURE_DIR = os.getenv("FIXTURE_DIR", os.path.join(os.path.dirname(__file__), "fixtures"))
+# Simulated round trip per upstream request when replaying fixtures (benchmarks), 0 = instant
+FIXTURE_LATENCY_MS = float(os.getenv("FIXTURE_LATENCY_MS", "0"))
+
+# FMP accepts comma separated symbols, but caps how many per request
+FMP_PROFILE_CHUNK = 100
+FMP_HISTORY_CHUNK = 5
+
+
+def _http_get(url, upstream):
+    # Rate limited, retried and circuit-broken GET, see app/upstream.py
+    return get_upstream(upstream).get(url)
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _number(value):
+    # numpy/pandas scalars -> plain floats so results are JSON friendly
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _requested(tickers):
+    # Response symbol -> the ticker the caller asked for, FMP answers in its own (upper) case
+    requested = {t.upper(): t for t in tickers}
+    return lambda symbol: requested.get((symbol or "").upper(), symbol)
+
+def safe_lookup(df, keys):
+    """
+    Try to get the first matching key from a DataFrame row index.
+    Returns None if not found.
+    """
+    for key in keys:
+        if key in df.index:
+            return df.loc[key].iloc[0]
+    return None
+
+
+class TickerBundle:
+    # Everything screen_stock needs for one ticker, fetched once and shared by its consumers
+    def __init__(self, ticker, profile=None, statements=None, closes=None):
+        self.ticker = ticker
+        self.profile = profile        # normalized profile or None
+        self.statements = statements  # normalized statements or None
+        self.closes = closes          # Series of daily closes or None
+
+
+class DataProvider:
+    name = "base"
+
+    def get_profiles(self, tickers):
+        # -> {ticker: profile}, tickers that can't be found are left out
+        raise NotImplementedError
+
+    def get_statements(self, tickers):
+        # -> {ticker: statements}, tickers that can't be found are left out
+        raise NotImplementedError
+
+    def get_price_history(self, tickers, period="1y", start=None):
+        # -> DataFrame of daily closes, one column per ticker. `start` ("YYYY-MM-DD") overrides
+        # `period` so callers that already hold older closes only fetch the missing days.
+        raise NotImplementedError
+
+    def get_news(self, company_name, page_size=10, since=None):
+        # `since` (ISO 8601) limits the search to articles published from then on
+        url = (
+            f"https://newsapi.org/v2/everything?q={company_name}&language=en"
+            f"&sortBy=publishedAt&pageSize={page_size}&apiKey={NEWS_API_KEY}"
+        )
+        if since:
+            url += f"&from={since}"
+        response = _http_get(url, "newsapi")
+        if response.status_code != 200:
+            raise Exception(f"News API error: {response.status_code}")
+        return response.json().get("articles", [])
+
+    def get_bundles(self, tickers, period="1y", with_history=True):
+        # -> {ticker: TickerBundle}, using the bulk calls of each data class. Pass
+        # with_history=False when closes come from somewhere else (app/price_store.py).
+        tickers = list(tickers)
+        profiles = self.get_profiles(tickers)
+        statements = self.get_statements(tickers)
+        history = self.get_price_history(tickers, period) if with_history else None
+        return {
+            t: TickerBundle(t, profiles.get(t), statements.get(t),
+                            history[t].dropna() if history is not None and t in history.columns else None)
+            for t in tickers
+        }
+
+    def get_bundle(self, ticker, period="1y", with_history=True):
+        return self.get_bundles([ticker], period, with_history)[ticker]
+
+    def get_profile(self, ticker):
+        return self.get_profiles([ticker]).get(ticker)
+
+    def get_statement(self, ticker):
+        return self.get_statements([ticker]).get(ticker)
+
+
+class FMPProvider(DataProvider):
+    name = "fmp"
+
+    def get_profiles(self, tickers):
+        profiles = {}
+        for chunk in _chunks(list(tickers), FMP_PROFILE_CHUNK):
+            resp = _http_get(f"{FMP_BASE_URL}/profile/{','.join(chunk)}?apikey={FMP_API_KEY}", "fmp")
+            if resp.status_code != 200:
+                raise ValueError(f"Could not fetch profiles for {', '.join(chunk)}")
+            requested = _requested(chunk)
+            for data in resp.json() or []:
+                profiles[requested(data.get("symbol"))] = {
+                    "companyName": data.get("companyName"),
+                    "sector": data.get("sector"),
+                    "industry": data.get("industry"),
+                    "marketCap": data.get("mktCap"),
+                    "beta": data.get("beta"),
+                    "summary": data.get("description"),
+                    "sharesOutstanding": None,
+                }
+        return profiles
+
+    def get_statements(self, tickers):
+        # FMP has no bulk statement endpoint on our plan, so this is two calls per ticker
+        statements = {}
+        for ticker in tickers:
+            bs_resp = _http_get(f"{FMP_BASE_URL}/balance-sheet-statement/{ticker}?limit=1&apikey={FMP_API_KEY}", "fmp")
+            inc_resp = _http_get(f"{FMP_BASE_URL}/income-statement/{ticker}?limit=1&apikey={FMP_API_KEY}", "fmp")
+            if bs_resp.status_code != 200 or inc_resp.status_code != 200:
+                continue
+
+            bs_data = bs_resp.json()
+            inc_data = inc_resp.json()
+            if not bs_data or not inc_data:
+                continue
+
+            bs = bs_data[0]
+            inc = inc_data[0]
+            statements[ticker] = {
+                "date": bs.get("date", 0),
+                "totalAssets": bs.get("totalAssets"),
+                "totalDebt": bs.get("totalDebt", 0),
+                "cashAndCashEquivalents": bs.get("cashAndCashEquivalents", 0),
+                "shortTermInvestments": bs.get("shortTermInvestments", 0),
+                "cashAndShortTermInvestments": bs.get("cashAndShortTermInvestments"),
+                "receivables": bs.get("netReceivables"),
+                "totalRevenue": inc.get("revenue", 0),
+                "interestIncome": inc.get("interestIncome", 0),
+            }
+        return statements
+
+    def get_price_history(self, tickers, period="1y", start=None):
+        import pandas as pd
+
+        if start is None:
+            days = {"1mo": 31, "3mo": 92, "6mo": 183, "1y": 366, "2y": 731, "5y": 1827}.get(period, 366)
+            start = (pd.Timestamp.today() - pd.Timedelta(days=days)).strftime("%Y-%m-%d")
+        closes = {}
+        for chunk in _chunks(list(tickers), FMP_HISTORY_CHUNK):
+            resp = _http_get(
+                f"{FMP_BASE_URL}/historical-price-full/{','.join(chunk)}"
+                f"?serietype=line&from={start}&apikey={FMP_API_KEY}",
+                "fmp",
+            )
+            if resp.status_code != 200:
+                continue
+            data = resp.json() or {}
+            requested = _requested(chunk)
+            # A single symbol comes back bare, several come back wrapped in historicalStockList
+            for entry in data.get("historicalStockList", [data] if data.get("symbol") else []):
+                closes[requested(entry["symbol"])] = pd.Series(
+                    {row["date"]: row["close"] for row in entry.get("historical", [])}, dtype=float
+                )
+        return _price_frame(closes)
+
+
+class YFinanceProvider(DataProvider):
+    name = "yfinance"
+
+    def get_profiles(self, tickers):
+        import yfinance as yf
+
+        profiles = {}
+        for ticker in tickers:
+            profile = _yf_profile(get_upstream("yfinance").call(lambda: yf.Ticker(ticker).info))
+            if profile:
+                profiles[ticker] = profile
+        return profiles
+
+    def get_statements(self, tickers):
+        import yfinance as yf
+
+        statements = {}
+        for ticker in tickers:
+            data = yf.Ticker(ticker)
+            balance, income = get_upstream("yfinance").call(lambda: (data.balance_sheet, data.financials))
+            if balance is None or balance.empty:
+                continue
+            statements[ticker] = _yf_statements(balance, income)
+        return statements
+
+    def get_price_history(self, tickers, period="1y", start=None):
+        import pandas as pd
+        import yfinance as yf
+
+        tickers = list(tickers)
+        if not tickers:
+            return pd.DataFrame()
+        # One download for the whole list instead of a history() call per ticker
+        window = {"start": start} if start else {"period": period}
+        data = get_upstream("yfinance").call(
+            yf.download, tickers, interval="1d", auto_adjust=True,
+            group_by="column", progress=False, threads=True, **window,
+        )
+        if data is None or data.empty:
+            return pd.DataFrame(columns=tickers)
+        closes = data["Close"]
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(tickers[0])
+        return closes
+
+    def get_bundles(self, tickers, period="1y", with_history=True):
+        # One yf.Ticker per ticker so .info (the slowest call) is read once, and one
+        # yf.download for all the histories when there is more than one ticker
+        import yfinance as yf
+
+        tickers = list(tickers)
+        history = self.get_price_history(tickers, period) if with_history and len(tickers) > 1 else None
+        bundles = {}
+        for ticker in tickers:
+            bundle = TickerBundle(ticker)
+            try:
+                get_upstream("yfinance").call(self._fill_bundle, bundle, yf.Ticker(ticker), history, period, with_history)
+            except Exception as e:
+                print(f"[ERROR] yfinance fetch failed for {ticker}: {e}")
+            bundles[ticker] = bundle
+        return bundles
+
+    @staticmethod
+    def _fill_bundle(bundle, data, history, period, with_history):
+        bundle.profile = _yf_profile(data.info)
+        balance = data.balance_sheet
+        if balance is not None and not balance.empty:
+            bundle.statements = _yf_statements(balance, data.financials)
+        if not with_history:
+            closes = None
+        elif history is not None:
+            closes = history[bundle.ticker].dropna() if bundle.ticker in history.columns else None
+        else:
+            closes = data.history(period=period, interval="1d")["Close"]
+        bundle.closes = closes if closes is not None and not closes.empty else None
+
+
+def _yf_profile(info):
+    if not info or "longName" not in info:
+        return None
+    return {
+        "companyName": info.get("longName"),
+        "sector": info.get("sector"),
+        "industry": info.get("industry"),
+        "marketCap": info.get("marketCap"),
+        "beta": info.get("beta"),
+        "summary": info.get("longBusinessSummary"),
+        "sharesOutstanding": info.get("sharesOutstanding"),
+    }
+
+
+def _yf_statements(balance, income):
+    latest_date = balance.columns[0]
+    return {
+        "date": str(latest_date.date()) if latest_date is not None else None,
+        "totalAssets": _number(safe_lookup(balance, ["Total Assets"])),
+        "totalDebt": _number(safe_lookup(balance, ["Total Debt"])),
+        "cashAndCashEquivalents": _number(safe_lookup(balance, ["Cash And Cash Equivalents"])),
+        "shortTermInvestments": _number(safe_lookup(balance, ["Other Short Term Investments"])),
+        "cashAndShortTermInvestments": _number(safe_lookup(balance, [
+            "Cash Cash Equivalents And Short Term Investments",
+            "Cash And Cash Equivalents",
+            "Cash Equivalents",
+            "Other Short Term Investments"
+        ])),
+        "receivables": _number(safe_lookup(balance, ["Total Receivables Net", "Receivables"])),
+        "totalRevenue": _number(safe_lookup(income, ["Total Revenue", "Revenue"])),
+        "interestIncome": _number(safe_lookup(income, ["Interest Income", "Net Interest Income"])),
+    }
+
+def _price_frame(closes):
+    import pandas as pd
+
+    if not closes:
+        return pd.DataFrame()
+    frame = pd.DataFrame(closes)
+    frame.index = pd.to_datetime(frame.index)
+    return frame.sort_index()
+
+
+class FixtureProvider(DataProvider):
+    # Serves recorded data from FIXTURE_DIR, no network. Layout:
+    #   profiles.json   {ticker: profile}
+    #   statements.json {ticker: statements}
+    #   prices.json     {ticker: {"YYYY-MM-DD": close}}
+    #   news.json       {company name: [articles]}
+    # With latency_ms each call sleeps like the upstream request(s) it stands in for. Closes are moved
+    # forward so the last recorded one falls on yesterday, old recordings still fill a 1-year window.
+    name = "fixtures"
+
+    def __init__(self, path=FIXTURE_DIR, latency_ms=FIXTURE_LATENCY_MS):
+        self.path = path
+        self.latency = latency_ms / 1000
+        self._data = {}
+
+    def _wait(self, requests=1):
+        if self.latency > 0 and requests > 0:
+            time.sleep(self.latency * requests)
+
+    def _load(self, kind):
+        if kind not in self._data:
+            file = os.path.join(self.path, f"{kind}.json")
+            if os.path.exists(file):
+                with open(file, encoding="utf-8") as f:
+                    self._data[kind] = json.load(f)
+            else:
+                self._data[kind] = {}
+        return self._data[kind]
+
+    def get_profiles(self, tickers):
+        tickers = list(tickers)
+        # Same request counts as FMPProvider: profiles in chunks, statements per ticker
+        self._wait(len(list(_chunks(tickers, FMP_PROFILE_CHUNK))))
+        profiles = self._load("profiles")
+        return {t: profiles[t] for t in tickers if t in profiles}
+
+    def get_statements(self, tickers):
+        tickers = list(tickers)
+        self._wait(len(tickers))
+        statements = self._load("statements")
+        return {t: statements[t] for t in tickers if t in statements}
+
+    def get_price_history(self, tickers, period="1y", start=None):
+        import pandas as pd
+
+        tickers = list(tickers)
+        self._wait(1)
+        prices = self._load("prices")
+        frame = _price_frame({t: pd.Series(prices[t], dtype=float) for t in tickers if t in prices})
+        if not frame.empty:
+            frame.index = frame.index + self._price_shift()
+        if start and not frame.empty:
+            frame = frame[frame.index >= pd.Timestamp(start)]
+        return frame
+
+    def _price_shift(self):
+        # Days from the last recorded close (over all tickers) to yesterday, never backwards
+        import pandas as pd
+
+        if "price_shift" not in self._data:
+            last = max((max(series) for series in self._load("prices").values() if series), default=None)
+            yesterday = pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+            self._data["price_shift"] = max(yesterday - pd.Timestamp(last), pd.Timedelta(0)) if last else pd.Timedelta(0)
+        return self._data["price_shift"]
+
+    def get_news(self, company_name, page_size=10, since=None):
+        self._wait(1)
+        articles = self._load("news").get(company_name, [])
+        if since:
+            articles = [a for a in articles if (a.get("publishedAt") or "") >= since]
+        return articles[:page_size]
+
+
+def record_fixtures(provider, tickers, path=FIXTURE_DIR, period="1y"):
+    # Snapshot what `provider` returns for `tickers` into a FixtureProvider directory
+    os.makedirs(path, exist_ok=True)
+    profiles = provider.get_profiles(tickers)
+    statements = provider.get_statements(tickers)
+    history = provider.get_price_history(tickers, period)
+    prices = {
+        t: {str(d.date()): float(c) for d, c in history[t].dropna().items()}
+        for t in history.columns
+    }
+    news = {}
+    for profile in profiles.values():
+        name = profile.get("companyName")
+        if name:
+            try:
+                news[name] = provider.get_news(name)
+            except Exception as e:
+                print(f"[ERROR] News fetch failed for {name}: {e}")
+
+    for kind, data in [("profiles", profiles), ("statements", statements), ("prices", prices), ("news", news)]:
+        with open(os.path.join(path, f"{kind}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, default=str)
+
+
+PROVIDERS = {
+    FMPProvider.name: FMPProvider,
+    YFinanceProvider.name: YFinanceProvider,
+    FixtureProvider.name: FixtureProvider,
+}
+_instances = {}
+
+def get_provider(name):
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown data provider: {name}")
+    if name not in _instances:
+        _instances[name] = PROVIDERS[name]()
+    return _instances[name]
+
+
+if __name__ == "__main__":
+    # Record fixtures from a live provider, e.g. DATA_PROVIDER=yfinance python -m app.providers
+    source = get_provider(os.getenv("DATA_PROVIDER", "fmp"))
+    test_tickers = input("Enter tickers to record: ").split()
+    record_fixtures(source, test_tickers)
+    print(f"Recorded {len(test_tickers)} tickers from {source.name} into {FIXTURE_DIR}")
@@ -0,0 +1,89 @@
+# rescreen.py
+# Re-applies screening rulesets (app/rulesets.py) to the fundamentals already stored in halal_stocks,
+# with no calls to the data provider, to see what a change of methodology does to the whole universe:
+#
+#   cd backend && python -m app.rescreen                       # every ruleset, compared with the first
+#   python -m app.rescreen djim aaoifi --show 50 --csv out.csv
+#
+# Only the financial ratio screens are re-evaluated (no sector, news or NLP checks), and market cap is the
+# one stored with the row, where DJIM and S&P specify a trailing average. Nothing is written back.
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from app.db import stored_fundamentals
+from app.rulesets import RULESETS, get_ruleset, statement_quantities
+
+
+def rescreen(keys):
+    # (tickers, {ruleset key: Evaluation}), the stored statements are parsed once for all rulesets
+    start = time.perf_counter()
+    stocks = stored_fundamentals()
+    tickers = [s.ticker for s in stocks]
+    quantities = statement_quantities([s.financial_ratios for s in stocks], [s.market_cap for s in stocks])
+    print(f"[INFO] Loaded {len(stocks)} stocks in {time.perf_counter() - start:.2f}s")
+
+    evaluations = {}
+    for key in keys:
+        start = time.perf_counter()
+        evaluations[key] = get_ruleset(key).evaluate(quantities)
+        print(f"[INFO] {key}: screened in {(time.perf_counter() - start) * 1000:.1f}ms")
+    return tickers, evaluations
+
+def summary(evaluations):
+    rows = []
+    for key, evaluation in evaluations.items():
+        counts = pd.Series(evaluation.compliance()).value_counts()
+        rows.append({"ruleset": key, "name": evaluation.ruleset.name,
+                     **{c: int(counts.get(c, 0)) for c in ("Halal", "Doubtful", "Haram")}})
+    return pd.DataFrame(rows).set_index("ruleset")
+
+def changes(tickers, base, other):
+    # Stocks whose verdict differs between two evaluations, with the reasons under each
+    base_compliance, other_compliance = base.compliance(), other.compliance()
+    changed = np.flatnonzero(base_compliance != other_compliance)
+    return pd.DataFrame({
+        "ticker": np.asarray(tickers, dtype=object)[changed],
+        base.ruleset.key: base_compliance[changed],
+        other.ruleset.key: other_compliance[changed],
+        f"{base.ruleset.key}_reasons": base.reasons()[changed],
+        f"{other.ruleset.key}_reasons": other.reasons()[changed],
+    })
+
+def results_frame(tickers, evaluations):
+    # One row per stock: every ruleset's ratios, compliance and reasons
+    frame = pd.DataFrame({"ticker": tickers})
+    for key, evaluation in evaluations.items():
+        for j, ratio in enumerate(evaluation.ruleset.ratio_names):
+            frame[f"{key}_{ratio}"] = evaluation.ratios[:, j]
+        frame[f"{key}_compliance"] = evaluation.compliance()
+        frame[f"{key}_reasons"] = evaluation.reasons()
+    return frame
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-screen the stored fundamentals under other rulesets")
+    parser.add_argument("rulesets", nargs="*", default=list(RULESETS), help=f"Rulesets to apply (default: all of {', '.join(RULESETS)})")
+    parser.add_argument("--show", type=int, default=20, help="Changed stocks to list per ruleset")
+    parser.add_argument("--csv", help="Write every stock's ratios and verdicts here")
+    args = parser.parse_args()
+
+    unknown = [key for key in args.rulesets if key not in RULESETS]
+    if unknown:
+        parser.error(f"Unknown ruleset(s): {', '.join(unknown)}")
+
+    tickers, evaluations = rescreen(args.rulesets)
+    print(summary(evaluations).to_string())
+
+    base, *others = evaluations.values()
+    for other in others:
+        changed = changes(tickers, base, other)
+        print(f"\n{base.ruleset.key} -> {other.ruleset.key}: {len(changed)} verdicts change")
+        if len(changed):
+            print(pd.crosstab(changed[base.ruleset.key], changed[other.ruleset.key]).to_string())
+            if args.show:
+                print(changed.head(args.show).to_string(index=False))
+
+    if args.csv:
+        results_frame(tickers, evaluations).to_csv(args.csv, index=False)
+        print(f"\n[INFO] Wrote {len(tickers)} rows to {args.csv}")
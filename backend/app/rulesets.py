@@ -0,0 +1,194 @@
+# rulesets.py
+# Financial screening methodologies as data. A ruleset is a list of ratio rules over a few canonical
+# quantities of a company; it is compiled once into weight and limit arrays, so checking one stock or a
+# whole universe is the same couple of array operations. Both screeners use the configured ruleset
+# (SCREENING_RULESET), and `python -m app.rescreen` re-applies any of them to the stored fundamentals.
+#
+# A rule fails when its ratio is above "max" (the limit itself passes) or at or above "below". Numerator
+# items that weren't reported count as 0, unless the rule is "reported": a missing one then makes the
+# ratio missing, as does a missing or non-positive denominator. More rulesets (or overrides) can be given
+# as JSON in the same shape at RULESET_FILE.
+import json
+import os
+import numpy as np
+
+SCREENING_RULESET = os.getenv("SCREENING_RULESET", "aaoifi")
+RULESET_FILE = os.getenv("RULESET_FILE")
+
+QUANTITIES = ("debt", "cash", "receivables", "revenue", "interest_income", "market_cap", "total_assets")
+
+RULESETS = {
+    "aaoifi": {
+        "name": "AAOIFI Shariah Standard No. 21",
+        "rules": [
+            {"ratio": "debt_ratio", "label": "Debt ratio", "numerator": ["debt"], "denominator": "market_cap", "max": 0.30},
+            {"ratio": "cash_ratio", "label": "Cash ratio", "numerator": ["cash"], "denominator": "market_cap", "max": 0.30},
+            {"ratio": "interest_income_ratio", "label": "Interest income ratio", "numerator": ["interest_income"],
+             "denominator": "revenue", "max": 0.05, "reported": True},
+        ],
+    },
+    "djim": {
+        "name": "Dow Jones Islamic Market",
+        "rules": [
+            {"ratio": "debt_ratio", "label": "Debt ratio", "numerator": ["debt"], "denominator": "market_cap", "below": 0.33},
+            {"ratio": "cash_ratio", "label": "Cash ratio", "numerator": ["cash"], "denominator": "market_cap", "below": 0.33},
+            {"ratio": "receivables_ratio", "label": "Receivables ratio", "numerator": ["receivables"],
+             "denominator": "market_cap", "below": 0.33},
+        ],
+    },
+    "sp": {
+        "name": "S&P Shariah",
+        "rules": [
+            {"ratio": "debt_ratio", "label": "Debt ratio", "numerator": ["debt"], "denominator": "market_cap", "below": 0.33},
+            {"ratio": "cash_ratio", "label": "Cash ratio", "numerator": ["cash"], "denominator": "market_cap", "below": 0.33},
+            {"ratio": "liquid_assets_ratio", "label": "Cash and receivables ratio", "numerator": ["cash", "receivables"],
+             "denominator": "market_cap", "below": 0.49},
+            {"ratio": "interest_income_ratio", "label": "Interest income ratio", "numerator": ["interest_income"],
+             "denominator": "revenue", "below": 0.05, "reported": True},
+        ],
+    },
+}
+
+if RULESET_FILE and os.path.exists(RULESET_FILE):
+    with open(RULESET_FILE, encoding="utf-8") as f:
+        RULESETS.update(json.load(f))
+
+
+def _join(reasons, mask, addition, sep="; "):
+    # Append `addition` (a string, or one string per masked row) to the reasons of the masked rows
+    rows = np.flatnonzero(mask)
+    if rows.size:
+        current = reasons[rows]
+        prefix = np.where(current == "", current, np.char.add(current.astype(str), sep))
+        reasons[rows] = np.char.add(prefix.astype(str), addition)
+    return reasons
+
+def _percent(values):
+    # f"{x:.2%}"
+    return np.char.add(np.char.mod("%.2f", values * 100), "%")
+
+
+class Evaluation:
+    # Per-stock (rows) and per-rule (columns) results of Ruleset.evaluate
+    def __init__(self, ruleset, ratios, fails, missing):
+        self.ruleset = ruleset
+        self.ratios = ratios
+        self.fails = fails
+        self.missing = missing
+
+    @property
+    def haram(self):
+        return self.fails.any(axis=1)
+
+    def compliance(self):
+        # Halal / Doubtful (a ratio couldn't be computed) / Haram (a rule failed)
+        return np.where(self.haram, "Haram", np.where(self.missing.any(axis=1), "Doubtful", "Halal"))
+
+    def reasons(self, with_missing=True):
+        # "; " joined reasons per stock, in rule order
+        reasons = np.full(len(self.ratios), "", dtype=object)
+        for j, (label, suffix) in enumerate(zip(self.ruleset.labels, self.ruleset.suffixes)):
+            if with_missing:
+                reasons = _join(reasons, self.missing[:, j], f"{label} missing")
+            fails = self.fails[:, j]
+            values = self.ratios[fails, j]
+            reasons = _join(reasons, fails, np.char.add(np.char.add(f"{label} ", _percent(values)), suffix))
+        return reasons
+
+
+class Ruleset:
+    def __init__(self, key, spec):
+        rules = spec["rules"]
+        self.key = key
+        self.name = spec.get("name", key)
+        self.ratio_names = [rule["ratio"] for rule in rules]
+        self.labels = [rule.get("label", rule["ratio"]) for rule in rules]
+
+        # Numerator terms as a (rules, quantities) weight matrix, one denominator column per rule
+        self.weights = np.zeros((len(rules), len(QUANTITIES)))
+        for i, rule in enumerate(rules):
+            for name in rule["numerator"]:
+                self.weights[i, QUANTITIES.index(name)] = 1.0
+        self.denominators = np.array([QUANTITIES.index(rule["denominator"]) for rule in rules], dtype=np.int64)
+        self.reported = np.array([bool(rule.get("reported")) for rule in rules])
+        self.at_limit_fails = np.array(["below" in rule for rule in rules])
+        self.limits = np.array([rule["below"] if "below" in rule else rule["max"] for rule in rules], dtype=float)
+        self.suffixes = [f" {'≥' if strict else '>'} {limit * 100:g}%" for strict, limit in zip(self.at_limit_fails, self.limits)]
+
+    def evaluate(self, quantities):
+        # quantities: (stocks, len(QUANTITIES)) float array, NaN where not reported
+        quantities = np.atleast_2d(np.asarray(quantities, dtype=float))
+        unreported = np.isnan(quantities)
+        numerators = np.nan_to_num(quantities) @ self.weights.T
+        missing_terms = (unreported.astype(float) @ self.weights.T > 0) & self.reported
+        denominators = quantities[:, self.denominators]
+        valid = (denominators > 0) & ~missing_terms
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratios = np.where(valid, numerators / np.where(valid, denominators, 1.0), np.nan)
+        missing = np.isnan(ratios)
+        fails = ~missing & np.where(self.at_limit_fails, ratios >= self.limits, ratios > self.limits)
+        return Evaluation(self, ratios, fails, missing)
+
+    def check(self, quantities, with_missing=True):
+        # One stock: (haram, missing, reasons list, {ratio name: value or None})
+        evaluation = self.evaluate(quantities)
+        reasons = evaluation.reasons(with_missing)[0]
+        ratios = {name: (None if np.isnan(value) else float(value))
+                  for name, value in zip(self.ratio_names, evaluation.ratios[0])}
+        return bool(evaluation.haram[0]), bool(evaluation.missing[0].any()), reasons.split("; ") if reasons else [], ratios
+
+
+_compiled = {}
+
+def get_ruleset(key=None):
+    # Compiled once per process. Raises KeyError for an unknown ruleset.
+    key = key or SCREENING_RULESET
+    if key not in _compiled:
+        _compiled[key] = Ruleset(key, RULESETS[key])
+    return _compiled[key]
+
+
+# --- inputs ---
+
+def _number(value):
+    try:
+        return float(value) if value is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+def _numbers(values):
+    # Numbers with None and junk as NaN
+    return np.array([_number(v) for v in values], dtype=float)
+
+def statement_quantities(statements, market_caps):
+    """
+    Quantities from halal_screening's raw statements (the financial_ratios JSON stored in halal_stocks)
+    and market caps, one row per stock.
+    """
+    def field(name):
+        return _numbers((s or {}).get(name) for s in statements)
+
+    cash_parts = np.column_stack([field("cashAndCashEquivalents"), field("shortTermInvestments")])
+    # Cash and short-term investments together, NaN only if neither was reported
+    cash = np.where(np.isnan(cash_parts).all(axis=1), np.nan, np.nansum(cash_parts, axis=1))
+    return np.column_stack([
+        field("totalDebt"),
+        cash,
+        field("receivables"),
+        field("totalRevenue"),
+        field("interestIncome"),
+        _numbers(market_caps),
+        field("totalAssets"),
+    ])
+
+def financials_quantities(financials, market_cap):
+    # Quantities for one stock from halal_screeningv2.fetch_financial_statements and its average market cap
+    return _numbers([
+        financials.get("total_debt"),
+        financials.get("cash_total"),
+        financials.get("receivables"),
+        financials.get("revenue"),
+        financials.get("interest_income"),
+        market_cap,
+        financials.get("total_assets"),
+    ])[None, :]
@@ -0,0 +1,155 @@
+# serve.py
+# Production serving with several worker processes:
+#
+#   cd backend && python -m app.serve --workers 4 --port 8000
+#
+# Pre-fork: the parent imports the app, creates the tables, loads the NLP model (and the cascade's first
+# stage) and the shared cache tier (app/shared_cache.py), opens the listening socket and only then forks
+# the workers. Model weights are never written after loading, so their pages stay shared copy-on-write and
+# each extra worker costs its own heap rather than another copy of BERT. Running `uvicorn --workers`
+# instead spawns fresh interpreters that each load the model and get no shared cache.
+#
+# The parent restarts workers that die, and stops them all on SIGINT/SIGTERM. Screening jobs are claimed
+# per process, a dead worker's jobs are taken over by the others (app/jobs.py). Without os.fork (Windows)
+# it serves from a single process.
+import argparse
+import gc
+import os
+import signal
+import socket
+import time
+
+# Upstream rate limits (UPSTREAM_*_RATE / _BURST) are totals, split evenly between the workers
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))
+SERVE_CACHE_MB = int(os.getenv("SHARED_CACHE_MB", "64"))
+# A worker that dies sooner than this after starting is treated as a startup error, not restarted
+MIN_WORKER_UPTIME = 5.0
+
+
+def _split_upstream_limits(workers):
+    # Token buckets are per process (app/upstream.py), so each worker gets its share of every upstream's
+    # rate and burst and together they stay within the configured quota. A busy worker can't borrow an
+    # idle one's share.
+    from app.upstream import UPSTREAM_DEFAULTS
+
+    for name, (rate, burst, _) in UPSTREAM_DEFAULTS.items():
+        prefix = f"UPSTREAM_{name.upper()}_"
+        os.environ[prefix + "RATE"] = str(float(os.getenv(prefix + "RATE", rate)) / workers)
+        os.environ[prefix + "BURST"] = str(max(1, int(os.getenv(prefix + "BURST", burst)) // workers))
+
+def _preload():
+    # Everything the workers should inherit rather than build themselves
+    from app import main, nlp_cascade, nlp_model, shared_cache
+    from app.db import engine, init_db
+
+    shared_cache.create(SERVE_CACHE_MB)
+    init_db()
+    if main.PRELOAD_MODEL:
+        start = time.perf_counter()
+        # Weights only: no forward pass here, so no torch thread pool exists to be broken by fork()
+        nlp_model.load_model()
+        if nlp_cascade.is_enabled():
+            nlp_cascade.load_classifier()
+        print(f"[INFO] NLP model loaded in {time.perf_counter() - start:.2f}s, shared by all workers")
+    # Connections opened above must not be shared between processes
+    engine.dispose()
+    # Keep the collector from touching (and so copying) every object loaded so far in each worker
+    gc.collect()
+    gc.freeze()
+    return main.app
+
+def _listen(host, port):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def _run_worker(app, sock, worker_id, log_level):
+    import uvicorn
+    from app.db import engine
+
+    os.environ["SERVE_WORKER_ID"] = str(worker_id)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Drop pooled connections inherited from the parent without closing them under its feet
+    engine.dispose(close=False)
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level, lifespan="on"))
+    server.run(sockets=[sock])
+
+def _fork_worker(app, sock, worker_id, log_level):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(app, sock, worker_id, log_level)
+        except BaseException as e:
+            print(f"[ERROR] Worker {worker_id} crashed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+def serve(host="0.0.0.0", port=8000, workers=SERVE_WORKERS, log_level="info"):
+    import uvicorn  # noqa: F401, fail here rather than in every worker
+
+    workers = max(1, workers)
+    # Split the cores between the workers unless the thread pools are configured explicitly
+    if "NLP_INTRA_OP_THREADS" not in os.environ:
+        os.environ["NLP_INTRA_OP_THREADS"] = str(max(1, (os.cpu_count() or 1) // workers))
+    if hasattr(os, "fork"):
+        _split_upstream_limits(workers)
+
+    app = _preload()
+    sock = _listen(host, port)
+    if not hasattr(os, "fork") or workers == 1:
+        if workers > 1:
+            print("[WARN] os.fork is not available, serving from a single process")
+        _run_worker(app, sock, 0, log_level)
+        return
+
+    children = {_fork_worker(app, sock, i, log_level): (i, time.monotonic()) for i in range(workers)}
+    print(f"[INFO] Serving on {host}:{port} with {workers} workers")
+    stopping = False
+
+    def stop(signum=None, frame=None):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        worker = children.pop(pid, None)
+        if worker is None or stopping:
+            continue
+        worker_id, started = worker
+        if time.monotonic() - started < MIN_WORKER_UPTIME:
+            print(f"[ERROR] Worker {worker_id} (pid {pid}) failed on startup with status {status}, stopping")
+            stop()
+            continue
+        print(f"[WARN] Worker {worker_id} (pid {pid}) exited with status {status}, restarting it")
+        time.sleep(1)
+        children[_fork_worker(app, sock, worker_id, log_level)] = (worker_id, time.monotonic())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked worker processes")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.log_level)
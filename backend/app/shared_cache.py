@@ -0,0 +1,147 @@
+# shared_cache.py
+# Cross-process cache tier in front of the halal_stocks table for the pre-forked workers of app/serve.py.
+# The parent maps an anonymous shared memory region before forking, so every worker reads and writes the
+# same table: a row screened by one worker is a memory lookup in all of them instead of a DB query.
+#
+# The region is a fixed array of SLOT_SIZE slots, a key hashes to a slot and probes a few neighbours.
+# Writers take one cross-process lock, readers take none: each slot carries a sequence number that is odd
+# while it is being written, and a read that sees it change retries or counts as a miss. A full
+# neighbourhood evicts the live entry closest to expiry. Deleting leaves an empty tombstone, so a worker
+# that loaded the row from the DB before it was invalidated can't put the old version back; a put never
+# evicts a tombstone for that reason; if only tombstones are left the value just isn't cached.
+#
+#   SHARED_CACHE_MB   size of the region (app/serve.py defaults to 64, off for a plain uvicorn run)
+#   SHARED_CACHE_TTL  seconds an entry is served, bounds staleness from writers outside this process group
+import mmap
+import multiprocessing
+import os
+import struct
+import threading
+import time
+import zlib
+
+SHARED_CACHE_MB = int(os.getenv("SHARED_CACHE_MB", "0"))
+SHARED_CACHE_TTL = float(os.getenv("SHARED_CACHE_TTL", "60"))
+SLOT_SIZE = 4096
+PROBE = 8
+
+# seq, key hash, expires at (wall clock, shared by all processes), key length, value length
+HEADER = struct.Struct("<IIdHI")
+MAX_KEY = 64
+MAX_VALUE = SLOT_SIZE - HEADER.size - MAX_KEY
+
+
+class SharedCache:
+    def __init__(self, size_mb, ttl=SHARED_CACHE_TTL):
+        self.slots = max(PROBE, size_mb * 1024 * 1024 // SLOT_SIZE)
+        self.ttl = ttl
+        # Anonymous and MAP_SHARED, so forked children see the same pages
+        self.buffer = mmap.mmap(-1, self.slots * SLOT_SIZE)
+        self.lock = multiprocessing.Lock()
+
+    def _positions(self, key_hash):
+        start = key_hash % self.slots
+        return [(start + i) % self.slots * SLOT_SIZE for i in range(PROBE)]
+
+    def _read(self, offset, key, key_hash):
+        # The value stored at this slot for `key`, None if it holds something else, expired or was torn
+        for _ in range(3):
+            seq, slot_hash, expires, key_len, value_len = HEADER.unpack_from(self.buffer, offset)
+            if seq & 1:
+                continue
+            if slot_hash != key_hash or expires < time.time():
+                return None
+            start = offset + HEADER.size
+            stored_key = self.buffer[start:start + key_len]
+            value = self.buffer[start + MAX_KEY:start + MAX_KEY + value_len]
+            if HEADER.unpack_from(self.buffer, offset)[0] == seq:
+                return value if stored_key == key else None
+        return None
+
+    def get(self, key):
+        encoded = key.encode()
+        key_hash = zlib.crc32(encoded)
+        for offset in self._positions(key_hash):
+            value = self._read(offset, encoded, key_hash)
+            if value:
+                return value
+        return None
+
+    def _write(self, offset, key_hash, key, value, expires):
+        seq = HEADER.unpack_from(self.buffer, offset)[0]
+        struct.pack_into("<I", self.buffer, offset, seq + 1)
+        start = offset + HEADER.size
+        self.buffer[start:start + len(key)] = key
+        self.buffer[start + MAX_KEY:start + MAX_KEY + len(value)] = value
+        HEADER.pack_into(self.buffer, offset, seq + 2, key_hash, expires, len(key), len(value))
+
+    def put(self, key, value, loaded_at=None):
+        # `loaded_at` is when the value was read from the source, it is dropped if the key was deleted
+        # since. Values that don't fit a slot are simply not cached.
+        encoded = key.encode()
+        if not value or len(encoded) > MAX_KEY or len(value) > MAX_VALUE:
+            return False
+        key_hash = zlib.crc32(encoded)
+        now = time.time()
+        with self.lock:
+            # Same key, else a free or expired slot, else the live entry expiring soonest
+            target, found, live, _ = self._slot(encoded, key_hash, now)
+            if found:
+                _, _, expires, _, value_len = HEADER.unpack_from(self.buffer, target)
+                if value_len == 0 and loaded_at is not None and expires - self.ttl >= loaded_at:
+                    return False
+            target = target if target is not None else live
+            if target is None:
+                return False
+            self._write(target, key_hash, encoded, value, now + self.ttl)
+        return True
+
+    def _slot(self, encoded, key_hash, now):
+        # (slot holding the key or else a free or expired one, whether it holds the key, soonest expiring
+        # live entry, soonest expiring tombstone) in the key's neighbourhood, None where there is none
+        target, live, tombstone = None, None, None
+        for offset in self._positions(key_hash):
+            _, slot_hash, expires, key_len, value_len = HEADER.unpack_from(self.buffer, offset)
+            start = offset + HEADER.size
+            if slot_hash == key_hash and self.buffer[start:start + key_len] == encoded:
+                return offset, True, None, None
+            if expires < now:
+                if target is None:
+                    target = offset
+            elif value_len == 0:
+                if tombstone is None or expires < tombstone[1]:
+                    tombstone = (offset, expires)
+            elif live is None or expires < live[1]:
+                live = (offset, expires)
+        return target, False, live and live[0], tombstone and tombstone[0]
+
+    def delete(self, keys):
+        # Tombstones live as long as an entry would, cached keys are overwritten in place
+        now = time.time()
+        with self.lock:
+            for key in keys:
+                encoded = key.encode()
+                key_hash = zlib.crc32(encoded)
+                # The key's slot or a free one, else a live entry makes room (another tombstone only as
+                # a last resort): an uncached key still needs its tombstone against late puts
+                target, _, live, tombstone = self._slot(encoded, key_hash, now)
+                target = next((t for t in (target, live, tombstone) if t is not None), None)
+                if target is not None:
+                    self._write(target, key_hash, encoded, b"", now + self.ttl)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def create(size_mb=SHARED_CACHE_MB, ttl=SHARED_CACHE_TTL):
+    # Called by the serving parent before it forks, or lazily for a single process with SHARED_CACHE_MB set
+    global _cache
+    _cache = SharedCache(size_mb, ttl) if size_mb > 0 else None
+    return _cache
+
+def get_cache():
+    if _cache is None and SHARED_CACHE_MB > 0:
+        with _cache_lock:
+            if _cache is None:
+                create()
+    return _cache
@@ -0,0 +1,36 @@
+# singleflight.py
+# Deduplicates concurrent calls: while a call for a key is in flight, other callers with the same key
+# wait for it and get its result (or its exception) instead of running the work again.
+import threading
+from concurrent.futures import Future
+from app.metrics import COALESCED_CALLS
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            COALESCED_CALLS.inc(name=self.name)
+            return call.result()
+
+        try:
+            result = fn(*args, **kwargs)
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            # The next call after this one starts fresh (and will normally hit the cache)
+            with self._lock:
+                del self._calls[key]
@@ -1,12 +1,25 @@
-import pandas as pd
 import os
+import argparse
 from dotenv import load_dotenv
-from sklearn.model_selection import train_test_split
-from datasets import Dataset
-from transformers import BertTokenizer, BertForSequenceClassification, Trainer, TrainingArguments
+from datasets import Dataset, load_dataset
+from transformers import BertTokenizer, BertForSequenceClassification, DataCollatorWithPadding, Trainer, TrainingArguments
 
 load_dotenv()
 model_path = os.getenv("MODEL_PATH")
+# Where `--distill` saves the smaller student model, serve it with NLP_MODEL_PATH
+distilled_model_path = os.getenv("DISTILLED_MODEL_PATH") or (f"{model_path}-distilled" if model_path else None)
+STUDENT_BASE = "distilbert-base-uncased"
+# Where `--cascade` saves the TF-IDF first stage that app/nlp_cascade.py puts in front of BERT
+cascade_model_path = os.getenv("NLP_CASCADE_PATH") or (f"{model_path}-cascade.joblib" if model_path else None)
+
+# Labelled corpus to train on, a CSV or JSON Lines file with description and label columns.
+# Without one the sample data below is used.
+training_data_path = os.getenv("TRAINING_DATA")
+
+# Fixed so the benchmarks see the same validation set as training did
+SPLIT_SEED = 42
+# Descriptions are truncated to this many tokens, batches are only padded to their longest one
+MAX_LENGTH = int(os.getenv("TRAIN_MAX_LENGTH", "512"))
 
 # Sample data (replace with your actual dataset)
 data = [
@@ -74,62 +87,189 @@ data = [
 ]
 
 
+# Map labels to integers
+label_mapping = {'halal': 0, 'non-halal': 1, 'doubtful': 2}
 
-# Create DataFrame
-df = pd.DataFrame(data)
+def load_corpus(path=None):
+    # A corpus file is converted to Arrow once (cached by `datasets`) and memory-mapped from then on,
+    # so tokenizing and batching read it from disk in chunks instead of holding it in memory
+    if not path:
+        return Dataset.from_list(data)
+    file_format = "json" if path.endswith((".jsonl", ".json")) else "csv"
+    return load_dataset(file_format, data_files=path, split="train")
 
-# Split data into train and validation
-train_df, val_df = train_test_split(df, test_size=0.2)
+def split_corpus(path=None):
+    return load_corpus(path).train_test_split(test_size=0.2, seed=SPLIT_SEED)
 
-# Convert to Hugging Face Dataset format
-train_dataset = Dataset.from_pandas(train_df)
-val_dataset = Dataset.from_pandas(val_df)
+def get_splits(path=training_data_path):
+    # Train and validation DataFrames, for the benchmarks
+    splits = split_corpus(path)
+    return splits["train"].to_pandas(), splits["test"].to_pandas()
 
-# Map labels to integers
-label_mapping = {'halal': 0, 'non-halal': 1, 'doubtful': 2}
-train_dataset = train_dataset.map(lambda e: {'label': label_mapping[e['label']]}, remove_columns=['label'])
-val_dataset = val_dataset.map(lambda e: {'label': label_mapping[e['label']]}, remove_columns=['label'])
-
-# Tokenizer
-tokenizer = BertTokenizer.from_pretrained("bert-base-uncased")
-
-# Tokenize the data
-def tokenize_function(examples):
-    return tokenizer(examples["description"], padding="max_length", truncation=True, max_length=512)
-
-train_dataset = train_dataset.map(tokenize_function, batched=True)
-val_dataset = val_dataset.map(tokenize_function, batched=True)
-
-# Load pre-trained BERT model
-model = BertForSequenceClassification.from_pretrained("bert-base-uncased", num_labels=3)
-
-# Set up TrainingArguments
-training_args = TrainingArguments(
-    output_dir="./results",          # output directory
-    num_train_epochs=10,              # number of epochs
-    per_device_train_batch_size=8,   # batch size for training
-    per_device_eval_batch_size=8,    # batch size for evaluation
-    weight_decay=0.01,               # strength of weight decay
-    logging_dir="./logs",            # logging directory
-    logging_steps=100,               # number of steps to log
-    save_steps=500,                  # how often to save the model
-    save_total_limit=2,              # number of saved models to keep
-)
-
-# Initialize the Trainer
-trainer = Trainer(
-    model=model,                         # the instantiated 🤗 Transformers model to be trained
-    args=training_args,                  # training arguments, defined above
-    train_dataset=train_dataset,         # training dataset
-    eval_dataset=val_dataset             # evaluation dataset
-)
-
-eval_results = trainer.evaluate()
-print(f"Evaluation results: {eval_results}")
-
-# Train the model
-trainer.train()
-
-# Save the trained model and tokenizer
-model.save_pretrained(model_path)
-tokenizer.save_pretrained(model_path)
+def build_datasets(tokenizer, path=training_data_path, max_length=MAX_LENGTH, num_proc=None):
+    splits = split_corpus(path)
+
+    # Tokenize without padding, DataCollatorWithPadding pads each batch to its own longest description
+    def encode(examples):
+        encoded = tokenizer(examples["description"], truncation=True, max_length=max_length)
+        encoded["label"] = [label_mapping[label] for label in examples["label"]]
+        return encoded
+
+    splits = splits.map(encode, batched=True, remove_columns=splits["train"].column_names, num_proc=num_proc)
+    return splits["train"], splits["test"]
+
+def training_arguments(output_dir="./results", epochs=10, batch_size=8, grad_accum=1, bf16=False):
+    import torch
+
+    # Set up TrainingArguments
+    return TrainingArguments(
+        output_dir=output_dir,           # output directory
+        num_train_epochs=epochs,         # number of epochs
+        per_device_train_batch_size=batch_size,  # batch size for training
+        per_device_eval_batch_size=batch_size,   # batch size for evaluation
+        gradient_accumulation_steps=grad_accum,  # batches per optimizer step, a larger effective batch on CPU
+        group_by_length=True,            # batch descriptions of similar length together so little is padded
+        bf16=bf16,                       # bfloat16 autocast, fast on CPUs with AVX512-BF16 / AMX
+        use_cpu=bf16 and not torch.cuda.is_available(),  # transformers only allows CPU bf16 when asked for
+        weight_decay=0.01,               # strength of weight decay
+        logging_dir="./logs",            # logging directory
+        logging_steps=100,               # number of steps to log
+        save_steps=500,                  # how often to save the model
+        save_total_limit=2,              # number of saved models to keep
+        report_to="none",
+    )
+
+def report_throughput(train_result, eval_results):
+    metrics = train_result.metrics
+    print(f"Trained in {metrics['train_runtime']:.1f}s: {metrics['train_samples_per_second']:.1f} samples/s, "
+          f"{metrics['train_steps_per_second']:.2f} steps/s")
+    print(f"Evaluation results: {eval_results}")
+
+def train(path=training_data_path, num_proc=None, **options):
+    # Tokenizer
+    tokenizer = BertTokenizer.from_pretrained("bert-base-uncased")
+    train_dataset, val_dataset = build_datasets(tokenizer, path, num_proc=num_proc)
+
+    # Load pre-trained BERT model
+    model = BertForSequenceClassification.from_pretrained("bert-base-uncased", num_labels=3)
+
+    # Initialize the Trainer
+    trainer = Trainer(
+        model=model,                         # the instantiated 🤗 Transformers model to be trained
+        args=training_arguments(**options),  # training arguments, defined above
+        train_dataset=train_dataset,         # training dataset
+        eval_dataset=val_dataset,            # evaluation dataset
+        data_collator=DataCollatorWithPadding(tokenizer),  # pads each batch to its longest example
+    )
+
+    # Train the model
+    train_result = trainer.train()
+    report_throughput(train_result, trainer.evaluate())
+
+    # Save the trained model and tokenizer
+    model.save_pretrained(model_path)
+    tokenizer.save_pretrained(model_path)
+
+
+class DistillationTrainer(Trainer):
+    # Trains the student on a mix of the true labels and the teacher's softened predictions
+    def __init__(self, *args, teacher=None, temperature=2.0, alpha=0.5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.teacher = teacher.to(self.args.device).eval()
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def compute_loss(self, model, inputs, return_outputs=False, **kwargs):
+        import torch
+        import torch.nn.functional as F
+
+        outputs = model(**inputs)
+        with torch.no_grad():
+            teacher_logits = self.teacher(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]).logits
+
+        t = self.temperature
+        distill_loss = F.kl_div(
+            F.log_softmax(outputs.logits / t, dim=-1),
+            F.softmax(teacher_logits / t, dim=-1),
+            reduction="batchmean",
+        ) * t * t
+        loss = self.alpha * outputs.loss + (1 - self.alpha) * distill_loss
+        return (loss, outputs) if return_outputs else loss
+
+def distill(temperature=2.0, alpha=0.5, path=training_data_path, num_proc=None, **options):
+    # DistilBERT student taught by the fine-tuned BERT at MODEL_PATH. DistilBERT uses the
+    # bert-base-uncased vocabulary, so one tokenization feeds both models.
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    tokenizer = AutoTokenizer.from_pretrained(STUDENT_BASE)
+    train_dataset, val_dataset = build_datasets(tokenizer, path, num_proc=num_proc)
+
+    teacher = BertForSequenceClassification.from_pretrained(model_path)
+    student = AutoModelForSequenceClassification.from_pretrained(STUDENT_BASE, num_labels=3)
+
+    trainer = DistillationTrainer(
+        model=student,
+        args=training_arguments("./results-distilled", **options),
+        train_dataset=train_dataset,
+        eval_dataset=val_dataset,
+        data_collator=DataCollatorWithPadding(tokenizer),
+        teacher=teacher,
+        temperature=temperature,
+        alpha=alpha,
+    )
+    train_result = trainer.train()
+    report_throughput(train_result, trainer.evaluate())
+
+    student.save_pretrained(distilled_model_path)
+    tokenizer.save_pretrained(distilled_model_path)
+
+
+def build_cascade_classifier():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    # Word unigrams and bigrams, so "non-alcoholic" and "halal-certified" don't read like their opposites
+    return make_pipeline(
+        TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=1),
+        LogisticRegression(max_iter=1000, C=10.0),
+    )
+
+def train_cascade(path=training_data_path):
+    # Fits in seconds even on a large corpus, see benchmarks/nlp_cascade.py for picking the threshold
+    import joblib
+
+    train_df, val_df = get_splits(path)
+    classifier = build_cascade_classifier()
+    classifier.fit(train_df["description"], train_df["label"])
+    print(f"Validation accuracy: {classifier.score(val_df['description'], val_df['label']):.3f}")
+
+    joblib.dump(classifier, cascade_model_path)
+    print(f"Saved to {cascade_model_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fine-tune the halal business classifier")
+    parser.add_argument("--distill", action="store_true",
+                        help="train a DistilBERT student from the model at MODEL_PATH into DISTILLED_MODEL_PATH")
+    parser.add_argument("--cascade", action="store_true",
+                        help="train the TF-IDF first-stage classifier into NLP_CASCADE_PATH")
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--alpha", type=float, default=0.5, help="weight of the true-label loss vs the teacher loss")
+    parser.add_argument("--data", default=training_data_path,
+                        help="CSV or JSON Lines corpus with description and label columns (default: TRAINING_DATA or the sample data)")
+    parser.add_argument("--epochs", type=float, default=10)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--grad-accum", type=int, default=1, help="batches accumulated per optimizer step")
+    parser.add_argument("--bf16", action="store_true", help="train under bfloat16 autocast")
+    parser.add_argument("--num-proc", type=int, default=None, help="processes used to tokenize the corpus")
+    args = parser.parse_args()
+
+    options = dict(path=args.data, num_proc=args.num_proc, epochs=args.epochs, batch_size=args.batch_size,
+                   grad_accum=args.grad_accum, bf16=args.bf16)
+    if args.cascade:
+        train_cascade(args.data)
+    elif args.distill:
+        distill(args.temperature, args.alpha, **options)
+    else:
+        train(**options)
@@ -0,0 +1,28 @@
+# universes.py
+# Named ticker lists the screeners can be pointed at. "default" is the list /stocks-screener has
+# always used. More can be added in a JSON file of {name: [tickers]} at UNIVERSE_FILE.
+import json
+import os
+
+UNIVERSE_FILE = os.getenv("UNIVERSE_FILE")
+
+UNIVERSES = {
+    "default": ["AAPL", "MSFT", "TSLA", "JPM", "KO", "NVDA", "META", "MKDW"],
+}
+
+if UNIVERSE_FILE and os.path.exists(UNIVERSE_FILE):
+    with open(UNIVERSE_FILE, encoding="utf-8") as f:
+        UNIVERSES.update(json.load(f))
+
+
+def parse_tickers(text):
+    # "aapl, MSFT msft" -> ["AAPL", "MSFT"]
+    return list(dict.fromkeys(t.strip().upper() for t in text.replace(",", " ").split() if t.strip()))
+
+def resolve_tickers(tickers=None, universe=None):
+    # Explicit tickers win, otherwise the named universe. Raises KeyError for an unknown universe.
+    if tickers:
+        if isinstance(tickers, str):
+            return parse_tickers(tickers)
+        return list(dict.fromkeys(t.strip().upper() for t in tickers if t.strip()))
+    return list(UNIVERSES[universe or "default"])
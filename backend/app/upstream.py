@@ -0,0 +1,215 @@
+# upstream.py
+# Guard rails for the upstream APIs (FMP, NewsAPI, yfinance). Each one gets a token bucket sized to
+# our plan quota, bounded timeouts, jittered exponential retries on 429/5xx and network errors, and
+# a circuit breaker that fails fast while it is down. HTTP calls share one pooled requests session.
+#
+# Limits are per process (app/serve.py splits them between its workers) and configurable per upstream,
+# e.g. UPSTREAM_FMP_RATE=5 (requests per second), UPSTREAM_FMP_BURST=10, UPSTREAM_FMP_RETRIES=3.
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from app.metrics import UPSTREAM_REQUESTS, UPSTREAM_SECONDS
+
+# Connections kept per host by the shared session, should cover SCREEN_CONCURRENCY
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+# (connect, read) seconds
+HTTP_TIMEOUT = (float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05")), float(os.getenv("HTTP_READ_TIMEOUT", "15")))
+
+# Defaults per upstream: requests per second, burst, retries
+UPSTREAM_DEFAULTS = {
+    "fmp": (5.0, 10, 3),        # 300 calls/minute plan
+    "newsapi": (1.0, 5, 2),     # NewsAPI is the tightest quota, see app/news_store.py
+    "yfinance": (2.0, 5, 2),
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Failures of the transport rather than of the request: retried and counted by the circuit breaker.
+# curl_cffi's errors (yfinance's HTTP client) are OSErrors.
+TRANSPORT_ERRORS = (requests.RequestException, OSError)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Blocks until a token is available
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    # closed -> open after `threshold` consecutive failures -> half-open after `reset_after` seconds,
+    # where one trial call closes it again or reopens it
+    def __init__(self, threshold=5, reset_after=30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_after:
+                    return False
+                self.state = "half-open"
+                return True
+            # Only one trial call at a time while half-open
+            return self.state == "closed"
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        # A trial call that ended without telling us whether the upstream is back (a data error, an
+        # interrupt) hands the trial to the next call instead of leaving the breaker half-open
+        with self._lock:
+            if self.state == "half-open":
+                self.state = "open"
+
+
+class Upstream:
+    def __init__(self, name, rate, burst, retries, backoff=0.5, max_backoff=10.0,
+                 failure_threshold=5, reset_after=30.0, timeout=HTTP_TIMEOUT):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_after)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+    def _delay(self, attempt, retry_after=None):
+        # Full jitter: uniform over [0, backoff * 2^attempt], or what Retry-After asks for
+        if retry_after:
+            try:
+                return min(self.max_backoff, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _admit(self):
+        if not self.breaker.allow():
+            UPSTREAM_REQUESTS.inc(upstream=self.name, status="circuit_open")
+            raise CircuitOpenError(f"{self.name} is unavailable, circuit open")
+        self.bucket.acquire()
+
+    def get(self, url):
+        # GET through the shared session. Returns the last response (callers still check the status),
+        # raises for network errors once retries are exhausted or the circuit is open.
+        for attempt in range(self.retries + 1):
+            self._admit()
+            start = time.perf_counter()
+            try:
+                response = _session().get(url, timeout=self.timeout)
+            except requests.RequestException:
+                UPSTREAM_REQUESTS.inc(upstream=self.name, status="error")
+                self.breaker.record_failure()
+                if attempt == self.retries:
+                    raise
+                time.sleep(self._delay(attempt))
+                continue
+            except BaseException:
+                self.breaker.release()
+                raise
+            finally:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - start, upstream=self.name)
+
+            UPSTREAM_REQUESTS.inc(upstream=self.name, status=str(response.status_code))
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                # A 429 means we were too fast, not that the provider is down
+                self.breaker.record_success()
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                time.sleep(self._delay(attempt, response.headers.get("Retry-After")))
+                continue
+            return response
+
+    def call(self, fn, *args, **kwargs):
+        # Same limits for client libraries that do their own HTTP (yfinance). Only transport errors are
+        # retried and count against the circuit, anything else (a delisted ticker's KeyError or empty
+        # frame) is the caller's and is raised straight away.
+        for attempt in range(self.retries + 1):
+            self._admit()
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except TRANSPORT_ERRORS:
+                UPSTREAM_REQUESTS.inc(upstream=self.name, status="error")
+                self.breaker.record_failure()
+                if attempt == self.retries:
+                    raise
+                time.sleep(self._delay(attempt))
+                continue
+            except BaseException:
+                UPSTREAM_REQUESTS.inc(upstream=self.name, status="data_error")
+                self.breaker.release()
+                raise
+            finally:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - start, upstream=self.name)
+            UPSTREAM_REQUESTS.inc(upstream=self.name, status="ok")
+            self.breaker.record_success()
+            return result
+
+
+_shared_session = None
+_upstreams = {}
+_lock = threading.Lock()
+
+def _session():
+    global _shared_session
+    if _shared_session is None:
+        with _lock:
+            if _shared_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=len(UPSTREAM_DEFAULTS), pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _shared_session = session
+    return _shared_session
+
+def get_upstream(name):
+    if name not in _upstreams:
+        with _lock:
+            if name not in _upstreams:
+                rate, burst, retries = UPSTREAM_DEFAULTS.get(name, (5.0, 10, 2))
+                prefix = f"UPSTREAM_{name.upper()}_"
+                _upstreams[name] = Upstream(
+                    name,
+                    rate=float(os.getenv(prefix + "RATE", rate)),
+                    burst=int(os.getenv(prefix + "BURST", burst)),
+                    retries=int(os.getenv(prefix + "RETRIES", retries)),
+                    failure_threshold=int(os.getenv(prefix + "FAILURES", "5")),
+                    reset_after=float(os.getenv(prefix + "RESET_SECONDS", "30")),
+                )
+    return _upstreams[name]
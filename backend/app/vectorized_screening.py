@@ -0,0 +1,152 @@
+# vectorized_screening.py
+# Columnar versions of the ratio checks in halal_screening / halal_screeningv2. They take the
+# fundamentals of a whole universe as a DataFrame (or a dict of NumPy arrays), one row per ticker,
+# and do every ratio, verdict, reason and grade with array operations instead of a loop per row.
+#
+# Missing data is NaN here where the scalar versions use None, and NaN inputs are treated exactly
+# like None inputs (see calculate_ratios in halal_screeningv2).
+import numpy as np
+import pandas as pd
+from app.rulesets import get_ruleset, statement_quantities
+
+# Pass/fail limits live in the screening rulesets (app/rulesets.py)
+
+# grade_stock bands: ratio below the first bound scores 3, below the second 2, below the third 1
+RATIO_BANDS = (0.10, 0.20, 0.33)
+INTEREST_BANDS = (0.01, 0.03, 0.05)
+
+# calculate_ratios output columns
+RATIO_COLUMNS = ["debt_ratio", "cash_ratio", "receivables_ratio", "interest_income_ratio"]
+
+GRADES = ["C-", "C", "C+", "B-", "B", "B+", "A-", "A", "A+"]
+
+
+def _column(data, name, size):
+    if name not in data:
+        return np.full(size, np.nan)
+    values = np.asarray(data[name])
+    if values.dtype.kind in "fiub":
+        return values.astype(float)
+    # Object columns (None mixed with numbers) -> float with None as NaN
+    return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=float)
+
+def _size(data):
+    if isinstance(data, pd.DataFrame):
+        return len(data)
+    return len(next(iter(data.values()))) if data else 0
+
+def _index(data, size):
+    return data.index if isinstance(data, pd.DataFrame) else pd.RangeIndex(size)
+
+def _band_score(values, bands):
+    # NaN compares False everywhere so missing ratios score 0, like grade_stock skipping None
+    return np.select([values < bands[0], values < bands[1], values < bands[2]], [3, 2, 1], default=0)
+
+
+def calculate_ratios_vectorized(data):
+    """
+    Vectorized calculate_ratios. Expects total_debt, cash_total, receivables, revenue,
+    interest_income and avg_market_cap columns. Returns a DataFrame of the four ratios.
+    """
+    size = _size(data)
+    market_cap = _column(data, "avg_market_cap", size)
+    revenue = _column(data, "revenue", size)
+    interest = _column(data, "interest_income", size)
+
+    # Missing balances count as 0, a missing or non-positive market cap makes the ratio missing
+    valid_cap = market_cap > 0
+    safe_cap = np.where(valid_cap, market_cap, 1.0)
+    ratios = {}
+    for ratio, column in [("debt_ratio", "total_debt"), ("cash_ratio", "cash_total"), ("receivables_ratio", "receivables")]:
+        ratios[ratio] = np.where(valid_cap, np.nan_to_num(_column(data, column, size)) / safe_cap, np.nan)
+
+    valid_interest = (revenue > 0) & ~np.isnan(interest)
+    ratios["interest_income_ratio"] = np.where(valid_interest, interest / np.where(valid_interest, revenue, 1.0), np.nan)
+
+    return pd.DataFrame(ratios, index=_index(data, size))
+
+def grade_vectorized(ratios):
+    # Vectorized grade_stock, returns (score, grade) arrays
+    score = (
+        _band_score(np.asarray(ratios["debt_ratio"], dtype=float), RATIO_BANDS)
+        + _band_score(np.asarray(ratios["cash_ratio"], dtype=float), RATIO_BANDS)
+        + _band_score(np.asarray(ratios["receivables_ratio"], dtype=float), RATIO_BANDS)
+        + _band_score(np.asarray(ratios["interest_income_ratio"], dtype=float), INTEREST_BANDS)
+    )
+    # 0-3 -> C- / C, 4 -> C+ ... 8 -> A-, 9-10 -> A, 11+ -> A+
+    grade_index = np.select([score >= 11, score >= 9], [8, 7], default=np.clip(score - 2, 0, 6))
+    return score, np.asarray(GRADES, dtype=object)[grade_index]
+
+def screen_universe(data, ruleset=None):
+    """
+    Ratio screening and grading of screen_stock for N tickers at once (everything except the NLP check),
+    against the configured ruleset unless another is named. Returns a DataFrame with the ratios, compliance
+    (Halal / Doubtful / Haram), reasons ("; " joined), score and grade per row.
+    """
+    size = _size(data)
+    ratios = calculate_ratios_vectorized(data)
+    quantities = np.column_stack([  # in rulesets.QUANTITIES order
+        _column(data, column, size)
+        for column in ["total_debt", "cash_total", "receivables", "revenue", "interest_income", "avg_market_cap", "total_assets"]
+    ])
+    evaluation = get_ruleset(ruleset).evaluate(quantities)
+    score, grade = grade_vectorized(ratios)
+
+    result = ratios.copy()
+    result["compliance"] = evaluation.compliance()
+    result["reasons"] = evaluation.reasons()
+    result["score"] = score
+    result["grade"] = grade
+    return result
+
+def statement_screen(financials, market_caps, ruleset=None):
+    """
+    apply_aaoifi_screening for N stored statements (the financial_ratios JSON of halal_stocks) and market
+    caps, against the configured ruleset unless another is named. Returns the ruleset's ratios, compliance,
+    is_haram and reasons (failed rules only, like apply_aaoifi_screening) per row.
+    """
+    ruleset = get_ruleset(ruleset)
+    evaluation = ruleset.evaluate(statement_quantities(financials, market_caps))
+    result = pd.DataFrame(evaluation.ratios, columns=ruleset.ratio_names)
+    result["compliance"] = evaluation.compliance()
+    result["is_haram"] = evaluation.haram
+    result["reasons"] = evaluation.reasons(with_missing=False)
+    return result
+
+def to_results(screened, tickers=None):
+    # screen_universe output -> list of screen_stock style dicts (ratios None where missing)
+    tickers = screened.index if tickers is None else tickers
+    results = []
+    for ticker, row in zip(tickers, screened.itertuples(index=False)):
+        ratios = {column: (None if np.isnan(getattr(row, column)) else float(getattr(row, column)))
+                  for column in RATIO_COLUMNS}
+        results.append({
+            "ticker": ticker,
+            "compliance": row.compliance,
+            "grade": row.grade,
+            "reasons": row.reasons.split("; ") if row.reasons else [],
+            "ratios": ratios,
+        })
+    return results
+
+def statement_ratios(financials, market_caps):
+    """
+    Ratios and grade of screen_stock computed from halal_screening's stored statements (the
+    financial_ratios JSON of halal_stocks) and market caps, one row per stock. Used for the indexed
+    ratio columns of the halal_stocks table.
+    """
+    def field(name):
+        return [(f or {}).get(name) for f in financials]
+
+    cash = pd.to_numeric(pd.Series(field("cashAndCashEquivalents"), dtype=object), errors="coerce").fillna(0) \
+        + pd.to_numeric(pd.Series(field("shortTermInvestments"), dtype=object), errors="coerce").fillna(0)
+    ratios = calculate_ratios_vectorized({
+        "total_debt": field("totalDebt"),
+        "cash_total": cash.to_numpy(dtype=float),
+        "receivables": field("receivables"),
+        "revenue": field("totalRevenue"),
+        "interest_income": field("interestIncome"),
+        "avg_market_cap": [np.nan if m is None else m for m in market_caps],
+    })
+    _, ratios["grade"] = grade_vectorized(ratios)
+    return ratios
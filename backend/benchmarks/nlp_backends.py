@@ -0,0 +1,69 @@
+# nlp_backends.py
+# Compares the CPU inference backends of app.nlp_model on the training/validation split from
+# train_nlp_model.py: single-description latency, batch throughput, accuracy, and how often each
+# backend agrees with the current fp32 BERT.
+#
+#   cd backend && python -m benchmarks.nlp_backends
+# Uses MODEL_PATH, and DISTILLED_MODEL_PATH too if that checkpoint exists.
+import os
+import statistics
+import sys
+import time
+
+from app import nlp_model
+from app.train_nlp_model import get_splits, distilled_model_path, model_path
+
+
+def _latency_ms(model, tokenizer, texts, repeats=3):
+    timings = []
+    for _ in range(repeats):
+        for text in texts:
+            start = time.perf_counter()
+            nlp_model.predict_batch([text], model=model, tokenizer=tokenizer)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+def _throughput(model, tokenizer, texts, batch_size=16, repeats=3):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        nlp_model.predict_batch(texts, batch_size=batch_size, model=model, tokenizer=tokenizer)
+    return len(texts) * repeats / (time.perf_counter() - start)
+
+def _accuracy(predictions, labels):
+    return sum(p == l for p, l in zip(predictions, labels)) / len(labels) if labels else 0.0
+
+def main():
+    nlp_model.configure_threads()
+    train_df, val_df = get_splits()
+    splits = {"train": train_df, "val": val_df}
+    all_texts = list(train_df["description"]) + list(val_df["description"])
+
+    configs = [("bert", model_path, "fp32"), ("bert", model_path, "int8")]
+    if distilled_model_path and os.path.isdir(distilled_model_path):
+        configs += [("distilled", distilled_model_path, "fp32"), ("distilled", distilled_model_path, "int8")]
+    else:
+        print(f"[INFO] No distilled checkpoint at {distilled_model_path}, run train_nlp_model.py --distill")
+
+    baseline = None
+    print(f"{'model':<10} {'backend':<7} {'p50 ms':>8} {'p95 ms':>8} {'items/s':>9} {'train acc':>10} {'val acc':>8} {'agree':>7}")
+    for name, path, backend in configs:
+        model, tokenizer = nlp_model.build_model(path, backend)
+        predictions = {split: nlp_model.predict_batch(list(df["description"]), model=model, tokenizer=tokenizer)
+                       for split, df in splits.items()}
+        combined = predictions["train"] + predictions["val"]
+        if baseline is None:
+            baseline = combined
+
+        p50, p95 = _latency_ms(model, tokenizer, all_texts)
+        throughput = _throughput(model, tokenizer, all_texts)
+        train_acc = _accuracy(predictions["train"], list(train_df["label"]))
+        val_acc = _accuracy(predictions["val"], list(val_df["label"]))
+        agree = _accuracy(combined, baseline)
+        print(f"{name:<10} {backend:<7} {p50:>8.1f} {p95:>8.1f} {throughput:>9.1f} {train_acc:>10.3f} {val_acc:>8.3f} {agree:>7.3f}")
+
+
+if __name__ == "__main__":
+    if not model_path:
+        sys.exit("MODEL_PATH is not set")
+    main()
@@ -0,0 +1,63 @@
+# nlp_cascade.py
+# How the cheap-first cascade in app.nlp_cascade trades accuracy for BERT calls at several confidence
+# thresholds, on the validation split from train_nlp_model.py: the share of descriptions the TF-IDF stage
+# answers on its own (hit rate), cascade vs BERT-alone accuracy, agreement with BERT, and throughput.
+#
+#   cd backend && python -m benchmarks.nlp_cascade
+# Uses MODEL_PATH and the first stage from `train_nlp_model.py --cascade` (NLP_CASCADE_PATH).
+import os
+import sys
+import time
+
+from app import nlp_cascade, nlp_model
+from app.train_nlp_model import get_splits, model_path
+
+THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+
+def _accuracy(predictions, labels):
+    return sum(p == l for p, l in zip(predictions, labels)) / len(labels) if labels else 0.0
+
+def main():
+    if not nlp_cascade.cascade_path or not os.path.isfile(nlp_cascade.cascade_path):
+        sys.exit(f"No first-stage model at {nlp_cascade.cascade_path}, run train_nlp_model.py --cascade")
+
+    nlp_model.configure_threads()
+    _, val_df = get_splits()
+    texts = list(val_df["description"])
+    labels = list(val_df["label"])
+    classifier = nlp_cascade.load_classifier(nlp_cascade.cascade_path)
+    nlp_model.load_model()
+    # BERT directly, without the micro-batcher's wait
+    bert = nlp_model.predict_logits_batch
+
+    start = time.perf_counter()
+    bert_labels = [nlp_model.label_from_logits(row) for row in bert(texts)]
+    bert_rate = len(texts) / (time.perf_counter() - start)
+    bert_acc = _accuracy(bert_labels, labels)
+
+    start = time.perf_counter()
+    first_stage = nlp_cascade.first_stage(texts, classifier)
+    first_us = (time.perf_counter() - start) * 1e6 / len(texts)
+    first_acc = _accuracy([nlp_model.label_from_logits(row) for row, _ in first_stage], labels)
+
+    print(f"{len(texts)} validation descriptions")
+    print(f"BERT alone:        accuracy {bert_acc:.3f}, {bert_rate:.1f} items/s")
+    print(f"First stage alone: accuracy {first_acc:.3f}, {first_us:.0f} us per description")
+    print()
+    print(f"{'threshold':>9} {'hit rate':>9} {'accuracy':>9} {'vs BERT':>8} {'agree':>7} {'items/s':>9}")
+    for threshold in THRESHOLDS:
+        start = time.perf_counter()
+        logits, to_bert = nlp_cascade.predict_logits_batch(texts, threshold, classifier=classifier, bert=bert)
+        rate = len(texts) / (time.perf_counter() - start)
+        predictions = [nlp_model.label_from_logits(row) for row in logits]
+        accuracy = _accuracy(predictions, labels)
+        agree = _accuracy(predictions, bert_labels)
+        hit_rate = 1 - to_bert / len(texts)
+        print(f"{threshold:>9.2f} {hit_rate:>9.1%} {accuracy:>9.3f} {accuracy - bert_acc:>+8.3f} {agree:>7.1%} {rate:>9.1f}")
+
+
+if __name__ == "__main__":
+    if not model_path:
+        sys.exit("MODEL_PATH is not set")
+    main()
@@ -0,0 +1,60 @@
+# startup_time.py
+# Measures API cold start in fresh processes: importing app.main, the first /health response
+# (startup hook included) and, separately, how long the background model warmup takes.
+#
+#   cd backend && python -m benchmarks.startup_time [runs]
+import json
+import subprocess
+import sys
+import os
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter so nothing is already imported
+PROBE = r"""
+import json, os, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as client:
+    client.get("/health")
+    ready = time.perf_counter()
+    model_loaded = client.get("/health").json().get("model_loaded")
+
+    warmup = None
+    if os.getenv("MEASURE_WARMUP") == "1":
+        from app import nlp_model
+        warmup = nlp_model.warmup()
+
+print(json.dumps({
+    "import_s": imported - start,
+    "ready_s": ready - start,
+    "model_loaded_at_ready": model_loaded,
+    "warmup_s": warmup,
+}))
+"""
+
+def run_probe(measure_warmup=False):
+    env = dict(os.environ, NLP_PRELOAD="0", MEASURE_WARMUP="1" if measure_warmup else "0")
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main(runs=5):
+    results = [run_probe() for _ in range(runs)]
+    imports = sorted(r["import_s"] for r in results)
+    ready = sorted(r["ready_s"] for r in results)
+    print(f"import app.main : median {imports[len(imports) // 2] * 1000:.0f} ms (min {imports[0] * 1000:.0f} ms)")
+    print(f"first /health   : median {ready[len(ready) // 2] * 1000:.0f} ms (min {ready[0] * 1000:.0f} ms)")
+
+    if os.getenv("MODEL_PATH"):
+        warm = run_probe(measure_warmup=True)
+        print(f"model warmup    : {warm['warmup_s'] * 1000:.0f} ms (runs in the background when NLP_PRELOAD=1)")
+    else:
+        print("model warmup    : skipped, MODEL_PATH not set")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,277 @@
+# suite.py
+# Screening benchmarks replayed from fixtures, so numbers are comparable between commits:
+#   - screen_halal_stocks latency for one ticker, cache miss and cache hit
+#   - screen_halal_stocks_batch_async throughput at several concurrency levels, cold and warm DB
+#   - screen_stock latency, cold and warm (needs MODEL_PATH)
+#   - nlp_model inference throughput per batch size (needs MODEL_PATH)
+#
+#   cd backend && python -m benchmarks.suite                   # compare against benchmarks/baseline.json
+#   cd backend && python -m benchmarks.suite --save            # write a new baseline
+#   cd backend && python -m benchmarks.suite --synthetic 500   # a generated universe instead, for scale
+#
+# By default the recorded fixtures committed in app/fixtures are replayed (--fixtures DIR for another set
+# from `python -m app.providers`). Upstream round trips are simulated with --latency-ms per request
+# (FixtureProvider, off by default), the DB is a throwaway SQLite file. Every run also times a fixed CPU
+# workload, and results are compared with the baseline in units of it, so a baseline recorded on another
+# machine still flags regressions. That only holds while the runs are CPU bound: with --latency-ms the
+# simulated waits don't scale with the machine, so compare such runs with a baseline (--baseline FILE)
+# recorded on the same machine. A baseline recorded with other settings (meta) is refused.
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+RECORDED_FIXTURES = os.path.join(os.path.dirname(BENCH_DIR), "app", "fixtures")
+
+CONCURRENCY_LEVELS = (1, 4, 16, 64)
+NLP_BATCH_SIZES = (1, 4, 16, 32, 64)
+
+SECTORS = [("Technology", "Software"), ("Healthcare", "Biotechnology"), ("Industrials", "Machinery"),
+           ("Consumer Defensive", "Beverages"), ("Financial Services", "Conventional Banking")]
+HEADLINES = ["{name} opens a new plant", "{name} reports quarterly earnings", "{name} accused of price fixing",
+             "{name} launches product line", "{name} linked to arms sales", "{name} hires new CFO"]
+
+
+def make_fixtures(path, count=200, seed=42):
+    # Deterministic synthetic universe in FixtureProvider's layout
+    rng = random.Random(seed)
+    today = date.today()
+    profiles, statements, prices, news = {}, {}, {}, {}
+    for i in range(count):
+        ticker = f"B{i:04d}"
+        name = f"Bench Company {i}"
+        sector, industry = rng.choice(SECTORS)
+        market_cap = rng.uniform(1e9, 5e11)
+        shares = market_cap / rng.uniform(20, 400)
+        profiles[ticker] = {"companyName": name, "sector": sector, "industry": industry, "marketCap": market_cap,
+                            "beta": 1.0, "summary": f"{name} operates in {industry.lower()}.",
+                            "sharesOutstanding": shares}
+        revenue = market_cap * rng.uniform(0.05, 0.5)
+        cash = market_cap * rng.uniform(0.01, 0.35)
+        statements[ticker] = {"date": "2025-12-31", "totalAssets": market_cap * 0.8,
+                              "totalDebt": market_cap * rng.uniform(0.0, 0.4), "cashAndCashEquivalents": cash,
+                              "shortTermInvestments": 0.0, "cashAndShortTermInvestments": cash,
+                              "receivables": market_cap * rng.uniform(0.0, 0.2), "totalRevenue": revenue,
+                              "interestIncome": revenue * rng.uniform(0.0, 0.06)}
+        # A year of closes up to today, so the price store's 1-year window covers them
+        close = market_cap / shares
+        series = {}
+        for day in range(365):
+            close *= 1 + rng.gauss(0, 0.01)
+            series[str(today - timedelta(days=364 - day))] = round(close, 4)
+        prices[ticker] = series
+        news[name] = [{"title": rng.choice(HEADLINES).format(name=name), "description": "", "content": "",
+                       "url": f"https://news.example/{ticker}/{n}", "publishedAt": f"2026-01-{10 + n:02d}T09:00:00Z",
+                       "source": {"name": "Bench Wire"}} for n in range(10)]
+
+    os.makedirs(path, exist_ok=True)
+    for kind, data in [("profiles", profiles), ("statements", statements), ("prices", prices), ("news", news)]:
+        with open(os.path.join(path, f"{kind}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+    return list(profiles)
+
+def _configure(args, workdir):
+    # Everything the app reads at import time, set before any app module is imported
+    if args.synthetic:
+        fixture_dir = os.path.join(workdir, "fixtures")
+        tickers = make_fixtures(fixture_dir, args.synthetic, args.seed)
+    else:
+        fixture_dir, tickers = args.fixtures, None
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "DATA_PROVIDER": "fixtures",
+        "DATA_PROVIDER_V2": "fixtures",
+        "FIXTURE_DIR": fixture_dir,
+        "FIXTURE_LATENCY_MS": str(args.latency_ms),
+        "PRICE_STORE_DIR": os.path.join(workdir, "price_store"),
+        "NLP_PRELOAD": "0",
+    })
+    if tickers is None:
+        with open(os.path.join(fixture_dir, "profiles.json"), encoding="utf-8") as f:
+            tickers = list(json.load(f))
+    return tickers
+
+def calibrate(rounds=9):
+    # Seconds for a fixed piece of interpreter work (the screens are mostly Python), the machine's unit for
+    # compare(). The fastest round, the others mostly measure whatever else the machine was doing.
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        total = 0
+        for i in range(300_000):
+            total += i % 7
+        json.loads(json.dumps([{"ticker": f"T{i}", "close": i / 3} for i in range(5_000)]))
+        sorted(str(i * 7919 % 10007) for i in range(50_000))
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    return {"p50_ms": statistics.median(ordered) * 1000,
+            "p95_ms": ordered[max(0, int(len(ordered) * 0.95) - 1)] * 1000}
+
+def _clear_cache():
+    from app import db
+
+    session = db.Session()
+    try:
+        for model in (db.HalalStock, db.CompanyNews, db.NewsArticle):
+            session.query(model).delete()
+        session.commit()
+    finally:
+        session.close()
+
+def bench_single(tickers, samples):
+    from app.halal_screening import screen_halal_stocks
+
+    # `samples` screens, cycling through the universe when it is smaller
+    picked = [tickers[i % len(tickers)] for i in range(samples)]
+    results = {}
+    for label in ("miss", "hit"):
+        if label == "hit":
+            for ticker in dict.fromkeys(picked):
+                screen_halal_stocks(ticker)
+        timings = []
+        for ticker in picked:
+            if label == "miss":
+                _clear_cache()
+            start = time.perf_counter()
+            screen_halal_stocks(ticker)
+            timings.append(time.perf_counter() - start)
+        results[f"single_{label}"] = _percentiles(timings)
+    return results
+
+def bench_batch(tickers, rounds=5):
+    from app.halal_screening import screen_halal_stocks_batch_async
+
+    results = {}
+    # Levels above the universe size would only repeat the largest one
+    for concurrency in [c for c in CONCURRENCY_LEVELS if c <= len(tickers)] or [len(tickers)]:
+        rates = {"cold": [], "warm": []}
+        for _ in range(rounds):
+            _clear_cache()
+            for label in ("cold", "warm"):
+                start = time.perf_counter()
+                asyncio.run(screen_halal_stocks_batch_async(tickers, concurrency))
+                rates[label].append(len(tickers) / (time.perf_counter() - start))
+        for label, values in rates.items():
+            results[f"batch_{label}_c{concurrency}"] = {"tickers_per_s": statistics.median(values)}
+    return results
+
+def bench_v2(tickers, samples):
+    from app.halal_screeningv2 import screen_stock
+
+    results = {}
+    picked = tickers[:samples]
+    for label in ("cold", "warm"):
+        timings = []
+        for ticker in picked:
+            start = time.perf_counter()
+            screen_stock(ticker)
+            timings.append(time.perf_counter() - start)
+        results[f"v2_{label}"] = _percentiles(timings)
+    return results
+
+def bench_nlp(texts):
+    from app import nlp_model
+
+    nlp_model.load_model()
+    nlp_model.predict_logits_batch(texts[:4])
+    results = {}
+    for batch_size in NLP_BATCH_SIZES:
+        start = time.perf_counter()
+        nlp_model.predict_logits_batch(texts, batch_size=batch_size)
+        results[f"nlp_batch_{batch_size}"] = {"items_per_s": len(texts) / (time.perf_counter() - start)}
+    return results
+
+def compare(results, unit, baseline, baseline_unit, tolerance):
+    """
+    Prints each number next to the baseline, returns the metrics that got worse by more than `tolerance`.
+    Both sides are first scaled by their run's calibrate() unit, so the change is machine independent.
+    """
+    regressions = []
+    speed = baseline_unit / unit
+    print(f"[INFO] This machine runs the calibration at {speed:.2f}x the baseline's speed")
+    print(f"{'benchmark':<22} {'metric':<13} {'current':>11} {'baseline':>11} {'change':>8}")
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(name, {}).get(metric)
+            if base:
+                # Latencies regress upwards, throughputs downwards
+                latency = metric.endswith("_ms")
+                scaled = value / unit if latency else value * unit
+                scaled_base = base / baseline_unit if latency else base * baseline_unit
+                change = (scaled - scaled_base) / scaled_base
+                worse = change if latency else -change
+                flag = "  <-- regression" if worse > tolerance else ""
+                if flag:
+                    regressions.append(f"{name}.{metric}")
+                print(f"{name:<22} {metric:<13} {value:>11.2f} {base:>11.2f} {change:>+8.1%}{flag}")
+            else:
+                print(f"{name:<22} {metric:<13} {value:>11.2f} {'-':>11} {'':>8}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Replayed screening benchmarks")
+    parser.add_argument("--fixtures", default=RECORDED_FIXTURES, help="FixtureProvider directory to replay")
+    parser.add_argument("--synthetic", type=int, default=0, metavar="N", help="Replay a generated universe of N tickers instead")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the generated universe")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated upstream round trip per request")
+    parser.add_argument("--samples", type=int, default=50, help="Screens timed one by one in the single-ticker runs")
+    parser.add_argument("--save", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before a metric is flagged")
+    args = parser.parse_args()
+
+    fixtures = None if args.synthetic else os.path.relpath(os.path.abspath(args.fixtures), os.path.dirname(BENCH_DIR))
+    meta = {"latency_ms": args.latency_ms, "samples": args.samples,
+            **({"synthetic": args.synthetic, "seed": args.seed} if args.synthetic else {"fixtures": fixtures})}
+    saved = None
+    if not args.save:
+        # Checked before the run, there is no point benchmarking without something to compare with
+        if not os.path.exists(args.baseline):
+            sys.exit(f"No baseline at {args.baseline}, record one with --save")
+        with open(args.baseline, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("meta") != meta:
+            sys.exit(f"Baseline was recorded with {saved.get('meta')}, this run would use {meta}")
+
+    unit = calibrate()
+    with tempfile.TemporaryDirectory(prefix="halal-bench-") as workdir:
+        tickers = _configure(args, workdir)
+        from app.db import init_db
+
+        init_db()
+        results = {}
+        results.update(bench_single(tickers, args.samples))
+        results.update(bench_batch(tickers))
+        if os.getenv("MODEL_PATH"):
+            results.update(bench_v2(tickers, args.samples))
+            with open(os.path.join(os.environ["FIXTURE_DIR"], "profiles.json"), encoding="utf-8") as f:
+                texts = [p.get("summary") or "" for p in json.load(f).values()]
+            results.update(bench_nlp(texts))
+        else:
+            print("[INFO] MODEL_PATH not set, skipping screen_stock and NLP benchmarks")
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "calibration_s": unit, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    regressions = compare(results, unit, saved["results"], saved["calibration_s"], args.tolerance)
+    if regressions:
+        sys.exit(f"Regressions: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+# Settings the app modules read at import time: a throwaway SQLite database and price store, the offline
+# fixture provider replaying the committed app/fixtures, and no model preloading
+import os
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
+os.environ.setdefault("DATA_PROVIDER", "fixtures")
+os.environ.setdefault("DATA_PROVIDER_V2", "fixtures")
+os.environ.setdefault("FIXTURE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "app", "fixtures"))
+os.environ.setdefault("PRICE_STORE_DIR", tempfile.mkdtemp())
+os.environ.setdefault("NLP_PRELOAD", "0")
@@ -0,0 +1,21 @@
+import numpy as np
+from app import embedding_index
+from app.embedding_index import EmbeddingIndex
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_near_duplicates_skip_the_tickers_own_record(tmp_path, monkeypatch):
+    index = EmbeddingIndex(path=str(tmp_path), version="test")
+    index.append(["ACME", "ACMEB"], ["old", "b"], [[3.0, 0.0, 0.0], [0.0, 3.0, 0.0]], [unit(1, 0, 0), unit(0, 1, 0)])
+    monkeypatch.setattr(embedding_index, "get_index", lambda version=None: index)
+
+    # ACME's changed summary embeds like its old one: no reuse of its own stale verdict
+    assert embedding_index.near_duplicates(np.stack([unit(1, 0, 0)]), ["ACME"]) == [None]
+    # Another listing of the same company takes it
+    assert embedding_index.near_duplicates(np.stack([unit(1, 0, 0)]), ["ACMEC"]) == [[3.0, 0.0, 0.0]]
+    # The best other ticker is still found when the own record ranks first
+    assert embedding_index.near_duplicates(np.stack([unit(0, 1, 0)]), ["ACME"]) == [[0.0, 3.0, 0.0]]
@@ -0,0 +1,48 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+import pytest
+from app import db
+
+NOW = datetime(2026, 6, 1, 12, 0, tzinfo=timezone.utc)
+SECOND = timedelta(seconds=1)
+
+
+def stock(**ages):
+    # A cached row whose data classes were refreshed `ages` ago, None for never
+    row = db.HalalStock(ticker="T")
+    for field, (column, _) in db.FRESHNESS.items():
+        age = ages.get(field)
+        setattr(row, column, None if age is None else NOW - age)
+    return row
+
+def fresh(**overrides):
+    ages = {field: ttl - SECOND for field, (_, ttl) in db.FRESHNESS.items()}
+    return stock(**{**ages, **overrides})
+
+
+def test_no_row_means_everything_is_stale():
+    assert db.stale_fields(None, NOW) == set(db.FRESHNESS)
+
+def test_everything_within_its_ttl_is_fresh():
+    assert db.stale_fields(fresh(), NOW) == set()
+
+@pytest.mark.parametrize("field", list(db.FRESHNESS))
+def test_each_field_goes_stale_on_its_own_ttl(field):
+    ttl = db.FRESHNESS[field][1]
+    assert db.stale_fields(fresh(**{field: ttl}), NOW) == set()
+    assert db.stale_fields(fresh(**{field: ttl + SECOND}), NOW) == {field}
+
+def test_never_fetched_news_is_not_stale_but_other_fields_are():
+    assert db.stale_fields(fresh(news=None), NOW) == set()
+    assert db.stale_fields(fresh(fundamentals=None, market_cap=None), NOW) == {"fundamentals", "market_cap"}
+
+def test_timestamps_read_back_from_the_db_are_compared_as_utc():
+    db.init_db()
+    ticker = "F" + uuid.uuid4().hex[:8].upper()
+    db.save_to_db(ticker, "Fresh Co", "Halal ✅", "", "Technology", "Software", 1e9, {}, False, None,
+                  refreshed=("fundamentals", "market_cap"), stale=("news",))
+    saved = db.get_cached_stock(ticker)
+    now = datetime.now(timezone.utc)
+    assert db.stale_fields(saved, now) == set()
+    assert db.stale_fields(saved, now + db.MARKET_CAP_TTL + SECOND) == {"market_cap"}
+    assert db.stale_fields(saved, now + db.FUNDAMENTALS_TTL + SECOND) == {"fundamentals", "market_cap"}
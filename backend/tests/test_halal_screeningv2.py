@@ -0,0 +1,10 @@
+from app import halal_screeningv2
+
+
+def test_an_invalid_ticker_skips_the_classifier(monkeypatch):
+    calls = []
+    monkeypatch.setattr(halal_screeningv2, "cached_predict", lambda *args: calls.append(args))
+    result = halal_screeningv2.screen_stock("NOSUCHTICKER")
+    assert result["halal"] is None
+    assert result["reasons"] == ["Invalid ticker: NOSUCHTICKER"]
+    assert calls == []
@@ -0,0 +1,30 @@
+import asyncio
+import threading
+from app import halal_screening
+
+
+def test_closing_the_stream_saves_finished_rows_off_the_event_loop(monkeypatch):
+    saves = []
+
+    async def prefetch(run, tickers):
+        return {}, {}
+
+    async def screen(ticker, run, cached, profiles, rows):
+        rows.append({"ticker": ticker})
+        return {"ticker": ticker}
+
+    monkeypatch.setattr(halal_screening, "_prefetch", prefetch)
+    monkeypatch.setattr(halal_screening, "_screen_halal_stocks_async", screen)
+    monkeypatch.setattr(halal_screening, "save_many", lambda rows: saves.append((threading.current_thread(), rows)))
+
+    async def consume():
+        stream = halal_screening.screen_halal_stocks_stream(["A", "B", "C"], concurrency=1, block_size=10)
+        await stream.__anext__()
+        await stream.aclose()
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(consume())
+    assert len(saves) == 1
+    thread, rows = saves[0]
+    assert thread is not loop_thread
+    assert {row["ticker"] for row in rows} >= {"A"}
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+import uuid
+from fastapi.testclient import TestClient
+from app import db, jobs
+
+
+def new_job(owner=None):
+    db.init_db()
+    job_id = uuid.uuid4().hex
+    db.create_job(job_id, "halal", None, ["AAPL", "MSFT"], owner=owner)
+    return job_id
+
+def client():
+    from app.main import app
+    return TestClient(app)
+
+def now(offset=0):
+    return datetime.now(timezone.utc) + timedelta(seconds=offset)
+
+
+def test_a_live_job_is_claimed_by_one_process_only():
+    job_id = new_job(owner="host:1")
+    assert db.claim_job(job_id, "host:1", now(-60))
+    assert not db.claim_job(job_id, "host:2", now(-60))
+    assert job_id not in db.orphaned_jobs(now(-60))
+
+def test_a_stale_job_is_taken_over():
+    job_id = new_job(owner="host:1")
+    # host:1 stopped heartbeating a while ago
+    assert job_id in db.orphaned_jobs(now(5))
+    assert db.claim_job(job_id, "host:2", now(5))
+    assert not db.claim_job(job_id, "host:3", now(-60))
+
+def test_finished_jobs_are_not_claimed_and_release_their_owner():
+    job_id = new_job(owner="host:1")
+    db.set_job_status(job_id, "failed")
+    assert not db.claim_job(job_id, "host:2", now(5))
+    db.set_job_status(job_id, "queued")
+    assert db.claim_job(job_id, "host:2", now(-60))
+
+def test_a_late_cancel_is_not_overwritten_by_done():
+    job_id = new_job()
+    db.set_job_status(job_id, "running")
+    db.set_job_status(job_id, "cancelled")
+    assert not db.set_job_status(job_id, "done", unless=("cancelled",))
+    assert db.get_job(job_id)["status"] == "cancelled"
+
+def test_cancelling_a_running_job():
+    job_id = new_job()
+    db.set_job_status(job_id, "running")
+    response = client().post(f"/jobs/{job_id}/cancel")
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+    assert job_id in jobs.get_runner()._cancelled
+
+def test_cancelling_a_finished_job_is_a_conflict():
+    job_id = new_job()
+    db.set_job_status(job_id, "done")
+    finished_at = db.get_job(job_id)["finished_at"]
+    response = client().post(f"/jobs/{job_id}/cancel")
+    assert response.status_code == 409
+    job = db.get_job(job_id)
+    assert (job["status"], job["finished_at"]) == ("done", finished_at)
+    assert job_id not in jobs.get_runner()._cancelled
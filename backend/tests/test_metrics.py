@@ -0,0 +1,46 @@
+import pytest
+from app import metrics
+from app.metrics import Counter, Histogram
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    # Metrics made here don't end up in the app's /metrics
+    monkeypatch.setattr(metrics, "_metrics", [])
+
+
+def test_counter_exposition():
+    counter = Counter("test_requests_total", "Requests by result", ("cache", "result"))
+    counter.inc(cache="lru", result="hit")
+    counter.inc(2, cache="lru", result="hit")
+    counter.inc(cache="db", result="miss")
+    assert metrics.render() == (
+        "# HELP test_requests_total Requests by result\n"
+        "# TYPE test_requests_total counter\n"
+        'test_requests_total{cache="db",result="miss"} 1\n'
+        'test_requests_total{cache="lru",result="hit"} 3\n'
+    )
+
+def test_label_values_are_escaped():
+    counter = Counter("test_errors_total", "Errors", ("error",))
+    counter.inc(error='say "hi"\\now\nthen')
+    assert counter.render()[-1] == 'test_errors_total{error="say \\"hi\\"\\\\now\\nthen"} 1'
+
+def test_unlabelled_counter_has_no_braces():
+    counter = Counter("test_total", "Total")
+    counter.inc()
+    assert counter.render()[-1] == "test_total 1"
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    histogram = Histogram("test_seconds", "Latency", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, stage="fetch")
+    assert histogram.render() == [
+        "# HELP test_seconds Latency",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="fetch",le="0.1"} 2',
+        'test_seconds_bucket{stage="fetch",le="1.0"} 3',
+        'test_seconds_bucket{stage="fetch",le="+Inf"} 4',
+        'test_seconds_sum{stage="fetch"} 2.65',
+        'test_seconds_count{stage="fetch"} 4',
+    ]
@@ -0,0 +1,57 @@
+import threading
+import time
+import pytest
+from app.nlp_model import MicroBatcher
+
+
+class Recorder:
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        return [item * 10 for item in items]
+
+
+def test_a_full_batch_runs_without_waiting():
+    fn = Recorder()
+    batcher = MicroBatcher(fn, max_batch=4, wait_ms=60_000)
+    start = time.monotonic()
+    futures = [batcher.submit(i) for i in range(4)]
+    assert [f.result(timeout=5) for f in futures] == [0, 10, 20, 30]
+    assert time.monotonic() - start < 5
+    assert fn.batches == [[0, 1, 2, 3]]
+
+def test_a_partial_batch_runs_when_the_wait_is_over():
+    fn = Recorder()
+    batcher = MicroBatcher(fn, max_batch=100, wait_ms=50)
+    futures = [batcher.submit(i) for i in range(3)]
+    assert [f.result(timeout=5) for f in futures] == [0, 10, 20]
+    assert fn.batches == [[0, 1, 2]]
+
+def test_concurrent_callers_each_get_their_own_result():
+    fn = Recorder()
+    batcher = MicroBatcher(fn, max_batch=8, wait_ms=20)
+    results = {}
+
+    def call(i):
+        results[i] = batcher(i)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {i: i * 10 for i in range(50)}
+    assert all(len(batch) <= 8 for batch in fn.batches)
+    assert len(fn.batches) < 50
+
+def test_a_failed_batch_fails_each_of_its_callers():
+    def fail(items):
+        raise RuntimeError("model crashed")
+
+    batcher = MicroBatcher(fail, max_batch=2, wait_ms=1000)
+    futures = [batcher.submit(i) for i in range(2)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model crashed"):
+            future.result(timeout=5)
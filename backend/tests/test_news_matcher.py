@@ -0,0 +1,28 @@
+import random
+import re
+from app.news_matcher import TermMatcher
+
+
+def test_one_term_does_not_hide_an_overlapping_one():
+    matcher = TermMatcher({"haram": ["war crimes"], "doubtful": ["accused of war", "war"]})
+    hits = matcher.find("Company accused of war crimes")
+    assert ("war crimes", "haram", 19) in hits
+    assert ("accused of war", "doubtful", 8) in hits
+    assert ("war", "doubtful", 19) in hits
+    assert matcher.classify({"title": "Company accused of war crimes"}) == "haram"
+
+def test_whole_words_checks_every_overlapping_term():
+    matcher = TermMatcher({"haram": ["casino", "casino resorts"], "doubtful": ["resort"]}, whole_words=True)
+    terms = {term for term, _, _ in matcher.find("New casino resorts opened")}
+    assert terms == {"casino", "casino resorts"}
+
+def test_same_terms_as_checking_each_one_with_in():
+    random.seed(7)
+    alphabet = "ab c"
+    for _ in range(300):
+        terms = {"".join(random.choice(alphabet) for _ in range(random.randint(1, 4))).strip() for _ in range(6)} - {""}
+        text = "".join(random.choice(alphabet) for _ in range(30))
+        matcher = TermMatcher({"haram": sorted(terms)})
+        found = {(term, start) for term, _, start in matcher.find(text)}
+        expected = {(term, m.start()) for term in terms for m in re.finditer(f"(?={re.escape(term)})", text)}
+        assert found == expected
@@ -0,0 +1,42 @@
+import threading
+import uuid
+from datetime import datetime, timezone
+from app import db
+
+
+def article(fingerprint):
+    return {"fingerprint": fingerprint, "content_hash": fingerprint, "url": f"https://news/{fingerprint}",
+            "title": "Two companies in one story", "description": None, "content": None, "source": "wire",
+            "published_at": datetime.now(timezone.utc)}
+
+
+def test_concurrent_ingests_of_the_same_article_keep_both_links():
+    db.init_db()
+    tickers = [uuid.uuid4().hex[:8] for _ in range(4)]
+    for _ in range(10):
+        shared = article(uuid.uuid4().hex)
+        errors = []
+        barrier = threading.Barrier(len(tickers))
+
+        def ingest(ticker):
+            barrier.wait()
+            try:
+                db.save_news_articles(ticker, [shared, article(uuid.uuid4().hex)])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=ingest, args=(t,)) for t in tickers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        stored = db.get_news_articles(tickers, limit=100)
+        assert all(shared["fingerprint"] in {a["fingerprint"] for a in stored[t]} for t in tickers)
+
+def test_saving_again_only_links():
+    db.init_db()
+    shared = article(uuid.uuid4().hex)
+    assert db.save_news_articles("AAA", [shared]) == 1
+    assert db.save_news_articles("BBB", [shared]) == 0
+    assert db.save_news_articles("BBB", [shared]) == 0
@@ -0,0 +1,78 @@
+import uuid
+import numpy as np
+import pytest
+from app import db, embedding_index, nlp_cache, nlp_cascade, nlp_model
+from app.embedding_index import EmbeddingIndex
+
+SURE, UNSURE = [0.0, -5.0, -5.0], [-5.0, 0.0, -5.0]
+
+
+@pytest.fixture
+def models(tmp_path, monkeypatch):
+    # Stand-ins for the first stage, BERT and the embedding pass, recording what each was given
+    calls = {"first": [], "bert": [], "embed": []}
+    index = EmbeddingIndex(path=str(tmp_path), version="test")
+    monkeypatch.setattr(embedding_index, "INDEX_ENABLED", True)
+    monkeypatch.setattr(embedding_index, "get_index", lambda version=None: index)
+
+    def first(descriptions, threshold=None, classifier=None):
+        calls["first"].append(list(descriptions))
+        return [SURE if "plain" in d else None for d in descriptions]
+
+    def bert(descriptions, bert=None):
+        calls["bert"].append(list(descriptions))
+        return [UNSURE for _ in descriptions]
+
+    def embed(descriptions, **kwargs):
+        calls["embed"].append(list(descriptions))
+        vectors = np.random.default_rng(len(calls["embed"])).normal(size=(len(descriptions), 8)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    monkeypatch.setattr(nlp_cascade, "predict_confident", first)
+    monkeypatch.setattr(nlp_cascade, "predict_bert", bert)
+    monkeypatch.setattr(nlp_model, "embed_batch", embed)
+    monkeypatch.setattr(nlp_model, "fits_embedding", lambda descriptions, **kwargs: [True] * len(descriptions))
+    return calls, index
+
+
+def test_only_summaries_headed_for_bert_are_embedded_on_the_request_path(models, monkeypatch):
+    calls, index = models
+    monkeypatch.setattr(nlp_cache, "PERSIST", False)
+    run = uuid.uuid4().hex
+    descriptions = [f"plain {run} {i}" for i in range(3)] + [f"ambiguous {run} {i}" for i in range(2)]
+    tickers = [f"T{i}" for i in range(5)]
+
+    verdicts = nlp_cache.cached_predict_batch(descriptions, tickers)
+    assert [label for label, _ in verdicts] == ["halal"] * 3 + ["non-halal"] * 2
+    assert calls["first"] == [descriptions]
+    assert calls["embed"] == [descriptions[3:]]
+    assert calls["bert"] == [descriptions[3:]]
+
+    # The first stage's summaries are indexed too, off the request path
+    nlp_cache.wait_for_index()
+    assert calls["embed"][1:] == [descriptions[:3]]
+    assert all(index.summary_hash(t) == nlp_cache.summary_hash(d) for t, d in zip(tickers, descriptions))
+
+def test_verdicts_are_keyed_by_model_version(models, monkeypatch):
+    calls, _ = models
+    db.init_db()
+    monkeypatch.setattr(nlp_cache, "PERSIST", True)
+    version = {"current": "v1-" + uuid.uuid4().hex}
+    monkeypatch.setattr(nlp_cascade, "version", lambda: version["current"])
+    description = f"ambiguous {uuid.uuid4().hex}"
+
+    assert nlp_cache.cached_predict(description) == "non-halal"
+    assert nlp_cache.cached_predict(description) == "non-halal"
+    assert len(calls["bert"]) == 1
+    # Another process (empty LRU) finds it in the table
+    nlp_cache._lru.clear()
+    assert nlp_cache.cached_predict(description) == "non-halal"
+    assert len(calls["bert"]) == 1
+
+    # A new checkpoint misses both tiers and classifies again
+    old = version["current"]
+    version["current"] = "v2-" + uuid.uuid4().hex
+    assert nlp_cache.cached_predict(description) == "non-halal"
+    assert len(calls["bert"]) == 2
+    assert nlp_cache.prune() >= 1
+    assert db.get_nlp_verdicts(old, [nlp_cache.summary_hash(description)]) == {}
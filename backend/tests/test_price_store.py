@@ -0,0 +1,63 @@
+import threading
+import numpy as np
+import pandas as pd
+from app.price_store import PriceStore, _to_days
+
+
+class Provider:
+    def __init__(self, closes):
+        self.closes = closes
+
+    def get_price_history(self, tickers, period="1y", start=None):
+        days = pd.date_range(end=pd.Timestamp.today().normalize() - pd.Timedelta(days=1), periods=3)
+        return pd.DataFrame({t: self.closes[t] for t in tickers if t in self.closes}, index=days)
+
+
+def test_processes_sharing_a_store_keep_each_others_index_entries(tmp_path):
+    # Two workers, each with its own view of the index: the first saves while the second is fetching
+    first, second = PriceStore(str(tmp_path)), PriceStore(str(tmp_path))
+
+    class Interleaved(Provider):
+        def get_price_history(self, tickers, period="1y", start=None):
+            first.sync(["AAPL"], Provider({"AAPL": [1.0, 2.0, 3.0]}))
+            return super().get_price_history(tickers, period, start)
+
+    second.sync(["MSFT"], Interleaved({"MSFT": [10.0, 20.0, 30.0]}))
+
+    averages = PriceStore(str(tmp_path)).average_closes(["AAPL", "MSFT"])
+    assert np.allclose(averages, [2.0, 20.0])
+
+def test_a_partial_session_close_is_corrected_by_the_next_sync(tmp_path):
+    store = PriceStore(str(tmp_path))
+    days = pd.date_range("2024-01-01", periods=3)
+    store._append("AAPL", _to_days(days), np.array([1.0, 2.0, 2.5]))  # 2.5: taken mid-session
+
+    # The next sync starts at the last stored day and gets its final close plus a new day
+    later = pd.date_range("2024-01-03", periods=2)
+    rows = store._append("AAPL", _to_days(later), np.array([3.0, 4.0]))
+    assert list(rows["close"]) == [1.0, 2.0, 3.0, 4.0]
+    assert list(rows["cumsum"]) == [1.0, 3.0, 6.0, 10.0]
+
+def test_threads_syncing_different_tickers_fetch_at_the_same_time(tmp_path):
+    store = PriceStore(str(tmp_path))
+    # Each fetch waits for the other to start, which only happens if neither holds the store's lock
+    both_fetching = threading.Barrier(2, timeout=5)
+    fetches = []
+
+    class Overlapping(Provider):
+        def get_price_history(self, tickers, period="1y", start=None):
+            fetches.append(tuple(tickers))
+            both_fetching.wait()
+            return super().get_price_history(tickers, period, start)
+
+    provider = Overlapping({"AAPL": [1.0, 2.0, 3.0], "MSFT": [10.0, 20.0, 30.0], "GOOG": [5.0, 5.0, 5.0]})
+    threads = [threading.Thread(target=store.sync, args=(tickers, provider)) for tickers in (["AAPL", "GOOG"], ["MSFT", "GOOG"])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(fetches) == [("AAPL", "GOOG"), ("MSFT", "GOOG")]
+    assert np.allclose(store.average_closes(["AAPL", "MSFT", "GOOG"]), [2.0, 20.0, 5.0])
+    # GOOG was fetched by both, but only appended once
+    assert len(store.closes("GOOG")) == 3
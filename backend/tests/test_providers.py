@@ -0,0 +1,39 @@
+from unittest import mock
+import pandas as pd
+from app import providers
+from app.providers import FMPProvider
+
+
+def response(payload):
+    return mock.Mock(status_code=200, json=mock.Mock(return_value=payload))
+
+
+def test_fmp_profiles_are_keyed_by_the_requested_ticker():
+    payload = [{"symbol": "AAPL", "companyName": "Apple Inc.", "mktCap": 3e12}]
+    with mock.patch.object(providers, "_http_get", return_value=response(payload)):
+        provider = FMPProvider()
+        assert provider.get_profiles(["aapl"])["aapl"]["companyName"] == "Apple Inc."
+        assert provider.get_profile("aapl")["marketCap"] == 3e12
+
+def test_fmp_price_history_is_keyed_by_the_requested_ticker():
+    payload = {"symbol": "MSFT", "historical": [{"date": "2024-01-02", "close": 370.0}]}
+    with mock.patch.object(providers, "_http_get", return_value=response(payload)):
+        closes = FMPProvider().get_price_history(["msft"], start="2024-01-01")
+    assert list(closes.columns) == ["msft"]
+
+def test_the_committed_fixtures_replay_offline():
+    provider = providers.get_provider("fixtures")
+    assert provider.get_profile("AAPL")["companyName"] == "Apple Inc."
+    assert provider.get_statement("KO")["totalRevenue"] > 0
+    assert provider.get_news("Lockheed Martin Corporation")
+    # Recorded closes are moved up to yesterday, so they always cover the 1-year window
+    closes = provider.get_price_history(["MSFT"])["MSFT"].dropna()
+    assert closes.index[-1] == pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+    assert len(closes) > 200
+
+def test_screening_a_fixture_ticker():
+    from app.halal_screening import screen_halal_stocks
+
+    assert "Conventional Banking" in screen_halal_stocks("JPM")["reason"]
+    assert screen_halal_stocks("AAPL")["status"].startswith("Doubtful")
+    assert "military contracts" in screen_halal_stocks("MSFT")["reason"]
@@ -0,0 +1,99 @@
+import itertools
+import pytest
+from app.halal_screening import apply_aaoifi_screening
+from app.rulesets import RULESETS, Ruleset, financials_quantities, get_ruleset, statement_quantities
+
+
+def legacy_aaoifi(financials, market_cap):
+    # apply_aaoifi_screening before the rulesets, after fetch_financial_statements filled missing items with 0
+    f = {key: (value if value is not None else 0) for key, value in financials.items()}
+    debt_ratio = f["totalDebt"] / market_cap if market_cap else 0
+    interest_ratio = f["interestIncome"] / f["totalRevenue"] if f["totalRevenue"] else 0
+    cash_ratio = (f["cashAndCashEquivalents"] + f["shortTermInvestments"]) / market_cap if market_cap else 0
+    return debt_ratio > 0.3 or interest_ratio > 0.05 or cash_ratio > 0.3
+
+def legacy_v2(financials, market_cap):
+    # screen_stock's inline checks before the rulesets: 33% limits, receivables, ratio >= limit fails
+    if market_cap and market_cap > 0:
+        ratios = [(financials.get(key) or 0) / market_cap for key in ("total_debt", "cash_total", "receivables")]
+        limits = [0.33, 0.33, 0.33]
+    else:
+        ratios, limits = [None, None, None], [0.33, 0.33, 0.33]
+    revenue = financials.get("revenue") or 0
+    interest = financials.get("interest_income")
+    ratios.append(interest / revenue if revenue > 0 and interest is not None else None)
+    limits.append(0.05)
+    if any(r is not None and r >= limit for r, limit in zip(ratios, limits)):
+        return "Haram"
+    return "Doubtful" if any(r is None for r in ratios) else "Halal"
+
+
+# Edge values: missing, zero, negative, exactly at 30% / 33% / 5% of 100 and just past them
+AMOUNTS = [None, 0, -10, 5, 30, 30.0001, 33, 34]
+DENOMINATORS = [None, 0, -100, 100]
+
+
+def test_v1_verdicts_are_unchanged():
+    for debt, cash, interest, market_cap, revenue in itertools.product(AMOUNTS, AMOUNTS, [None, 0, 5, 5.0001, 6], DENOMINATORS, DENOMINATORS):
+        financials = {"totalDebt": debt, "cashAndCashEquivalents": cash, "shortTermInvestments": 0,
+                      "interestIncome": interest, "totalRevenue": revenue}
+        filled = {key: (value if value is not None else 0) for key, value in financials.items()}
+        cap = market_cap or 0
+        assert apply_aaoifi_screening(filled, cap)[0] == legacy_aaoifi(financials, cap), (financials, market_cap)
+
+def test_v1_limits_are_not_inclusive():
+    at_limit = {"totalDebt": 30, "cashAndCashEquivalents": 20, "shortTermInvestments": 10,
+                "interestIncome": 5, "totalRevenue": 100}
+    assert apply_aaoifi_screening(at_limit, 100) == (False, [])
+    assert apply_aaoifi_screening(dict(at_limit, totalDebt=31), 100) == (True, ["Debt ratio 31.00% > 30%"])
+
+def test_the_old_v2_checks_as_a_ruleset():
+    # The declarative engine reproduces screen_stock's former checks exactly
+    old = Ruleset("v2", {"rules": RULESETS["djim"]["rules"] + [
+        {"ratio": "interest_income_ratio", "label": "Interest income ratio", "numerator": ["interest_income"],
+         "denominator": "revenue", "below": 0.05, "reported": True},
+    ]})
+    for debt, cash, receivables, interest, market_cap, revenue in itertools.product(
+            AMOUNTS, [None, 10, 33], [None, 0, 33], [None, 0, 5], DENOMINATORS, DENOMINATORS):
+        financials = {"total_debt": debt, "cash_total": cash, "receivables": receivables,
+                      "interest_income": interest, "revenue": revenue}
+        haram, missing, _, _ = old.check(financials_quantities(financials, market_cap))
+        compliance = "Haram" if haram else "Doubtful" if missing else "Halal"
+        assert compliance == legacy_v2(financials, market_cap), (financials, market_cap)
+
+def test_v2_under_the_default_ruleset():
+    # What changed for screen_stock: AAOIFI's 30% (at the limit passes), no receivables check
+    def check(**financials):
+        market_cap = financials.pop("market_cap", 100)
+        base = {"total_debt": 0, "cash_total": 0, "receivables": 0, "interest_income": 0, "revenue": 100}
+        return get_ruleset("aaoifi").check(financials_quantities(dict(base, **financials), market_cap))
+
+    assert check(total_debt=30)[:2] == (False, False)
+    assert check(total_debt=31)[0]
+    assert check(receivables=90)[:2] == (False, False)
+    assert check(interest_income=5)[:2] == (False, False)
+    assert check(interest_income=None)[:3] == (False, True, ["Interest income ratio missing"])
+    assert check(total_debt=None)[:2] == (False, False)
+    assert check(market_cap=0)[1] and check(market_cap=-5)[1]
+    assert check(revenue=-100)[1]
+
+def test_djim_and_sp_limits_are_inclusive():
+    def verdict(key, **values):
+        financials = {"total_debt": 0, "cash_total": 0, "receivables": 0, "interest_income": 0, "revenue": 100, **values}
+        return get_ruleset(key).check(financials_quantities(financials, 100))[0]
+
+    assert verdict("djim", total_debt=33) and not verdict("djim", total_debt=32.9)
+    assert verdict("djim", receivables=33)
+    assert verdict("sp", cash_total=20, receivables=29) and not verdict("sp", cash_total=20, receivables=28.9)
+    assert verdict("sp", interest_income=5)
+
+def test_statement_quantities_treat_junk_as_missing():
+    quantities = statement_quantities([{"totalDebt": "n/a", "cashAndCashEquivalents": None, "shortTermInvestments": 4}, None], [100, None])
+    assert quantities.shape == (2, 7)
+    evaluation = get_ruleset("aaoifi").evaluate(quantities)
+    assert list(evaluation.compliance()) == ["Doubtful", "Doubtful"]
+    assert evaluation.ratios[0, 1] == pytest.approx(0.04)
+
+def test_every_ruleset_compiles():
+    for key in RULESETS:
+        assert get_ruleset(key).key == key
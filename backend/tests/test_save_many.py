@@ -0,0 +1,31 @@
+import uuid
+from app import db
+
+
+def row(ticker):
+    return db.stock_row(ticker, f"{ticker} Inc", "Halal", "", "Technology", "Software", 1e9,
+                        {"totalDebt": 1e8, "totalRevenue": 5e8}, False, None)
+
+
+def stored(tickers):
+    session = db.Session()
+    try:
+        return {s.ticker for s in session.query(db.HalalStock).filter(db.HalalStock.ticker.in_(tickers))}
+    finally:
+        session.close()
+
+
+def test_inserts_stay_within_the_bound_parameter_limit():
+    keys = tuple(sorted(row("X")))
+    assert db._rows_per_insert(keys) * len(keys) <= db.MAX_BIND_PARAMS
+    db.init_db()
+    tickers = [uuid.uuid4().hex[:10] for _ in range(600)]
+    db.save_many([row(t) for t in tickers])
+    assert stored(tickers) == set(tickers)
+
+def test_a_bad_row_only_loses_itself():
+    db.init_db()
+    tickers = [uuid.uuid4().hex[:10] for _ in range(5)]
+    bad = {**row("BAD" + uuid.uuid4().hex[:6]), "no_such_column": 1}
+    db.save_many([row(t) for t in tickers[:2]] + [bad] + [row(t) for t in tickers[2:]])
+    assert stored(tickers + [bad["ticker"]]) == set(tickers)
@@ -0,0 +1,129 @@
+import threading
+import pytest
+from app import shared_cache
+from app.shared_cache import HEADER, PROBE, SharedCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+    def tick(self, seconds=1.0):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(shared_cache.time, "time", clock)
+    return clock
+
+def one_bucket(ttl=60):
+    # size 0 still gets PROBE slots, and every key probes all of them
+    return SharedCache(0, ttl)
+
+
+def test_get_put_and_expiry(clock):
+    cache = one_bucket(ttl=10)
+    assert cache.put("AAPL", b"apple")
+    assert cache.get("AAPL") == b"apple"
+    assert cache.get("MSFT") is None
+    clock.tick(11)
+    assert cache.get("AAPL") is None
+
+def test_a_read_during_a_write_is_a_miss_not_a_torn_value(clock):
+    cache = one_bucket()
+    cache.put("AAPL", b"apple")
+    offset = next(o for o in cache._positions(0) if cache.buffer[o + HEADER.size:o + HEADER.size + 4] == b"AAPL")
+    seq = HEADER.unpack_from(cache.buffer, offset)[0]
+    # A writer in another process is half way through this slot
+    cache.buffer[offset:offset + 4] = (seq + 1).to_bytes(4, "little")
+    assert cache.get("AAPL") is None
+    cache.buffer[offset:offset + 4] = (seq + 2).to_bytes(4, "little")
+    assert cache.get("AAPL") == b"apple"
+
+def test_concurrent_readers_only_see_whole_values():
+    cache = SharedCache(1, ttl=60)
+    values = [b"a" * 3000, b"b" * 10]
+    cache.put("AAPL", values[0])
+    stop, seen = threading.Event(), set()
+
+    def write():
+        i = 0
+        while not stop.is_set():
+            i += 1
+            cache.put("AAPL", values[i % 2])
+
+    def read():
+        for _ in range(20_000):
+            seen.add(cache.get("AAPL"))
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    stop.set()
+    writer.join()
+    assert seen <= set(values) | {None}
+
+def test_a_deleted_key_is_not_put_back_by_an_earlier_load(clock):
+    cache = one_bucket()
+    loaded_at = clock()
+    clock.tick()
+    cache.put("AAPL", b"old")
+    cache.delete(["AAPL"])
+    assert cache.get("AAPL") is None
+    assert not cache.put("AAPL", b"old", loaded_at=loaded_at)
+    clock.tick()
+    assert cache.put("AAPL", b"new", loaded_at=clock())
+    assert cache.get("AAPL") == b"new"
+
+def test_a_full_bucket_evicts_the_live_entry_closest_to_expiry(clock):
+    cache = one_bucket()
+    for i in range(PROBE):
+        cache.put(f"K{i}", f"v{i}".encode())
+        clock.tick()
+    cache.put("NEW", b"new")
+    assert cache.get("K0") is None
+    assert cache.get("NEW") == b"new"
+    assert all(cache.get(f"K{i}") == f"v{i}".encode() for i in range(1, PROBE))
+
+def test_put_invalidate_then_overflow_keeps_the_tombstone(clock):
+    cache = one_bucket()
+    loaded_at = clock()
+    cache.put("AAPL", b"old", loaded_at=loaded_at)
+    clock.tick()
+    cache.delete(["AAPL"])
+    # The tombstone is now the slot closest to expiry
+    for i in range(PROBE - 1):
+        clock.tick()
+        cache.put(f"K{i}", b"v")
+    clock.tick()
+    assert cache.put("OVERFLOW", b"v")
+    # A worker that read AAPL before the delete tries to cache it
+    assert not cache.put("AAPL", b"old", loaded_at=loaded_at)
+    assert cache.get("AAPL") is None
+
+def test_a_bucket_of_tombstones_caches_nothing_new(clock):
+    cache = one_bucket()
+    loaded_at = clock()
+    clock.tick()
+    cache.delete([f"K{i}" for i in range(PROBE)])
+    assert not cache.put("NEW", b"v")
+    for i in range(PROBE):
+        assert not cache.put(f"K{i}", b"old", loaded_at=loaded_at)
+
+def test_deleting_an_uncached_key_in_a_full_bucket_still_leaves_a_tombstone(clock):
+    cache = one_bucket()
+    loaded_at = clock()
+    for i in range(PROBE):
+        cache.put(f"K{i}", b"v")
+    clock.tick()
+    cache.delete(["AAPL"])
+    assert not cache.put("AAPL", b"old", loaded_at=loaded_at)
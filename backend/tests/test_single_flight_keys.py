@@ -0,0 +1,28 @@
+import threading
+import time
+import pytest
+from app import halal_screening, halal_screeningv2
+
+
+@pytest.mark.parametrize("module, screen, inner", [
+    (halal_screening, "screen_halal_stocks", "_screen_halal_stocks"),
+    (halal_screeningv2, "screen_stock", "_screen_stock"),
+])
+def test_differently_typed_tickers_share_one_screen(monkeypatch, module, screen, inner):
+    calls = []
+
+    def slow(ticker):
+        calls.append(ticker)
+        time.sleep(0.2)
+        return {"ticker": ticker}
+
+    monkeypatch.setattr(module, inner, slow)
+    results = []
+    threads = [threading.Thread(target=lambda t=t: results.append(getattr(module, screen)(t)))
+               for t in ("aapl", "AAPL", " Aapl ")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ["AAPL"]
+    assert results == [{"ticker": "AAPL"}] * 3
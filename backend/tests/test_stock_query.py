@@ -0,0 +1,56 @@
+import random
+import uuid
+import pytest
+from fastapi.testclient import TestClient
+from app import db
+
+
+def seed():
+    # ~40 rows under a prefix of their own, with tied and missing market caps
+    db.init_db()
+    prefix = "Q" + uuid.uuid4().hex[:6].upper()
+    rng = random.Random(1)
+    rows = []
+    for i in range(41):
+        market_cap = None if i % 5 == 0 else float(rng.choice([1e9, 2e9, 3e9, rng.uniform(1e9, 9e9)]))
+        status = "Halal ✅" if i % 3 else "Haram ❌"
+        rows.append(db.stock_row(f"{prefix}{i:02d}", f"Company {i}", status, "", "Technology", "Software",
+                                 market_cap, {}, False, None))
+    db.save_many(rows)
+    return prefix
+
+def client():
+    from app.main import app
+    return TestClient(app)
+
+def pages(params, limit):
+    # Follows next_cursor to the end, returns the tickers in the order they came
+    tickers, cursor = [], None
+    while True:
+        response = client().get("/stocks/query", params={**params, "limit": limit, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        body = response.json()
+        tickers += [stock["ticker"] for stock in body["results"]]
+        # A cursor that doesn't move on would page forever
+        assert len(tickers) <= 41
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return tickers
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+@pytest.mark.parametrize("status", [None, "halal"])
+def test_pages_add_up_to_the_full_ordered_query(order, status):
+    prefix = seed()
+    params = {"ticker": prefix, "sort": "market_cap", "order": order, **({"status": status} if status else {})}
+    full = client().get("/stocks/query", params={**params, "limit": 500}).json()["results"]
+
+    # Rows with a market cap by (market cap, ticker) in the requested direction, then the rest by ticker
+    with_value = sorted((s for s in full if s["marketCap"] is not None), key=lambda s: (s["marketCap"], s["ticker"]),
+                        reverse=order == "desc")
+    without = sorted((s for s in full if s["marketCap"] is None), key=lambda s: s["ticker"], reverse=order == "desc")
+    assert [s["ticker"] for s in full] == [s["ticker"] for s in with_value + without]
+    assert len(full) == (41 if status is None else 27)
+
+    for limit in (1, 4, 7, 41):
+        assert pages(params, limit) == [s["ticker"] for s in full]
@@ -0,0 +1,12 @@
+import pytest
+from app.universes import UNIVERSES, resolve_tickers
+
+
+@pytest.mark.parametrize("tickers", ["aapl, AAPL msft", ["aapl", "AAPL ", " msft", "  "]])
+def test_tickers_are_normalized_before_deduplication(tickers):
+    assert resolve_tickers(tickers) == ["AAPL", "MSFT"]
+
+def test_no_tickers_means_the_universe():
+    assert resolve_tickers(None) == UNIVERSES["default"]
+    with pytest.raises(KeyError):
+        resolve_tickers(None, "nope")
@@ -0,0 +1,76 @@
+from unittest import mock
+import pytest
+import requests
+from app.upstream import CircuitOpenError, Upstream
+
+
+def upstream(**options):
+    options = {"rate": 1000, "burst": 1000, "retries": 0, "failure_threshold": 1, "reset_after": 0.0, **options}
+    return Upstream("test", **options)
+
+def session(*outcomes):
+    fake = mock.Mock()
+    fake.get.side_effect = outcomes
+    return mock.patch("app.upstream._session", return_value=fake)
+
+
+def test_other_request_errors_reopen_a_half_open_breaker():
+    api = upstream()
+    ok = mock.Mock(status_code=200, headers={})
+    with session(requests.ConnectionError(), requests.exceptions.ChunkedEncodingError(), ok):
+        with pytest.raises(requests.ConnectionError):
+            api.get("http://example")
+        assert api.breaker.state == "open"
+        # The trial call fails with something other than a connection error or timeout
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            api.get("http://example")
+        assert api.breaker.state == "open"
+        assert api.get("http://example") is ok
+        assert api.breaker.state == "closed"
+
+def test_unexpected_error_in_trial_releases_half_open():
+    api = upstream()
+    ok = mock.Mock(status_code=200, headers={})
+    with session(requests.ConnectionError(), KeyboardInterrupt(), ok):
+        with pytest.raises(requests.ConnectionError):
+            api.get("http://example")
+        with pytest.raises(KeyboardInterrupt):
+            api.get("http://example")
+        assert api.breaker.state != "half-open"
+        assert api.get("http://example") is ok
+
+def test_open_breaker_fails_fast():
+    api = upstream(reset_after=60.0)
+    with session(requests.ConnectionError()):
+        with pytest.raises(requests.ConnectionError):
+            api.get("http://example")
+    with pytest.raises(CircuitOpenError):
+        api.get("http://example")
+
+def test_call_retries_only_transport_errors():
+    api = upstream(retries=2, failure_threshold=5, backoff=0.0)
+    calls = []
+
+    def delisted():
+        calls.append(1)
+        raise KeyError("regularMarketPrice")
+
+    for _ in range(10):
+        with pytest.raises(KeyError):
+            api.call(delisted)
+    assert len(calls) == 10
+    assert api.breaker.state == "closed" and api.breaker.failures == 0
+
+    flaky = mock.Mock(side_effect=[OSError("reset"), "data"])
+    assert api.call(flaky) == "data"
+    assert flaky.call_count == 2
+
+def test_data_error_in_trial_call_releases_half_open():
+    api = upstream()
+    with pytest.raises(OSError):
+        api.call(mock.Mock(side_effect=OSError()))
+    assert api.breaker.state == "open"
+    with pytest.raises(KeyError):
+        api.call(mock.Mock(side_effect=KeyError("x")))
+    assert api.call(lambda: "data") == "data"
+    assert api.breaker.state == "closed"
@@ -0,0 +1,71 @@
+import math
+import random
+import numpy as np
+import pandas as pd
+from app.halal_screeningv2 import calculate_ratios, grade_stock
+from app.rulesets import financials_quantities, get_ruleset
+from app.vectorized_screening import RATIO_COLUMNS, calculate_ratios_vectorized, grade_vectorized, screen_universe
+
+FIELDS = ["total_debt", "cash_total", "receivables", "revenue", "interest_income"]
+
+
+def random_value(scale):
+    # None / NaN (yfinance) / zero / negative / ordinary values, and ratios right at the band edges
+    roll = random.random()
+    if roll < 0.08:
+        return None
+    if roll < 0.12:
+        return float("nan")
+    if roll < 0.18:
+        return 0.0
+    if roll < 0.22:
+        return -random.uniform(0, scale)
+    if roll < 0.35:
+        return scale * random.choice([0.01, 0.03, 0.05, 0.10, 0.20, 0.30, 0.33])
+    return random.uniform(0, scale * 0.6)
+
+def universe(size=5000, seed=5):
+    random.seed(seed)
+    rows = []
+    for _ in range(size):
+        cap = random_value(1e9)
+        row = {field: random_value(1e9) for field in FIELDS}
+        row["avg_market_cap"] = cap
+        rows.append(row)
+    return rows
+
+def same(a, b):
+    if a is None:
+        return b is None or (isinstance(b, float) and math.isnan(b))
+    return b is not None and math.isclose(a, b, rel_tol=1e-12, abs_tol=0.0)
+
+
+def test_ratios_and_grades_match_the_scalar_versions():
+    rows = universe()
+    frame = pd.DataFrame(rows)
+    ratios = calculate_ratios_vectorized(frame)
+    _, grades = grade_vectorized(ratios)
+
+    for i, row in enumerate(rows):
+        expected = calculate_ratios(row, row["avg_market_cap"])
+        for column in RATIO_COLUMNS:
+            assert same(expected[column], ratios[column].iloc[i]), (i, column, row)
+        assert grades[i] == grade_stock(expected), (i, row)
+
+def test_screen_universe_matches_screening_one_stock_at_a_time():
+    rows = universe(seed=9)
+    screened = screen_universe(pd.DataFrame(rows))
+    ruleset = get_ruleset()
+
+    for i, row in enumerate(rows):
+        haram, missing, reasons, _ = ruleset.check(financials_quantities(row, row["avg_market_cap"]))
+        compliance = "Haram" if haram else "Doubtful" if missing else "Halal"
+        assert screened["compliance"].iloc[i] == compliance, (i, row)
+        assert screened["reasons"].iloc[i] == "; ".join(reasons)
+        assert screened["grade"].iloc[i] == grade_stock(calculate_ratios(row, row["avg_market_cap"]))
+
+def test_accepts_a_dict_of_arrays():
+    data = {"total_debt": np.array([1.0, np.nan]), "avg_market_cap": np.array([10.0, 10.0])}
+    screened = screen_universe(data)
+    assert list(screened["debt_ratio"]) == [0.1, 0.0]
+    assert list(screened["compliance"]) == ["Doubtful", "Doubtful"]
@@ -1,5 +1,4 @@
 import React, { useState, useEffect } from "react";
-import axios from "axios";
 
 const SCREENERS = [
   { id: "stocks", label: "Stocks Screener" },
@@ -21,12 +20,32 @@ function App() {
     }
   }, [activeScreener]);
 
+  // Rows are added as the backend streams them (one JSON result per line), so the table
+  // fills in progressively instead of waiting for the slowest ticker
   const fetchAllStocks = async () => {
     setLoading(true);
     setError(null);
+    setStockData([]);
     try {
-      const response = await axios.get(`/stocks-screener`);
-      setStockData(response.data.halal);
+      const response = await fetch(`/stocks-screener/stream?universe=default`);
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split("\n");
+        buffered = lines.pop();
+        const results = lines.filter(line => line.trim()).map(line => JSON.parse(line));
+        if (results.length > 0) {
+          setStockData(prev => [...prev, ...results]);
+          setLoading(false);
+        }
+      }
     } catch (err) {
       setError("Failed to load stocks.");
     } finally {
@@ -34,16 +53,27 @@ function App() {
     }
   };
 
-  const handleSearch = () => {
-    // Optionally: filter locally or hit backend with search param
+  // Search runs on the server (indexed ticker prefix query) and only returns one page of rows
+  const handleSearch = async () => {
     if (!search) {
       fetchAllStocks();
       return;
     }
-    const filtered = stockData.filter(stock =>
-      stock.ticker.toLowerCase().includes(search.toLowerCase())
-    );
-    setStockData(filtered);
+    setLoading(true);
+    setError(null);
+    try {
+      const params = new URLSearchParams({ ticker: search, limit: "100" });
+      const response = await fetch(`/stocks/query?${params}`);
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      const data = await response.json();
+      setStockData(data.results);
+    } catch (err) {
+      setError("Failed to search stocks.");
+    } finally {
+      setLoading(false);
+    }
   };
 
   return (
@@ -87,7 +117,7 @@ function App() {
           <>
             {loading && <p>Loading stocks...</p>}
             {error && <p className="text-red-600">{error}</p>}
-            {!loading && !error && stockData.length > 0 && (
+            {!error && stockData.length > 0 && (
               <div className="overflow-x-auto">
                 <table className="w-full text-left border-collapse">
                   <thead className="bg-primary text-white">